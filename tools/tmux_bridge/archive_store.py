@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+MACS archive store - packed, compressed request/response archive
+
+Stores archived requests and responses as records appended to numbered pack
+files (pack-000001.dat, ...) instead of one small text file per record. Each
+record is written with a single append and compressed on its own (zlib or
+lzma, falling back to raw when that is not smaller), so the archive takes a
+fraction of the space and a handful of inodes.
+
+Record layout (little-endian):
+
+    "MACR" | version u8 | kind u8 | codec u8 | flags u8 | time f64
+           | id_len u16 | hash_len u16 | size u32 | raw_size u32 | crc32 u32
+           | id | hash | payload
+
+The index (request id and hash -> pack and offset) is rebuilt by scanning
+record headers, skipping the payloads, and kept up to date incrementally.
+Record metadata is read back from the pack when it is needed, and listing
+streams the packs, so memory does not grow with the archive beyond that. A
+torn record at the end of the newest pack (a crash mid-write) is ignored by
+readers and truncated by the next writer.
+
+As a CLI it lists, greps and exports records:
+
+    archive_store.py list [--kind request|response]
+    archive_store.py grep PATTERN [-i] [--kind ...]
+    archive_store.py export OUT_DIR [ID ...]
+    archive_store.py import-files ARCHIVE_DIR
+    archive_store.py stats
+"""
+import argparse
+import fcntl
+import lzma
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+PACK_PREFIX = "pack-"
+PACK_SUFFIX = ".dat"
+LOCK_NAME = ".lock"
+MAGIC = b"MACR"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBBdHHIII")
+
+KIND_REQUEST = 1
+KIND_RESPONSE = 2
+KINDS = {"request": KIND_REQUEST, "response": KIND_RESPONSE}
+KIND_NAMES = {value: name for name, value in KINDS.items()}
+
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+CODECS = {"none": CODEC_RAW, "zlib": CODEC_ZLIB, "lzma": CODEC_LZMA}
+
+
+def pack_name(seq):
+    return f"{PACK_PREFIX}{seq:06d}{PACK_SUFFIX}"
+
+
+def pack_seq(name):
+    if not (name.startswith(PACK_PREFIX) and name.endswith(PACK_SUFFIX)):
+        return None
+    try:
+        return int(name[len(PACK_PREFIX):-len(PACK_SUFFIX)])
+    except ValueError:
+        return None
+
+
+def compress(data, codec):
+    if codec == CODEC_ZLIB:
+        packed = zlib.compress(data, 6)
+    elif codec == CODEC_LZMA:
+        packed = lzma.compress(data, preset=6)
+    else:
+        return CODEC_RAW, data
+    if len(packed) >= len(data):
+        return CODEC_RAW, data
+    return codec, packed
+
+
+def decompress(payload, codec):
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload)
+    if codec == CODEC_LZMA:
+        return lzma.decompress(payload)
+    return payload
+
+
+class Record:
+    """Location and metadata of one archived record."""
+
+    __slots__ = ("kind", "req_id", "block_hash", "timestamp", "pack", "offset", "size", "raw_size", "codec", "crc")
+
+    def __init__(self, kind, req_id, block_hash, timestamp, pack, offset, size, raw_size, codec, crc):
+        self.kind = kind
+        self.req_id = req_id
+        self.block_hash = block_hash
+        self.timestamp = timestamp
+        self.pack = pack
+        self.offset = offset
+        self.size = size
+        self.raw_size = raw_size
+        self.codec = codec
+        self.crc = crc
+
+    @property
+    def kind_name(self):
+        return KIND_NAMES.get(self.kind, str(self.kind))
+
+
+def encode_record(kind, req_id, text, block_hash="", codec=CODEC_ZLIB, timestamp=None):
+    raw = text.encode("utf-8")
+    codec, payload = compress(raw, codec)
+    id_bytes = req_id.encode("utf-8")
+    hash_bytes = (block_hash or "").encode("utf-8")
+    header = HEADER.pack(
+        MAGIC,
+        VERSION,
+        kind,
+        codec,
+        0,
+        time.time() if timestamp is None else timestamp,
+        len(id_bytes),
+        len(hash_bytes),
+        len(payload),
+        len(raw),
+        zlib.crc32(raw),
+    )
+    return header + id_bytes + hash_bytes + payload
+
+
+def scan_pack(path, name, start=0):
+    """Yield (record, end_offset) for each complete record from start; stop at the first bad one."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        offset = start
+        while True:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            magic, version, kind, codec, _, stamp, id_len, hash_len, size, raw_size, crc = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                return
+            names = f.read(id_len + hash_len)
+            if len(names) < id_len + hash_len:
+                return
+            payload_at = offset + HEADER.size + id_len + hash_len
+            end = payload_at + size
+            f.seek(0, os.SEEK_END)
+            if f.tell() < end:
+                return
+            f.seek(end)
+            record = Record(
+                kind,
+                names[:id_len].decode("utf-8", "replace"),
+                names[id_len:].decode("utf-8", "replace"),
+                stamp,
+                name,
+                payload_at,
+                size,
+                raw_size,
+                codec,
+                crc,
+            )
+            yield record, end
+            offset = end
+
+
+class PackedArchive:
+    """Append-only archive of request/response texts in compressed pack files.
+
+    Safe to share between bridge processes: appends and pack rotation happen
+    under an exclusive flock, and refresh() picks up records other processes
+    wrote since the last scan. Only (pack, offset) locations are kept in
+    memory; Records are read from the packs on demand.
+    """
+
+    def __init__(self, directory, codec="zlib", pack_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.codec = CODECS[codec]
+        self.pack_bytes = pack_bytes
+        self._lock = threading.Lock()
+        self._by_id = {}
+        self._by_hash = {}
+        self._scanned = {}
+        os.makedirs(directory, exist_ok=True)
+        self.refresh()
+
+    def packs(self):
+        names = []
+        for name in os.listdir(self.directory):
+            seq = pack_seq(name)
+            if seq is not None:
+                names.append((seq, name))
+        return [name for _, name in sorted(names)]
+
+    def refresh(self):
+        """Index records appended since the last scan."""
+        with self._lock:
+            for name in self.packs():
+                start = self._scanned.get(name, 0)
+                path = os.path.join(self.directory, name)
+                try:
+                    if os.path.getsize(path) <= start:
+                        continue
+                    for record, end in scan_pack(path, name, start):
+                        self._add(record, (name, start))
+                        self._scanned[name] = start = end
+                except OSError:
+                    continue
+
+    def _add(self, record, location):
+        self._by_id.setdefault(record.req_id, {})[record.kind] = location
+        if record.block_hash:
+            self._by_hash.setdefault(record.block_hash, []).append(location)
+
+    def _load(self, location):
+        """Record stored at a (pack, offset) location, or None if it is gone."""
+        name, start = location
+        try:
+            for record, _ in scan_pack(os.path.join(self.directory, name), name, start):
+                return record
+        except OSError:
+            pass
+        return None
+
+    def _locate(self, req_id, kind):
+        with self._lock:
+            return self._by_id.get(req_id, {}).get(KINDS[kind])
+
+    def append(self, kind, req_id, text, block_hash=""):
+        """Append one record with a single write; return its Record."""
+        self.append_encoded(encode_record(KINDS[kind], req_id, text, block_hash, self.codec))
+        location = self._locate(req_id, kind)
+        return None if location is None else self._load(location)
+
+    def append_encoded(self, data):
+        """Write an encoded record to the newest pack under the archive lock."""
+        lock_fd = os.open(os.path.join(self.directory, LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            name = self._writable_pack(len(data))
+            fd = os.open(os.path.join(self.directory, name), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+        finally:
+            os.close(lock_fd)
+        self.refresh()
+
+    def _writable_pack(self, size):
+        """Pack to append size bytes to (called under the lock); trims a torn tail."""
+        self.refresh()
+        packs = self.packs()
+        if not packs:
+            return pack_name(1)
+        name = packs[-1]
+        path = os.path.join(self.directory, name)
+        good = self._scanned.get(name, 0)
+        actual = os.path.getsize(path)
+        if actual > good:
+            # A crash left half a record behind; nothing can read past it.
+            os.truncate(path, good)
+            actual = good
+        if actual and actual + size > self.pack_bytes:
+            return pack_name(pack_seq(name) + 1)
+        return name
+
+    def records(self, kind=None):
+        """Yield every Record (optionally of one kind) in write order, streamed from the packs."""
+        self.refresh()
+        with self._lock:
+            scanned = list(self._scanned.items())
+        for name, end in sorted(scanned, key=lambda item: pack_seq(item[0])):
+            try:
+                for record, record_end in scan_pack(os.path.join(self.directory, name), name):
+                    if record_end > end:
+                        break
+                    if kind is None or record.kind == KINDS[kind]:
+                        yield record
+            except OSError:
+                continue
+
+    def read(self, record):
+        with open(os.path.join(self.directory, record.pack), "rb") as f:
+            f.seek(record.offset)
+            payload = f.read(record.size)
+        raw = decompress(payload, record.codec)
+        if zlib.crc32(raw) != record.crc:
+            raise ValueError(f"archive record {record.req_id} in {record.pack} is corrupt")
+        return raw.decode("utf-8", "replace")
+
+    def get(self, req_id, kind="request"):
+        """Text of the latest record for req_id, or None."""
+        location = self._locate(req_id, kind)
+        if location is None:
+            self.refresh()
+            location = self._locate(req_id, kind)
+        record = None if location is None else self._load(location)
+        return None if record is None else self.read(record)
+
+    def find_hash(self, block_hash):
+        self.refresh()
+        with self._lock:
+            locations = list(self._by_hash.get(block_hash, ()))
+        records = (self._load(location) for location in locations)
+        return [record for record in records if record is not None]
+
+    def iter_request_hashes(self):
+        """Yield (hash, timestamp) for every archived request."""
+        for record in self.records("request"):
+            if record.block_hash:
+                yield record.block_hash, record.timestamp
+
+    def close(self):
+        pass
+
+
+def format_time(stamp):
+    return datetime.fromtimestamp(stamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def import_files(archive, source):
+    """Append the *.request.txt / *.response.txt files in source; return how many."""
+    count = 0
+    for name in sorted(os.listdir(source)):
+        for kind in KINDS:
+            suffix = f".{kind}.txt"
+            if not name.endswith(suffix):
+                continue
+            req_id = name[: -len(suffix)]
+            if archive.get(req_id, kind) is not None:
+                continue
+            path = os.path.join(source, name)
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read()
+            block_hash = req_id.rsplit("_", 1)[-1] if kind == "request" and "_" in req_id else ""
+            archive.append_encoded(
+                encode_record(KINDS[kind], req_id, text, block_hash, archive.codec, os.path.getmtime(path))
+            )
+            count += 1
+    return count
+
+
+def main():
+    default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive", "packed")
+    parser = argparse.ArgumentParser(description="MACS archive store - packed request/response archive")
+    parser.add_argument("--dir", default=default_dir, help="packed archive directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+    list_cmd = sub.add_parser("list", help="list archived records")
+    list_cmd.add_argument("--kind", choices=sorted(KINDS))
+    grep_cmd = sub.add_parser("grep", help="print records whose text matches a regex")
+    grep_cmd.add_argument("pattern")
+    grep_cmd.add_argument("-i", "--ignore-case", action="store_true")
+    grep_cmd.add_argument("--kind", choices=sorted(KINDS))
+    grep_cmd.add_argument("-l", "--ids-only", action="store_true", help="print matching ids only")
+    export_cmd = sub.add_parser("export", help="write records back out as <id>.<kind>.txt files")
+    export_cmd.add_argument("out_dir")
+    export_cmd.add_argument("ids", nargs="*", help="request ids to export (default: all)")
+    import_cmd = sub.add_parser("import-files", help="pack an existing directory of .txt archive files")
+    import_cmd.add_argument("source")
+    sub.add_parser("stats", help="record counts and sizes")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.dir) and args.command != "import-files":
+        print(f"no packed archive at {args.dir}")
+        return 1
+    archive = PackedArchive(args.dir)
+
+    if args.command == "list":
+        for record in archive.records(args.kind):
+            print(f"{format_time(record.timestamp)}  {record.kind_name:<8}  {record.req_id}  {record.raw_size}B")
+    elif args.command == "grep":
+        regex = re.compile(args.pattern, re.IGNORECASE if args.ignore_case else 0)
+        for record in archive.records(args.kind):
+            text = archive.read(record)
+            matches = [line for line in text.splitlines() if regex.search(line)]
+            if not matches:
+                continue
+            if args.ids_only:
+                print(f"{record.req_id}.{record.kind_name}")
+                continue
+            for line in matches:
+                print(f"{record.req_id}.{record.kind_name}: {line}")
+    elif args.command == "export":
+        os.makedirs(args.out_dir, exist_ok=True)
+        wanted = set(args.ids)
+        count = 0
+        for record in archive.records():
+            if wanted and record.req_id not in wanted:
+                continue
+            path = os.path.join(args.out_dir, f"{record.req_id}.{record.kind_name}.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(archive.read(record))
+            os.utime(path, (record.timestamp, record.timestamp))
+            count += 1
+        print(f"exported {count} records to {args.out_dir}")
+    elif args.command == "import-files":
+        print(f"imported {import_files(archive, args.source)} records into {args.dir}")
+    elif args.command == "stats":
+        stored = sum(os.path.getsize(os.path.join(args.dir, name)) for name in archive.packs())
+        raw = 0
+        counts = {kind: 0 for kind in KINDS.values()}
+        for record in archive.records():
+            raw += record.raw_size
+            counts[record.kind] = counts.get(record.kind, 0) + 1
+        total = sum(counts.values())
+        print(f"records:  {total} ({counts[KIND_REQUEST]} requests, {counts[KIND_RESPONSE]} responses)")
+        print(f"packs:    {len(archive.packs())}")
+        ratio = f" ({stored / raw:.0%} of raw)" if raw else ""
+        print(f"size:     {stored} bytes on disk, {raw} bytes of text{ratio}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the bridge's per-line request/trigger matcher.
+
+Runs the original matcher (START_RE, END_RE, then ASK_RE/DONE_RE/QUESTION_RE)
+and classify_line() over the same lines and reports lines/sec for each. Pass
+recorded pane logs (e.g. /tmp/macs-worker.log); without any, a synthetic log
+of typical worker output is used. Exits non-zero if the two matchers disagree,
+or if classify_line() takes more than LONG_LINE_LIMIT on any of LONG_LINES
+(long lines with a "?" that is not at the end made the old question regex
+quadratic).
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bridge  # noqa: E402
+
+# The question regex before it was anchored.
+LEGACY_QUESTION_RE = re.compile(r"[A-Za-z].*\?$")
+
+LONG_LINES = [
+    "x" * 8000 + "?" + "y" * 8000,
+    "a?" * 8000,
+    "word " * 3200 + "?",
+    "?" * 16000 + "a",
+]
+LONG_LINE_LIMIT = 0.02
+
+SAMPLE_LINES = [
+    "   Compiling serde v1.0.197",
+    "src/bridge/parser.rs:142:9: warning: unused variable `line`",
+    "test tests::parse_empty ... ok",
+    "\x1b[32m✔\x1b[0m 38 passing (412ms)",
+    "⠙ Working (12s • esc to interrupt)",
+    "diff --git a/tools/tmux_bridge/bridge.py b/tools/tmux_bridge/bridge.py",
+    "+    if REQUEST_MARKER in line:",
+    "Traceback (most recent call last):",
+    '  File "bridge.py", line 812, in feed_line',
+    "npm WARN deprecated glob@7.2.3: Glob versions prior to v9 are no longer supported",
+    "│ Applied 3 edits to src/main.py │",
+    "All tests passed; the refactor is done.",
+    "Should I also update the docs?",
+    "Ready to proceed with the migration?",
+    "exit code: 0",
+]
+
+
+def legacy_classify(line, triggers=True):
+    """The matcher as it was before classify_line(), kept for comparison."""
+    flags = 0
+    if bridge.START_RE.search(line):
+        flags |= bridge.LINE_START
+    if bridge.END_RE.search(line):
+        flags |= bridge.LINE_END
+    if triggers:
+        if (
+            bridge.ASK_RE.search(line)
+            or bridge.DONE_RE.search(line)
+            or ("?" in line and LEGACY_QUESTION_RE.search(line))
+        ):
+            flags |= bridge.LINE_TRIGGER
+    return flags
+
+
+def synthetic_lines(count, seed=1):
+    rng = random.Random(seed)
+    lines = []
+    for index in range(count):
+        if index % 500 == 0:
+            lines.append(f"<<CONTROLLER_REQUEST id=bench-{index}>>")
+            lines.append("Need a decision on the schema migration.")
+            lines.append("<<CONTROLLER_REQUEST_END>>")
+            continue
+        lines.append(rng.choice(SAMPLE_LINES))
+    return lines
+
+
+def load_lines(paths, max_line_bytes):
+    lines = []
+    for path in paths:
+        with open(path, "rb") as f:
+            lines.extend(bridge.read_lines(f, max_line_bytes))
+    return lines
+
+
+def measure(matcher, lines, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for line in lines:
+            matcher(line)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(lines) / best if best else float("inf")
+
+
+def slowest_long_line():
+    """Worst classify_line() time over LONG_LINES, checking each against the legacy matcher."""
+    worst = 0.0
+    mismatches = 0
+    for line in LONG_LINES:
+        start = time.perf_counter()
+        flags = bridge.classify_line(line)
+        worst = max(worst, time.perf_counter() - start)
+        if flags != legacy_classify(line):
+            mismatches += 1
+    return worst, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bridge's per-line matcher")
+    parser.add_argument("logs", nargs="*", help="recorded pane logs to replay")
+    parser.add_argument("--lines", type=int, default=200000, help="synthetic lines when no logs are given")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per matcher; the best is reported")
+    parser.add_argument("--max-line-bytes", type=int, default=65536)
+    args = parser.parse_args()
+
+    lines = load_lines(args.logs, args.max_line_bytes) if args.logs else synthetic_lines(args.lines)
+    if not lines:
+        print("no lines to benchmark")
+        return 1
+
+    mismatches = sum(1 for line in lines if legacy_classify(line) != bridge.classify_line(line))
+    legacy_rate = measure(legacy_classify, lines, args.repeat)
+    combined_rate = measure(bridge.classify_line, lines, args.repeat)
+    worst, long_mismatches = slowest_long_line()
+    mismatches += long_mismatches
+    source = ", ".join(args.logs) if args.logs else "synthetic"
+    print(f"lines:     {len(lines)} ({source})")
+    print(f"legacy:    {legacy_rate:,.0f} lines/sec")
+    print(f"combined:  {combined_rate:,.0f} lines/sec ({combined_rate / legacy_rate:.1f}x)")
+    print(f"long line: {worst * 1000:.2f} ms worst over {len(LONG_LINES)} lines of ~16 KB")
+    status = 0
+    if mismatches:
+        print(f"MISMATCH: {mismatches} lines classified differently")
+        status = 1
+    if worst > LONG_LINE_LIMIT:
+        print(f"SLOW: a long line took over {LONG_LINE_LIMIT * 1000:.0f} ms to classify")
+        status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Replay benchmark for the bridge's request path; needs no tmux.
+
+Generates a synthetic worker log (or takes a recorded one), then appends it
+line by line to a scratch log at --rate lines/sec (0 = as fast as possible)
+while the real parse_stream() tails it. Detected blocks go through
+dispatch_block() and the RequestPipeline as in the bridge. The controller is a
+stub that sleeps --controller-latency seconds (+/- --latency-jitter), and
+delivery only records the time. Inbox/archive files go to a temporary
+directory.
+
+Reports parse throughput (an offline pass over the whole log), end-marker to
+send latency percentiles, requests/sec and peak RSS. Exits non-zero if any
+explicit request block was not answered: under backpressure only heuristic
+blocks may be dropped.
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import re
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bridge  # noqa: E402
+import log_sink  # noqa: E402
+from bench_matcher import SAMPLE_LINES  # noqa: E402
+
+ANSI_NOISE = [
+    "\x1b[32m{}\x1b[0m",
+    "\x1b[1m\x1b[33m{}\x1b[39m\x1b[22m",
+    "\r\x1b[2K{}",
+    "\x1b]0;codex\x07{}",
+]
+BLOCK_ID_RE = re.compile(r"id=bench-(\d+)")
+STUB_RESPONSE = (
+    "<<CONTROLLER_RESPONSE>>\n"
+    "WORKER INSTRUCTIONS:\n"
+    "Continue with the next step.\n"
+    "NOTES:\n"
+    "answered id=bench-{}\n"
+    "<<CONTROLLER_RESPONSE_END>>"
+)
+
+
+def generate_log(path, lines, block_every, ansi, long_lines, long_line_bytes, seed=1):
+    """Write a synthetic worker log; return the number of request blocks in it."""
+    rng = random.Random(seed)
+    blocks = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for index in range(lines):
+            if block_every and index % block_every == block_every - 1:
+                f.write(f"<<CONTROLLER_REQUEST id=bench-{blocks}>>\n")
+                f.write(f"Need a decision on step {blocks}: keep the old schema or migrate?\n")
+                f.write("<<CONTROLLER_REQUEST_END>>\n")
+                blocks += 1
+                continue
+            line = rng.choice(SAMPLE_LINES)
+            if rng.random() < long_lines:
+                line = (line + " ") * (long_line_bytes // (len(line) + 1) + 1)
+                line = line[:long_line_bytes]
+            if rng.random() < ansi:
+                line = rng.choice(ANSI_NOISE).format(line)
+            f.write(line + "\n")
+    return blocks
+
+
+class ReplayStream:
+    """Read side of the scratch log; reports closed once the writer is done and it is drained."""
+
+    def __init__(self, path, writer_done):
+        self._file = open(path, "rb")
+        self._writer_done = writer_done
+        self.closed = False
+
+    def read(self, size=-1):
+        done = self._writer_done.is_set()
+        data = self._file.read(size)
+        if not data and done:
+            self.closed = True
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+class EofStream:
+    """A file that parse_stream treats as closed at end of file."""
+
+    def __init__(self, f):
+        self._file = f
+        self.closed = False
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        if not data:
+            self.closed = True
+        return data
+
+
+def replay(source, target, rate, writer_done, end_times, log_filter=None):
+    """Append source to target at rate lines/sec, noting when each block's END marker is written."""
+    batch = max(1, int(rate / 50)) if rate else 512
+    block_id = None
+    pending = []
+    start = time.perf_counter()
+    sent = 0
+    with open(source, "rb") as src, open(target, "ab", buffering=0) as out:
+        for line in src:
+            pending.append(line)
+            match = BLOCK_ID_RE.search(line.decode("utf-8", "replace")) if b"id=bench-" in line else None
+            if match:
+                block_id = match.group(1)
+            is_end = b"<<CONTROLLER_REQUEST_END>>" in line
+            if len(pending) < batch and not is_end:
+                continue
+            data = b"".join(pending)
+            if log_filter is not None:
+                data = log_filter.feed(data)
+            out.write(data)
+            sent += len(pending)
+            pending = []
+            if is_end:
+                end_times[block_id] = time.perf_counter()
+            if rate:
+                delay = start + sent / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        data = b"".join(pending)
+        if log_filter is not None:
+            data = log_filter.feed(data) + log_filter.flush()
+        out.write(data)
+    writer_done.set()
+
+
+def parse_throughput(path, max_line_bytes, heuristic):
+    blocks = []
+    with open(path, "rb") as f:
+        start = time.perf_counter()
+        bridge.parse_stream(
+            EofStream(f),
+            blocks.append,
+            heuristic_enabled=heuristic,
+            max_line_bytes=max_line_bytes,
+        )
+        elapsed = time.perf_counter() - start
+    return elapsed, len(blocks)
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_replay(log_path, scratch, args):
+    """Replay log_path through parse_stream and the pipeline; return latencies and timings."""
+    bridge_args = types.SimpleNamespace(
+        mode="auto",
+        controller_backend="none",
+        controller_timeout=0,
+        worker_context_lines=args.worker_context_lines,
+        worker_context_budget=args.worker_context_budget,
+        split_response=True,
+        dry_run=False,
+        log=None,
+    )
+    end_times = {}
+    sent_times = {}
+    rng = random.Random(2)
+    rng_lock = threading.Lock()
+    latency = args.controller_latency
+    jitter = args.latency_jitter
+
+    def stub_controller(controller_block, bridge_args, controller_pane_id, req_id):
+        with rng_lock:
+            delay = max(0.0, latency + rng.uniform(-jitter, jitter))
+        time.sleep(delay)
+        match = BLOCK_ID_RE.search(controller_block)
+        return STUB_RESPONSE.format(match.group(1) if match else "?")
+
+    def record_send(response_text, args, pane_id, trace=None):
+        match = BLOCK_ID_RE.search(response_text or "")
+        if match:
+            sent_times[match.group(1)] = time.perf_counter()
+        if trace is not None:
+            trace.mark("delivered")
+            trace.finish()
+
+    bridge.INBOX_DIR = os.path.join(scratch, "inbox")
+    bridge.OUTBOX_DIR = os.path.join(scratch, "outbox")
+    bridge.ARCHIVE_DIR = os.path.join(scratch, "archive")
+    bridge.ensure_dirs()
+    bridge.run_controller_backend = stub_controller
+    bridge.deliver_response = record_send
+
+    target = os.path.join(scratch, "worker.log")
+    open(target, "wb").close()
+    pipeline = bridge.RequestPipeline(
+        workers=args.controller_workers,
+        max_pending=args.max_pending,
+        max_pending_per_key=args.pane_queue_size,
+    )
+    context_ring = None
+    if args.worker_context_lines > 0:
+        context_ring = bridge.deque(maxlen=args.worker_context_lines)
+    seen_hashes = set()
+    bridge_args.log = target
+
+    def on_block(block):
+        bridge.dispatch_block(
+            block, bridge_args, "%bench", seen_hashes, pipeline, context_ring=context_ring, worker_log=target
+        )
+
+    writer_done = threading.Event()
+    log_filter = log_sink.TerminalFilter() if args.filter else None
+    writer = threading.Thread(
+        target=replay, args=(log_path, target, args.rate, writer_done, end_times, log_filter), daemon=True
+    )
+    stream = ReplayStream(target, writer_done)
+    tailer = bridge.open_tailer(target, args.tail_backend, args.poll_interval)
+    output = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(output if not args.verbose else sys.stdout):
+        writer.start()
+        try:
+            bridge.parse_stream(
+                stream,
+                on_block,
+                heuristic_enabled=args.heuristic,
+                tailer=tailer,
+                max_line_bytes=args.max_line_bytes,
+                context_ring=context_ring,
+                heuristic_quiet=0.0,
+            )
+            parsed = time.perf_counter()
+            while pipeline.pending():
+                time.sleep(0.01)
+        finally:
+            pipeline.close()
+            tailer.close()
+            stream.close()
+    finished = time.perf_counter()
+    dropped = output.getvalue().count("dropped a heuristic block")
+    deferred = output.getvalue().count("waits for a free slot")
+    latencies = [sent - end_times[key] for key, sent in sent_times.items() if key in end_times]
+    return {
+        "blocks": len(end_times),
+        "sent": len(sent_times),
+        "dropped": dropped,
+        "deferred": deferred,
+        "unanswered": sorted(set(end_times) - set(sent_times), key=int),
+        "latencies": latencies,
+        "parse_elapsed": parsed - start,
+        "elapsed": finished - start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a worker log through the bridge's request path")
+    parser.add_argument("log", nargs="?", help="recorded worker log to replay (default: synthetic)")
+    parser.add_argument("--write-log", default=None, help="save the synthetic log here and exit")
+    parser.add_argument("--lines", type=int, default=50000, help="synthetic log lines")
+    parser.add_argument("--block-every", type=int, default=500, help="a request block every N lines (0 = none)")
+    parser.add_argument("--ansi", type=float, default=0.3, help="fraction of lines wrapped in ANSI noise")
+    parser.add_argument("--long-lines", type=float, default=0.01, help="fraction of overlong lines")
+    parser.add_argument("--long-line-bytes", type=int, default=16384)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--rate", type=float, default=0, help="replay rate in lines/sec (0 = as fast as possible)")
+    parser.add_argument("--filter", action="store_true", help="pass the replay through log_sink's terminal filter")
+    parser.add_argument("--heuristic", action="store_true", help="enable heuristic triggers")
+    parser.add_argument("--controller-latency", type=float, default=0.2, help="stub controller seconds per request")
+    parser.add_argument("--latency-jitter", type=float, default=0.05)
+    parser.add_argument("--controller-workers", type=int, default=4)
+    parser.add_argument("--max-pending", type=int, default=32)
+    parser.add_argument("--pane-queue-size", type=int, default=8)
+    parser.add_argument("--worker-context-lines", type=int, default=40)
+    parser.add_argument("--worker-context-budget", type=int, default=1000)
+    parser.add_argument("--max-line-bytes", type=int, default=65536)
+    parser.add_argument("--tail-backend", choices=["auto", "inotify", "poll"], default="auto")
+    parser.add_argument("--poll-interval", type=float, default=0.2)
+    parser.add_argument("--verbose", action="store_true", help="show the bridge's own output")
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp(prefix="macs-bench-")
+    try:
+        log_path = args.log
+        if log_path is None:
+            log_path = args.write_log or os.path.join(scratch, "synthetic.log")
+            generate_log(
+                log_path, args.lines, args.block_every, args.ansi, args.long_lines, args.long_line_bytes, args.seed
+            )
+            if args.write_log:
+                print(f"wrote {log_path}")
+                return 0
+        size = os.path.getsize(log_path)
+        with open(log_path, "rb") as f:
+            line_count = sum(1 for _ in f)
+
+        parse_elapsed, parsed_blocks = parse_throughput(log_path, args.max_line_bytes, args.heuristic)
+        result = run_replay(log_path, scratch, args)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    latencies = result["latencies"]
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    rate_label = f"{args.rate:g} lines/sec" if args.rate else "max rate"
+    print(f"log:        {log_path if args.log else 'synthetic'} ({line_count} lines, {size / 1e6:.1f} MB)")
+    print(
+        f"parse:      {size / 1e6 / parse_elapsed:.1f} MB/s, "
+        f"{line_count / parse_elapsed:,.0f} lines/sec ({parsed_blocks} blocks)"
+    )
+    print(f"replay:     {rate_label}, parsed in {result['parse_elapsed']:.2f}s, drained in {result['elapsed']:.2f}s")
+    print(
+        f"requests:   {result['blocks']} written, {result['sent']} sent, {result['deferred']} deferred, "
+        f"{result['dropped']} heuristic dropped, {result['sent'] / result['elapsed']:.1f} requests/sec"
+    )
+    if latencies:
+        print(
+            "latency:    end marker to send "
+            f"p50={percentile(latencies, 0.5) * 1000:.0f}ms "
+            f"p90={percentile(latencies, 0.9) * 1000:.0f}ms "
+            f"p99={percentile(latencies, 0.99) * 1000:.0f}ms "
+            f"max={max(latencies) * 1000:.0f}ms"
+        )
+    print(f"peak RSS:   {rss_mb:.1f} MB")
+    if result["unanswered"]:
+        print(f"FAIL: {len(result['unanswered'])} explicit requests never answered: {result['unanswered'][:10]}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,26 +6,61 @@ Monitors a worker tmux pane for controller requests and routes responses.
 Supports manual, auto, and interactive modes.
 """
 import argparse
+import asyncio
+import atexit
+import ctypes
+import functools
 import hashlib
+import http.server
+import itertools
+import json
 import os
 import re
+import resource
+import select
 import shlex
+import socketserver
+import struct
 import subprocess
 import sys
+import tempfile
+import threading
 import time
-from collections import deque
+from collections import OrderedDict, deque
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
 from contextlib import contextmanager
 from datetime import datetime, timezone
 import fcntl
 
+import archive_store
+import log_sink
+
+try:
+    import sqlite3
+except ImportError:  # some minimal Python builds ship without sqlite
+    sqlite3 = None
+
 # Request/response delimiters
+# Literal that every request start and end line contains; checked before the
+# regexes so most lines are rejected without running them ("" disables it).
+REQUEST_MARKER = "<<CONTROLLER_REQUEST"
 START_RE = re.compile(r"<<CONTROLLER_REQUEST.*>>")
 END_RE = re.compile(r"<<CONTROLLER_REQUEST_END>>")
 RESPONSE_START_RE = re.compile(r"<<CONTROLLER_RESPONSE.*>>")
 RESPONSE_END_RE = re.compile(r"<<CONTROLLER_RESPONSE_END>>")
 
+# Terminal noise ignored when fingerprinting requests for the response cache
+ANSI_ESCAPE_RE = re.compile(r"\x1b(?:\[[0-?]*[ -/]*[@-~]|\][^\x07\x1b]*(?:\x07|\x1b\\)|[@-Z\\-_])")
+SPINNER_RE = re.compile("[\u2800-\u28ff\u25d0-\u25d3\u25f4-\u25f7\u2722-\u273d\u00b7\u2022\u25cf\u25cb]")
+TIMESTAMP_RE = re.compile(
+    r"\b\d{4}-?\d{2}-?\d{2}[T ]\d{2}:?\d{2}(?::?\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?\b"
+    r"|\b\d{1,2}:\d{2}(?::\d{2})?\b"
+)
+ELAPSED_RE = re.compile(r"\b\d+(?:\.\d+)?\s?(?:ms|s|secs?|m|mins?|h)\b", re.IGNORECASE)
+
 # Heuristic triggers for questions/completion
-QUESTION_RE = re.compile(r"[A-Za-z].*\?$")
+# Anchored so a search cannot restart at every letter of a long line.
+QUESTION_RE = re.compile(r"^[^A-Za-z]*[A-Za-z].*\?$")
 ASK_RE = re.compile(
     r"\b(what would you like|do you want|should i|shall i|"
     r"would you like|anything else|any other|question|"
@@ -37,13 +72,67 @@ DONE_RE = re.compile(
     r"ready to merge|ready for merge|awaiting your response)\b",
     re.IGNORECASE,
 )
+TRIGGER_RE = re.compile(f"{ASK_RE.pattern}|{DONE_RE.pattern}", re.IGNORECASE)
+# Every ASK_RE/DONE_RE match contains one of these once lowercased; keep in sync.
+TRIGGER_KEYWORDS = (
+    "done",
+    "complete",
+    "finished",
+    "ready",
+    "all set",
+    "awaiting",
+    "question",
+    "anything else",
+    "any other",
+    "should i",
+    "shall i",
+    "would you like",
+    "do you want",
+)
+# The only non-ASCII characters IGNORECASE matches to ASCII letters that
+# str.lower() leaves alone.
+TRIGGER_FOLD = {ord("\u0131"): "i", ord("\u017f"): "s"}
+# Status lines an agent keeps redrawing while it works; seeing one after a
+# heuristic trigger means the worker is not actually waiting yet.
+BUSY_RE = re.compile(r"\b(?:esc|ctrl\+c) to (?:interrupt|cancel)\b", re.IGNORECASE)
+
+# Worker context compaction (see compact_context_lines)
+CONTEXT_BYTES_PER_TOKEN = 4
+CONTEXT_RUN_MIN = 5
+CONTEXT_KEY_RE = re.compile(r"\s*\S*")
+CONTEXT_DIGITS_RE = re.compile(r"\d+")
+CONTEXT_KEEP_RE = re.compile(r"error|fail|panic|exception|traceback|warn|fatal|denied", re.IGNORECASE)
+
+# classify_line() flags
+LINE_START = 1
+LINE_END = 2
+LINE_TRIGGER = 4
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 INBOX_DIR = os.path.join(BASE_DIR, "inbox")
 OUTBOX_DIR = os.path.join(BASE_DIR, "outbox")
 ARCHIVE_DIR = os.path.join(BASE_DIR, "archive")
 DEFAULT_SYSTEM_PROMPT = os.path.join(BASE_DIR, "controller_prompt.txt")
-SEND_LOCK_PATH = "/tmp/macs-bridge-send.lock"
+LOG_SINK = os.path.join(BASE_DIR, "log_sink.py")
+DEFAULT_DEDUPE_INDEX = os.path.join(ARCHIVE_DIR, "seen-hashes.sqlite3")
+DEFAULT_RESPONSE_CACHE = os.path.join(ARCHIVE_DIR, "response-cache.sqlite3")
+PACKED_ARCHIVE_NAME = "packed"
+# send.sh --urgent touches <pane lock>.urgent while it waits; markers older
+# than URGENT_MARKER_MAX_AGE are left over from a killed send and ignored.
+URGENT_MARKER_SUFFIX = ".urgent"
+URGENT_MARKER_MAX_AGE = 60.0
+
+# inotify event masks (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+TAIL_WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_MOVE_SELF
+DIR_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_CREATE | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+INOTIFY_EVENT = struct.Struct("iIII")
 
 
 def ensure_dirs():
@@ -52,9 +141,603 @@ def ensure_dirs():
     os.makedirs(ARCHIVE_DIR, exist_ok=True)
 
 
+# archive_store.PackedArchive when --archive-format packed; set in main().
+ARCHIVE_STORE = None
+
+
+def archive_text(req_id, kind, text, block_hash=""):
+    """Archive a request or response: one record in the pack, or <id>.<kind>.txt."""
+    if ARCHIVE_STORE is not None:
+        ARCHIVE_STORE.append(kind, req_id, text, block_hash)
+    else:
+        write_file(os.path.join(ARCHIVE_DIR, f"{req_id}.{kind}.txt"), text)
+
+
+def load_libc():
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class Inotify:
+    """Minimal ctypes wrapper around Linux inotify."""
+
+    def __init__(self):
+        libc = load_libc()
+        if libc is None:
+            raise OSError("inotify is not available on this platform")
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+        self._libc = libc
+        self.fd = fd
+
+    def add_watch(self, path, mask=TAIL_WATCH_MASK):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_add_watch failed for {path}: {os.strerror(err)}")
+        return wd
+
+    def read_events(self):
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return events
+            if not data:
+                return events
+            offset = 0
+            while offset + INOTIFY_EVENT.size <= len(data):
+                wd, mask, _cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = data[offset:offset + length].rstrip(b"\0").decode("utf-8", "ignore")
+                offset += length
+                events.append((wd, mask, name))
+
+    def wait(self, timeout=None):
+        try:
+            ready, _, _ = select.select([self.fd], [], [], timeout)
+        except InterruptedError:
+            return []
+        if not ready:
+            return []
+        return self.read_events()
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollTailer:
+    """Fallback tail waiter that sleeps for a fixed interval."""
+
+    name = "poll"
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+
+    def wait(self, timeout=None):
+        delay = self.interval if timeout is None else max(0.0, min(self.interval, timeout))
+        time.sleep(delay)
+
+    def close(self):
+        pass
+
+
+class InotifyTailer:
+    """Tail waiter that sleeps until the watched file changes."""
+
+    name = "inotify"
+
+    def __init__(self, path, heartbeat=5.0, mask=TAIL_WATCH_MASK):
+        self.heartbeat = heartbeat
+        self._inotify = Inotify()
+        try:
+            self._inotify.add_watch(path, mask)
+        except OSError:
+            self._inotify.close()
+            raise
+
+    def wait(self, timeout=None):
+        # The heartbeat bounds each sleep so a missed event can only delay a read.
+        if timeout is None or timeout > self.heartbeat:
+            timeout = self.heartbeat
+        self._inotify.wait(max(0.0, timeout))
+
+    def close(self):
+        self._inotify.close()
+
+
+def open_tailer(path, backend="auto", poll_interval=0.2, mask=TAIL_WATCH_MASK):
+    """Return a tail waiter for path: inotify when available, else polling."""
+    if backend in ("auto", "inotify"):
+        try:
+            return InotifyTailer(path, mask=mask)
+        except OSError as exc:
+            if backend == "inotify":
+                raise
+            print(f"[bridge] inotify unavailable ({exc}); falling back to polling.")
+    return PollTailer(poll_interval)
+
+
+class SegmentedLog:
+    """Reads a log_sink segment directory as one continuous byte stream.
+
+    Follows segments in manifest order, moving on once the current segment is
+    finished and fully read. Provides read() like a log file and wait()/close()
+    like a tailer, so it can be handed to parse_stream as both.
+
+    With start="offset" reading resumes from the offset saved by a previous
+    run (or starts at the end if there is none), and checkpoint() records the
+    resume point as reading goes. start="end" skips everything written so far.
+    """
+
+    SAVE_INTERVAL = 1.0
+
+    def __init__(self, directory, start="offset", tail_backend="auto", poll_interval=0.2):
+        self.directory = directory
+        self.persist = start == "offset"
+        self.closed = False
+        self._tailer = open_tailer(directory, tail_backend, poll_interval, mask=DIR_WATCH_MASK)
+        self.name = f"segmented/{self._tailer.name}"
+        self._manifest = None
+        self._manifest_mtime = None
+        self._file = None
+        self._segment = None
+        self._pos = 0
+        self._mark = None
+        self._saved_mark = None
+        self._last_save = 0.0
+        resume = log_sink.read_offset(directory) if self.persist else None
+        segments = self._segments(refresh=True)
+        if resume is not None:
+            names = [entry["name"] for entry in segments]
+            if resume[0] in names:
+                self._open(resume[0], resume[1])
+            elif segments:
+                print(f"[bridge] warning: resume segment {resume[0]} was pruned; reading from {names[0]}.")
+                self._open(names[0], 0)
+            self._saved_mark = self._mark = resume
+        elif segments:
+            last = segments[-1]["name"]
+            self._open(last, os.path.getsize(os.path.join(directory, last)))
+
+    def _segments(self, refresh=False):
+        path = os.path.join(self.directory, log_sink.MANIFEST_NAME)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if refresh or self._manifest is None or mtime != self._manifest_mtime:
+            self._manifest = log_sink.read_manifest(self.directory)["segments"]
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def _open(self, name, pos):
+        if self._file is not None:
+            self._file.close()
+        self._file = open(os.path.join(self.directory, name), "rb")
+        self._file.seek(pos)
+        self._segment = name
+        self._pos = self._file.tell()
+
+    def _next_segment(self):
+        """Name of the segment to read after the current one, once it is safe to move."""
+        segments = self._segments()
+        if not segments:
+            return None
+        if self._segment is None:
+            return segments[0]["name"]
+        for index, entry in enumerate(segments):
+            if entry["name"] == self._segment:
+                if index + 1 < len(segments) and log_sink.segment_finished(entry):
+                    return segments[index + 1]["name"]
+                return None
+        # The current segment was pruned from under us.
+        print(f"[bridge] warning: log segment {self._segment} was pruned before it was read.")
+        return segments[0]["name"]
+
+    def read(self, size=-1):
+        while True:
+            data = self._file.read(size) if self._file is not None else b""
+            if data:
+                self._pos += len(data)
+                return data
+            following = self._next_segment()
+            if following is None:
+                self._save()
+                return b""
+            if self._file is not None:
+                # Drain bytes written just before the segment was finished.
+                data = self._file.read(size)
+                if data:
+                    self._pos += len(data)
+                    return data
+            self._open(following, 0)
+
+    def checkpoint(self, pending=0):
+        """Record that everything read so far, except pending bytes, has been handled."""
+        if not self.persist or self._segment is None or pending > self._pos:
+            return
+        self._mark = (self._segment, max(0, self._pos - pending))
+        if time.time() - self._last_save >= self.SAVE_INTERVAL:
+            self._save()
+
+    def _save(self):
+        if not self.persist or self._mark is None or self._mark == self._saved_mark:
+            return
+        log_sink.write_offset(self.directory, self._mark[0], self._mark[1])
+        self._saved_mark = self._mark
+        self._last_save = time.time()
+
+    def wait(self, timeout=None):
+        self._tailer.wait(timeout)
+
+    def close(self):
+        if self.closed:
+            return
+        self._save()
+        self.closed = True
+        if self._file is not None:
+            self._file.close()
+        self._tailer.close()
+
+
+class LineReader:
+    """Incremental newline splitter over raw bytes.
+
+    Bytes are appended to a single bytearray and scanned from a cursor, so each
+    byte is searched once no matter how the input is chunked. Lines longer than
+    max_line_bytes are cut at the limit and the remainder (up to the next
+    newline) is dropped.
+    """
+
+    def __init__(self, max_line_bytes=65536, errors="ignore"):
+        self.max_line_bytes = max_line_bytes
+        self.errors = errors
+        self.truncated_lines = 0
+        self._buf = bytearray()
+        self._scan = 0
+        self._discarding = False
+
+    def pending_bytes(self):
+        return len(self._buf)
+
+    def feed(self, data):
+        lines = []
+        buf = self._buf
+        buf += data
+        start = 0
+        while True:
+            idx = buf.find(b"\n", self._scan)
+            if idx < 0:
+                break
+            if self._discarding:
+                self._discarding = False
+            else:
+                end = idx
+                if self.max_line_bytes and end - start > self.max_line_bytes:
+                    end = start + self.max_line_bytes
+                    self.truncated_lines += 1
+                lines.append(buf[start:end].decode("utf-8", self.errors))
+            start = idx + 1
+            self._scan = start
+        if start:
+            del buf[:start]
+            self._scan -= start
+        if self.max_line_bytes and len(buf) > self.max_line_bytes:
+            if not self._discarding:
+                lines.append(buf[:self.max_line_bytes].decode("utf-8", self.errors))
+                self.truncated_lines += 1
+                self._discarding = True
+            del buf[:]
+            self._scan = 0
+        else:
+            self._scan = len(buf)
+        return lines
+
+    def flush(self):
+        """Return the trailing partial line, if any, and reset."""
+        lines = []
+        if self._buf and not self._discarding:
+            lines.append(self._buf.decode("utf-8", self.errors))
+        del self._buf[:]
+        self._scan = 0
+        self._discarding = False
+        return lines
+
+
+TMUX_SOCKET = os.environ.get("TMUX_SOCKET") or None
+# Control-mode connections keyed by tmux session id; see TmuxControlClient.
+CONTROL_CLIENTS = {}
+# Control-mode notifications after which the cached pane list is out of date.
+PANE_CHANGE_NOTIFICATIONS = (
+    b"%layout-change ",
+    b"%window-add ",
+    b"%window-close ",
+    b"%window-renamed ",
+    b"%unlinked-window-add ",
+    b"%unlinked-window-close ",
+    b"%session-renamed ",
+    b"%sessions-changed",
+)
+TMUX_QUOTE_TABLE = {
+    ord("\\"): "\\\\",
+    ord('"'): '\\"',
+    ord("$"): "\\$",
+    ord("\n"): "\\n",
+    ord("\r"): "\\r",
+    ord("\t"): "\\t",
+    0x1B: "\\e",
+}
+for _code in list(range(0x20)) + [0x7F]:
+    TMUX_QUOTE_TABLE.setdefault(_code, f"\\u{_code:04x}")
+CONTROL_OUTPUT_ESCAPE_RE = re.compile(rb"\\([0-7]{3})")
+
+
+def configure_tmux(socket=None):
+    global TMUX_SOCKET
+    TMUX_SOCKET = socket or None
+
+
+def tmux_server_tag():
+    """File-name-safe name for the tmux server; pane ids are only unique per server."""
+    return re.sub(r"[^A-Za-z0-9._-]", "_", TMUX_SOCKET) if TMUX_SOCKET else "default"
+
+
+def runtime_dir():
+    """Per-user directory for state shared with the shell scripts (status, locks)."""
+    base = os.environ.get("TMUX_TMPDIR") or "/tmp"
+    return os.path.join(base, f"macs-bridge-{os.getuid()}")
+
+
+def tmux_command(args):
+    cmd = ["tmux"]
+    if TMUX_SOCKET:
+        cmd.extend(["-S", TMUX_SOCKET])
+    return cmd + args
+
+
+def quote_tmux_arg(arg):
+    if arg == ";":
+        return ";"
+    return '"' + arg.translate(TMUX_QUOTE_TABLE) + '"'
+
+
+def unescape_control_output(data):
+    if b"\\" not in data:
+        return data
+    return CONTROL_OUTPUT_ESCAPE_RE.sub(lambda m: bytes([int(m.group(1), 8)]), data)
+
+
+class PaneFeed:
+    """In-memory byte stream of one pane's output from a control-mode client.
+
+    Provides read() like a log file and wait()/close() like a tailer, so it can
+    be handed to parse_stream as both. Buffered output beyond max_bytes is
+    dropped oldest-first. With a terminal_filter (log_sink.TerminalFilter)
+    the output is cleaned the same way as filtered pipe-pane logs.
+    """
+
+    name = "control"
+
+    def __init__(self, client, pane_id, max_bytes=16 * 1024 * 1024, terminal_filter=None):
+        self.client = client
+        self.pane_id = pane_id
+        self.max_bytes = max_bytes
+        self.terminal_filter = terminal_filter
+        self.dropped_bytes = 0
+        self.closed = False
+        self.listener = None
+        self._chunks = deque()
+        self._size = 0
+        self._cond = threading.Condition()
+
+    def push(self, data):
+        if self.terminal_filter is not None:
+            data = self.terminal_filter.feed(data)
+            if not data:
+                return
+        with self._cond:
+            self._chunks.append(data)
+            self._size += len(data)
+            while self._size > self.max_bytes and len(self._chunks) > 1:
+                dropped = self._chunks.popleft()
+                self._size -= len(dropped)
+                self.dropped_bytes += len(dropped)
+            self._cond.notify_all()
+        if self.listener is not None:
+            self.listener()
+
+    def read(self, size=-1):
+        with self._cond:
+            if not self._chunks:
+                return b""
+            data = b"".join(self._chunks)
+            self._chunks.clear()
+            self._size = 0
+            return data
+
+    def wait(self, timeout=None):
+        with self._cond:
+            if not self._chunks and not self.closed:
+                self._cond.wait(timeout)
+
+    def mark_closed(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def close(self):
+        self.mark_closed()
+        self.client.unsubscribe(self)
+
+
+class _ControlReply:
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.lines = []
+        self.error = False
+        self.done = threading.Event()
+
+
+class TmuxControlClient:
+    """Persistent tmux control-mode (tmux -C) connection attached to one session.
+
+    Commands are written as lines on stdin and matched to their %begin/%end
+    replies in order (a line joined with ';' gets one reply per command).
+    %output notifications are unescaped and pushed to the PaneFeed objects
+    subscribed to that pane; pane and window changes invalidate PANES.
+    """
+
+    def __init__(self, target, timeout=5.0):
+        self.target = target
+        self.closed = False
+        self._replies = deque()
+        self._current = None
+        self._write_lock = threading.Lock()
+        self._feeds = {}
+        self._feeds_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._proc = subprocess.Popen(
+            tmux_command(["-C", "attach-session", "-f", "ignore-size", "-t", target]),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._reader = threading.Thread(target=self._read_loop, name="tmux-control", daemon=True)
+        self._reader.start()
+        if not self._ready.wait(timeout) or self.closed:
+            self.close()
+            raise OSError(f"tmux control mode failed to attach to {target}")
+
+    def _read_loop(self):
+        for raw in self._proc.stdout:
+            line = raw.rstrip(b"\n")
+            current = self._current
+            if current is not None:
+                if line.startswith((b"%end ", b"%error ")):
+                    current.error = current.error or line.startswith(b"%error ")
+                    current.blocks -= 1
+                    if current.blocks == 0 and self._replies and self._replies[0] is current:
+                        self._replies.popleft()
+                        current.done.set()
+                    self._current = None
+                    self._ready.set()
+                else:
+                    current.lines.append(line)
+                continue
+            if line.startswith(b"%output "):
+                parts = line.split(b" ", 2)
+                if len(parts) == 3:
+                    self._dispatch(parts[1].decode(), unescape_control_output(parts[2]))
+            elif line.startswith(b"%begin "):
+                # Flag 1 marks replies to our own commands; 0 is tmux's own attach reply.
+                if line.split(b" ")[-1] != b"0" and self._replies:
+                    self._current = self._replies[0]
+                else:
+                    self._current = _ControlReply(1)
+            elif line.startswith(PANE_CHANGE_NOTIFICATIONS):
+                PANES.invalidate()
+            elif line.startswith(b"%exit"):
+                break
+        self._shutdown()
+
+    def _dispatch(self, pane_id, data):
+        with self._feeds_lock:
+            feeds = list(self._feeds.get(pane_id, ()))
+        for feed in feeds:
+            feed.push(data)
+
+    def _shutdown(self):
+        self.closed = True
+        self._ready.set()
+        while self._replies:
+            reply = self._replies.popleft()
+            reply.error = True
+            reply.done.set()
+        with self._feeds_lock:
+            feeds = [feed for group in self._feeds.values() for feed in group]
+        for feed in feeds:
+            feed.mark_closed()
+
+    def subscribe(self, pane_id, terminal_filter=None):
+        feed = PaneFeed(self, pane_id, terminal_filter=terminal_filter)
+        with self._feeds_lock:
+            self._feeds.setdefault(pane_id, []).append(feed)
+        return feed
+
+    def unsubscribe(self, feed):
+        with self._feeds_lock:
+            group = self._feeds.get(feed.pane_id, [])
+            if feed in group:
+                group.remove(feed)
+
+    def command(self, args, check=True, timeout=30):
+        reply = _ControlReply(1 + args.count(";"))
+        line = " ".join(quote_tmux_arg(arg) for arg in args) + "\n"
+        with self._write_lock:
+            if self.closed:
+                raise OSError("tmux control connection is closed")
+            self._replies.append(reply)
+            self._proc.stdin.write(line.encode("utf-8"))
+            self._proc.stdin.flush()
+        if not reply.done.wait(timeout):
+            raise subprocess.TimeoutExpired(tmux_command(args), timeout)
+        output = "\n".join(item.decode("utf-8", "replace") for item in reply.lines)
+        if reply.error and check:
+            raise subprocess.CalledProcessError(1, tmux_command(args), output=output)
+        return output + "\n" if output else ""
+
+    def close(self):
+        try:
+            self._proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self._proc.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+        self._shutdown()
+
+
+def pane_filter(args):
+    """A fresh terminal filter for a pane's control-mode output, if filtering is on."""
+    return log_sink.TerminalFilter() if args.log_filter else None
+
+
+def control_client():
+    for client in CONTROL_CLIENTS.values():
+        if not client.closed:
+            return client
+    return None
+
+
+def control_client_for(target):
+    """Return the control-mode client for target's session, attaching one if needed."""
+    session_id = run_tmux(["display-message", "-p", "-t", target, "#{session_id}"], capture=True).strip()
+    client = CONTROL_CLIENTS.get(session_id)
+    if client is None or client.closed:
+        client = TmuxControlClient(session_id)
+        CONTROL_CLIENTS[session_id] = client
+    return client
+
+
 def run_tmux(args, capture=False, check=True):
+    client = control_client()
+    if client is not None:
+        output = client.command(args, check=check)
+        return output if capture else ""
     result = subprocess.run(
-        ["tmux"] + args,
+        tmux_command(args),
         check=check,
         capture_output=capture,
         text=True,
@@ -63,8 +746,15 @@ def run_tmux(args, capture=False, check=True):
 
 
 def run_tmux_input(args, input_text, check=True):
+    client = control_client()
+    if client is not None and args[:1] == ["load-buffer"]:
+        # Control mode has no per-command stdin, so load the buffer inline.
+        end = args.index(";") if ";" in args else len(args)
+        if args[end - 1] == "-":
+            client.command(["set-buffer"] + args[1:end - 1] + [input_text] + args[end:], check=check)
+            return
     subprocess.run(
-        ["tmux"] + args,
+        tmux_command(args),
         check=check,
         input=input_text,
         text=True,
@@ -89,29 +779,152 @@ def get_current_session():
         return ""
 
 
-def list_panes(session):
-    fmt = "#{pane_id}\t#{window_name}\t#{pane_title}\t#{pane_current_command}\t#{pane_pid}"
+PANE_FORMAT = "#{pane_id}\t#{session_id}\t#{session_name}\t#{window_name}\t#{pane_title}\t#{pane_current_command}\t#{pane_pid}"
+PANE_FIELDS = ("pane_id", "session_id", "session_name", "window_name", "pane_title", "current_cmd", "pid")
+
+
+def process_table():
+    """Return {pid: ppid} and a command lookup for every process, from /proc or one ps call."""
+    parents = {}
+    commands = {}
+    if os.path.isdir("/proc/self"):
+        for name in os.listdir("/proc"):
+            if not name.isdigit():
+                continue
+            try:
+                with open(f"/proc/{name}/stat", "rb") as f:
+                    stat = f.read()
+            except OSError:
+                continue
+            # The command name in parentheses may itself contain spaces or ')'.
+            fields = stat[stat.rfind(b")") + 2:].split()
+            if len(fields) > 1:
+                parents[int(name)] = int(fields[1])
+
+        def command(pid):
+            if pid not in commands:
+                try:
+                    with open(f"/proc/{pid}/cmdline", "rb") as f:
+                        commands[pid] = f.read().replace(b"\0", b" ").decode("utf-8", "replace").strip()
+                except OSError:
+                    commands[pid] = ""
+            return commands[pid]
+
+        return parents, command
     try:
-        if session:
-            out = run_tmux(["list-panes", "-t", session, "-F", fmt], capture=True)
-        else:
-            out = run_tmux(["list-panes", "-a", "-F", fmt], capture=True)
-    except subprocess.CalledProcessError:
-        return []
-    panes = []
+        out = subprocess.run(
+            ["ps", "-axo", "pid=,ppid=,command="],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        out = ""
     for line in out.splitlines():
-        parts = line.split("\t")
-        if len(parts) != 5:
-            continue
-        pane_id, window_name, pane_title, current_cmd, pid = parts
-        panes.append({
-            "pane_id": pane_id,
-            "window_name": window_name,
-            "pane_title": pane_title,
-            "current_cmd": current_cmd,
-            "pid": pid,
-        })
-    return panes
+        parts = line.split(None, 2)
+        if len(parts) >= 2 and parts[0].isdigit() and parts[1].isdigit():
+            parents[int(parts[0])] = int(parts[1])
+            commands[int(parts[0])] = parts[2] if len(parts) == 3 else ""
+    return parents, lambda pid: commands.get(pid, "")
+
+
+class PaneRegistry:
+    """Every pane on the tmux server, with the command lines of its process tree.
+
+    One `list-panes -a` and one process-table scan (/proc, or a single ps) per
+    refresh; only the command lines of pane processes and their descendants are
+    read, since codex usually runs under a shell. The result is reused until
+    ttl seconds pass or invalidate() is called, which the control-mode client
+    does when tmux reports panes or windows coming and going.
+
+    invalidate() takes no lock: the control-mode reader calls it, and a load
+    in progress may be waiting on that reader for its list-panes reply. Loads
+    run under their own lock, and one that an invalidate() overtook is used
+    once but not kept.
+    """
+
+    def __init__(self, ttl=5.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._generations = itertools.count(1)
+        self._generation = 0
+        self._panes = None
+        self._loaded_at = 0.0
+        self._loaded_generation = 0
+
+    def invalidate(self):
+        self._generation = next(self._generations)
+
+    def _cached(self):
+        with self._lock:
+            if self._panes is None or self._loaded_generation != self._generation:
+                return None
+            if time.monotonic() - self._loaded_at > self.ttl:
+                return None
+            return self._panes
+
+    def panes(self, session=None):
+        panes = self._cached()
+        if panes is None:
+            with self._load_lock:
+                panes = self._cached()
+                if panes is None:
+                    generation = self._generation
+                    try:
+                        panes = self._load()
+                    except (OSError, subprocess.SubprocessError) as exc:
+                        print(f"[bridge] warning: could not list tmux panes: {exc}")
+                        panes = self._panes or []
+                    else:
+                        with self._lock:
+                            self._panes = panes
+                            self._loaded_at = time.monotonic()
+                            self._loaded_generation = generation
+        if not session:
+            return list(panes)
+        matched = [pane for pane in panes if session in (pane["session_name"], pane["session_id"])]
+        if matched:
+            return matched
+        # Let tmux resolve other target forms (prefixes, "name:window") to a session.
+        try:
+            session_id = run_tmux(["display-message", "-p", "-t", session, "#{session_id}"], capture=True).strip()
+        except (OSError, subprocess.SubprocessError):
+            return []
+        return [pane for pane in panes if pane["session_id"] == session_id]
+
+    def _load(self):
+        try:
+            out = run_tmux(["list-panes", "-a", "-F", PANE_FORMAT], capture=True)
+        except subprocess.CalledProcessError:
+            return []
+        panes = []
+        for line in out.splitlines():
+            parts = line.split("\t")
+            if len(parts) == len(PANE_FIELDS):
+                panes.append(dict(zip(PANE_FIELDS, parts)))
+        if not panes:
+            return panes
+        parents, command = process_table()
+        children = {}
+        for pid, ppid in parents.items():
+            children.setdefault(ppid, []).append(pid)
+        for pane in panes:
+            tree = []
+            stack = [int(pane["pid"])] if pane["pid"].isdigit() else []
+            while stack:
+                pid = stack.pop()
+                tree.append(command(pid))
+                stack.extend(children.get(pid, ()))
+            pane["commands"] = [cmd for cmd in tree if cmd]
+        return panes
+
+
+PANES = PaneRegistry()
+
+
+def list_panes(session):
+    return PANES.panes(session)
 
 
 def pane_matches_label(pane, label):
@@ -123,62 +936,47 @@ def pane_matches_label(pane, label):
     )
 
 
-def process_command_from_pid(pid):
-    try:
-        out = subprocess.run(
-            ["ps", "-o", "command=", "-p", str(pid)],
-            check=True,
-            capture_output=True,
-            text=True,
-        ).stdout.strip()
-    except subprocess.CalledProcessError:
-        return ""
-    return out
-
-
-def discover_worker_pane(session):
-    """Find the worker pane by label or codex process."""
-    panes = list_panes(session)
+def pick_pane(panes, label, exclude=None):
+    """First pane matching label, else one running codex (directly or under a shell)."""
+    panes = [pane for pane in panes if pane["pane_id"] != exclude]
     for pane in panes:
-        if pane_matches_label(pane, "worker"):
+        if pane_matches_label(pane, label):
             return pane["pane_id"]
     for pane in panes:
         if "codex" in pane["current_cmd"].lower():
             return pane["pane_id"]
     for pane in panes:
-        cmd = process_command_from_pid(pane["pid"])
-        if "codex" in cmd.lower():
+        if any("codex" in cmd.lower() for cmd in pane.get("commands", ())):
             return pane["pane_id"]
     return None
 
 
+def discover_worker_pane(session):
+    """Find the worker pane by label or codex process."""
+    return pick_pane(list_panes(session), "worker")
+
+
 def discover_controller_pane(session, worker_pane_id=None):
     """Find the controller pane, excluding the worker pane."""
-    panes = list_panes(session)
-    for pane in panes:
-        if pane_matches_label(pane, "controller"):
-            if worker_pane_id and pane["pane_id"] == worker_pane_id:
-                continue
-            return pane["pane_id"]
-    codex_panes = [p for p in panes if "codex" in p["current_cmd"].lower()]
-    for pane in codex_panes:
-        if worker_pane_id and pane["pane_id"] == worker_pane_id:
-            continue
-        return pane["pane_id"]
-    for pane in panes:
-        if worker_pane_id and pane["pane_id"] == worker_pane_id:
-            continue
-        cmd = process_command_from_pid(pane["pid"])
-        if "codex" in cmd.lower():
-            return pane["pane_id"]
-    return None
+    return pick_pane(list_panes(session), "controller", exclude=worker_pane_id)
 
 
-def setup_pipe(pane_id, log_path):
+def setup_pipe(pane_id, log_path, sink_args=None):
+    """Pipe pane output to log_path with `cat`, or through log_sink.py with sink_args."""
     log_path = os.path.abspath(log_path)
-    os.makedirs(os.path.dirname(log_path), exist_ok=True)
-    cmd = f"cat >> {shlex.quote(log_path)}"
-    run_tmux(["pipe-pane", "-o", "-t", pane_id, cmd])
+    if sink_args is None:
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        cmd = f"cat >> {shlex.quote(log_path)}"
+        run_tmux(["pipe-pane", "-o", "-t", pane_id, cmd])
+        return
+    if "segmented" in sink_args:
+        os.makedirs(log_path, exist_ok=True)
+    else:
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    cmd = " ".join(shlex.quote(part) for part in [sys.executable, LOG_SINK, log_path] + sink_args)
+    # Without -o an existing pipe (an earlier sink or a plain cat) is replaced,
+    # so the sink always runs with the current options.
+    run_tmux(["pipe-pane", "-t", pane_id, cmd])
 
 
 def stable_id(text):
@@ -200,10 +998,15 @@ def send_line(pane_id, line):
     run_tmux(["send-keys", "-t", pane_id, "Enter"], check=True)
 
 
-def load_seen_hashes():
-    seen = set()
+def iter_archived_request_hashes():
+    """Yield (hash, mtime) for every archived request (files and packed archive)."""
     if not os.path.isdir(ARCHIVE_DIR):
-        return seen
+        return
+    packed_dir = os.path.join(ARCHIVE_DIR, PACKED_ARCHIVE_NAME)
+    if ARCHIVE_STORE is not None:
+        yield from ARCHIVE_STORE.iter_request_hashes()
+    elif os.path.isdir(packed_dir):
+        yield from archive_store.PackedArchive(packed_dir).iter_request_hashes()
     for name in os.listdir(ARCHIVE_DIR):
         if not name.endswith(".request.txt"):
             continue
@@ -211,96 +1014,706 @@ def load_seen_hashes():
         try:
             with open(path, "r", encoding="utf-8") as f:
                 content = f.read()
+            mtime = os.path.getmtime(path)
         except OSError:
             continue
-        seen.add(stable_id(content))
-    return seen
+        yield stable_id(content), mtime
 
 
-def write_file(path, content):
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(content)
+def load_seen_hashes():
+    return {block_hash for block_hash, _ in iter_archived_request_hashes()}
 
 
-def load_system_prompt(path):
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return f.read().strip()
-    except OSError:
-        return ""
+class SeenIndex:
+    """Persistent set of request hashes backed by sqlite.
 
+    Lookups go to disk, so startup does not rescan the archive and memory use
+    does not grow with it. Entries older than ttl seconds, or beyond the newest
+    max_entries, are evicted (0 disables either limit).
+    """
 
-def extract_response_from_text(text):
-    lines = text.splitlines()
-    in_block = False
-    collected = []
-    for line in lines:
-        if not in_block:
-            if RESPONSE_START_RE.search(line):
-                in_block = True
-            continue
-        if RESPONSE_END_RE.search(line):
-            break
-        collected.append(line)
-    if collected:
-        return "\n".join(collected).strip()
-    return text.strip()
+    EVICT_EVERY = 100
 
+    def __init__(self, path, ttl=0, max_entries=0):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._adds = 0
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen (hash TEXT PRIMARY KEY, seen_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS seen_at_idx ON seen (seen_at)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        if not self._meta("backfilled"):
+            self._backfill()
+        self.evict()
 
-def normalize_header(line):
-    normalized = line.strip().lower()
-    normalized = re.sub(r"^[\s\-\*\d\.)]+\s*", "", normalized)
-    return normalized
+    def _meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
 
+    def _backfill(self):
+        # One-time import of hashes from archives written before the index existed.
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO seen (hash, seen_at) VALUES (?, ?)",
+                iter_archived_request_hashes(),
+            )
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('backfilled', '1')")
+            self._conn.execute("COMMIT")
 
-def parse_section_header(line):
-    header = normalize_header(line)
-    for section in ("worker instructions", "notes"):
-        if header.startswith(section):
-            remainder = ""
-            if ":" in line:
-                remainder = line.split(":", 1)[1].strip()
-            return section.split()[0], remainder
-    return None, ""
+    def __contains__(self, block_hash):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT seen_at FROM seen WHERE hash = ?", (block_hash,)
+            ).fetchone()
+        if row is None:
+            return False
+        return not (self.ttl and row[0] < time.time() - self.ttl)
 
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
 
-def split_worker_and_notes(text):
-    worker_lines = []
-    notes_lines = []
-    section = None
+    def add(self, block_hash):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO seen (hash, seen_at) VALUES (?, ?)",
+                (block_hash, time.time()),
+            )
+            self._adds += 1
+            evict = self._adds % self.EVICT_EVERY == 0
+        if evict:
+            self.evict()
 
-    for line in text.splitlines():
-        parsed_section, remainder = parse_section_header(line)
-        if parsed_section:
-            section = parsed_section
-            if remainder:
-                if section == "worker":
-                    worker_lines.append(remainder)
-                else:
-                    notes_lines.append(remainder)
-            continue
-        if section == "worker":
-            worker_lines.append(line)
-        elif section == "notes":
-            notes_lines.append(line)
-    worker_text = "\n".join(worker_lines).strip()
-    notes_text = "\n".join(notes_lines).strip()
-    return worker_text, notes_text
+    def evict(self):
+        with self._lock:
+            if self.ttl:
+                self._conn.execute("DELETE FROM seen WHERE seen_at < ?", (time.time() - self.ttl,))
+            if self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM seen WHERE hash IN ("
+                    "SELECT hash FROM seen ORDER BY seen_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
 
+    def close(self):
+        with self._lock:
+            self._conn.close()
 
-def read_recent_worker_context(log_path, max_lines):
-    if not log_path or max_lines <= 0:
-        return ""
-    try:
-        with open(log_path, "r", encoding="utf-8", errors="ignore") as f:
-            lines = f.read().splitlines()
-    except OSError:
-        return ""
-    if not lines:
-        return ""
-    tail = lines[-max_lines:]
-    cleaned = []
-    in_block = False
+
+def open_seen_hashes(args):
+    """Return the dedupe set for this run: the sqlite index, or an in-memory scan."""
+    path = args.dedupe_index
+    if path and path != "none" and sqlite3 is not None:
+        try:
+            return SeenIndex(path, ttl=args.dedupe_ttl, max_entries=args.dedupe_max_entries)
+        except sqlite3.Error as exc:
+            print(f"[bridge] warning: dedupe index unavailable ({exc}); scanning archive instead.")
+    return load_seen_hashes()
+
+
+def request_fingerprint(block_text, args):
+    """Hash of a request with terminal noise removed, scoped to the backend/model.
+
+    The controller system prompt is part of the scope too, so editing the prompt
+    file stops earlier answers from being served.
+
+    ANSI escapes, spinner glyphs, timestamps, elapsed-time counters and request
+    ids are dropped and whitespace/case is folded, so two redraws of the same
+    prompt map to one cache entry.
+    """
+    text = ANSI_ESCAPE_RE.sub("", block_text)
+    text = SPINNER_RE.sub("", text)
+    text = TIMESTAMP_RE.sub("", text)
+    text = ELAPSED_RE.sub("", text)
+    text = re.sub(r"\bid=[^\s>]+", "", text)
+    lines = []
+    for line in text.lower().splitlines():
+        line = " ".join(line.split())
+        if line:
+            lines.append(line)
+    prompt = load_system_prompt(args.controller_system_prompt)
+    prompt_hash = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+    scope = f"{args.controller_backend}\n{args.controller_model or ''}\n{prompt_hash}"
+    return hashlib.sha1((scope + "\n" + "\n".join(lines)).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """LRU + TTL cache of controller responses, persisted in sqlite.
+
+    Recently used entries are also kept in memory. With path None (or without
+    sqlite) the cache lives only in memory for this run. hits/misses count
+    lookups since startup.
+    """
+
+    def __init__(self, path=None, ttl=3600, max_entries=256):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                "stored_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS used_at_idx ON responses (used_at)")
+            self.evict()
+
+    def _expired(self, stored_at, now):
+        return bool(self.ttl) and stored_at < now - self.ttl
+
+    def _remember(self, key, response, stored_at):
+        self._memory[key] = (response, stored_at)
+        self._memory.move_to_end(key)
+        while self.max_entries and len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None and self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT response, stored_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+            if entry is None or self._expired(entry[1], now):
+                self._memory.pop(key, None)
+                self.misses += 1
+                return None
+            self._remember(key, entry[0], entry[1])
+            if self._conn is not None:
+                self._conn.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, response):
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, stored_at, used_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, response, now, now),
+                )
+                if self.max_entries:
+                    self._conn.execute(
+                        "DELETE FROM responses WHERE key IN ("
+                        "SELECT key FROM responses ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                        (self.max_entries,),
+                    )
+
+    def evict(self):
+        with self._lock:
+            if self._conn is None or not self.ttl:
+                return
+            self._conn.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - self.ttl,))
+
+    def stats(self):
+        return f"hits={self.hits} misses={self.misses}"
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def open_response_cache(args):
+    """Return the controller response cache, or None when it is disabled."""
+    if not args.response_cache:
+        return None
+    path = args.response_cache_path
+    if not path or path == "none" or sqlite3 is None:
+        return ResponseCache(None, ttl=args.response_cache_ttl, max_entries=args.response_cache_size)
+    try:
+        return ResponseCache(path, ttl=args.response_cache_ttl, max_entries=args.response_cache_size)
+    except sqlite3.Error as exc:
+        print(f"[bridge] warning: response cache store unavailable ({exc}); caching in memory only.")
+        return ResponseCache(None, ttl=args.response_cache_ttl, max_entries=args.response_cache_size)
+
+
+METRIC_HELP = {
+    "macs_requests_total": ("counter", "Controller requests finished, by outcome."),
+    "macs_blocks_dropped_total": ("counter", "Heuristic blocks dropped because the request queue was full."),
+    "macs_blocks_deferred_total": ("counter", "Explicit requests held until the request queue had room."),
+    "macs_controller_timeouts_total": ("counter", "Controller requests that timed out."),
+    "macs_empty_responses_total": ("counter", "Controller responses that came back empty."),
+    "macs_controller_restarts_total": ("counter", "Persistent controller processes restarted after exiting."),
+    "macs_response_cache_hits_total": ("counter", "Requests answered from the response cache."),
+    "macs_response_cache_misses_total": ("counter", "Requests not found in the response cache."),
+    "macs_log_bytes_read_total": ("counter", "Bytes of pane output read by the bridge."),
+    "macs_deliveries_merged_total": ("counter", "Queued pane messages merged into an earlier transfer."),
+    "macs_blocks_truncated_total": ("counter", "Blocks over the size caps, sent shortened."),
+    "macs_blocks_abandoned_total": ("counter", "Blocks abandoned with no end marker."),
+    "macs_queue_depth": ("gauge", "Controller requests waiting for a response or for delivery."),
+    "macs_peak_rss_bytes": ("gauge", "Peak resident memory of the bridge process."),
+    "macs_block_buffer_high_water_bytes": ("gauge", "Most bytes of one open block held in memory."),
+    "macs_request_seconds": ("histogram", "Time from request detection to delivery."),
+    "macs_request_phase_seconds": ("histogram", "Time spent in each phase of a request."),
+}
+METRIC_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class Metrics:
+    """Process-wide counters, gauges and histograms, rendered in Prometheus text format."""
+
+    def __init__(self, buckets=METRIC_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * len(self.buckets), 0, 0.0]
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    hist[0][index] += 1
+            hist[1] += 1
+            hist[2] += seconds
+
+    def gauge(self, name, read):
+        """Report read() as gauge name at every scrape."""
+        with self._lock:
+            self._gauges[name] = read
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(h[0]), h[1], h[2]) for key, h in self._histograms.items()}
+            gauges = dict(self._gauges)
+        samples = {}
+        for (name, labels), value in counters.items():
+            samples.setdefault(name, []).append(f"{name}{format_labels(labels)} {value:g}")
+        for name, read in gauges.items():
+            try:
+                value = read()
+            except Exception:
+                continue
+            samples.setdefault(name, []).append(f"{name} {value:g}")
+        for (name, labels), (counts, count, total) in histograms.items():
+            lines = samples.setdefault(name, [])
+            for bound, bucket in zip(self.buckets, counts):
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', f'{bound:g}'),))} {bucket}")
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        out = []
+        for name in sorted(samples):
+            kind, text = METRIC_HELP.get(name, ("untyped", name))
+            out.append(f"# HELP {name} {text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(samples[name])
+        return "\n".join(out) + "\n"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+METRICS = Metrics()
+
+
+class TraceLog:
+    """Appends finished request traces to a JSONL file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record):
+        line = json.dumps(record, sort_keys=True)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+TRACE_LOG = None
+
+
+class RequestTrace:
+    """Timed spans for one controller request, from detection to delivery.
+
+    mark(name) ends the current span and starts the next. finish() records
+    the phase durations in METRICS and appends the trace to TRACE_LOG;
+    marks after that (e.g. from a request that already timed out) are ignored.
+    """
+
+    def __init__(self, req_id, pane_id):
+        self.req_id = req_id
+        self.pane_id = pane_id
+        self.outcome = "sent"
+        self.started_at = time.time()
+        self._start = self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self.spans = [{"name": "detected", "at_ms": 0.0, "ms": 0.0}]
+        self.finished = False
+
+    def mark(self, name):
+        with self._lock:
+            if self.finished:
+                return
+            now = time.monotonic()
+            self.spans.append(
+                {
+                    "name": name,
+                    "at_ms": round((now - self._start) * 1000, 3),
+                    "ms": round((now - self._last) * 1000, 3),
+                }
+            )
+            self._last = now
+
+    def finish(self, outcome=None):
+        with self._lock:
+            if self.finished:
+                return
+            self.finished = True
+            if outcome is not None:
+                self.outcome = outcome
+            total = time.monotonic() - self._start
+        for span in self.spans[1:]:
+            METRICS.observe("macs_request_phase_seconds", span["ms"] / 1000, phase=span["name"])
+        METRICS.observe("macs_request_seconds", total)
+        METRICS.inc("macs_requests_total", outcome=self.outcome)
+        if TRACE_LOG is not None:
+            TRACE_LOG.write(
+                {
+                    "req_id": self.req_id,
+                    "pane": self.pane_id,
+                    "started": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+                    "outcome": self.outcome,
+                    "total_ms": round(total * 1000, 3),
+                    "spans": self.spans,
+                }
+            )
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = METRICS.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class UnixMetricsServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def start_metrics_server(listen):
+    """Serve METRICS over HTTP on 'host:port', ':port' (localhost) or 'unix:/path'."""
+    if listen.startswith("unix:"):
+        path = listen[len("unix:"):]
+        if os.path.exists(path):
+            os.unlink(path)
+        server = UnixMetricsServer(path, MetricsHandler)
+        label = listen
+    else:
+        host, _, port = listen.rpartition(":")
+        server = http.server.ThreadingHTTPServer((host or "127.0.0.1", int(port)), MetricsHandler)
+        server.daemon_threads = True
+        label = f"http://{server.server_address[0]}:{server.server_address[1]}/metrics"
+    thread = threading.Thread(target=server.serve_forever, name="metrics", daemon=True)
+    thread.start()
+    return server, label
+
+
+def write_file(path, content):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+SYSTEM_PROMPT_CACHE = {}
+
+
+def load_system_prompt(path):
+    """Read the controller system prompt, re-reading only when the file changes."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return ""
+    stamp = (st.st_mtime_ns, st.st_size)
+    cached = SYSTEM_PROMPT_CACHE.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read().strip()
+    except OSError:
+        return ""
+    SYSTEM_PROMPT_CACHE[path] = (stamp, text)
+    return text
+
+
+def extract_response_from_text(text):
+    lines = text.splitlines()
+    in_block = False
+    collected = []
+    for line in lines:
+        if not in_block:
+            if RESPONSE_START_RE.search(line):
+                in_block = True
+            continue
+        if RESPONSE_END_RE.search(line):
+            break
+        collected.append(line)
+    if collected:
+        return "\n".join(collected).strip()
+    return text.strip()
+
+
+def normalize_header(line):
+    normalized = line.strip().lower()
+    normalized = re.sub(r"^[\s\-\*\d\.)]+\s*", "", normalized)
+    return normalized
+
+
+def parse_section_header(line):
+    header = normalize_header(line)
+    for section in ("worker instructions", "notes"):
+        if header.startswith(section):
+            remainder = ""
+            if ":" in line:
+                remainder = line.split(":", 1)[1].strip()
+            return section.split()[0], remainder
+    return None, ""
+
+
+def split_worker_and_notes(text):
+    worker_lines = []
+    notes_lines = []
+    section = None
+
+    for line in text.splitlines():
+        parsed_section, remainder = parse_section_header(line)
+        if parsed_section:
+            section = parsed_section
+            if remainder:
+                if section == "worker":
+                    worker_lines.append(remainder)
+                else:
+                    notes_lines.append(remainder)
+            continue
+        if section == "worker":
+            worker_lines.append(line)
+        elif section == "notes":
+            notes_lines.append(line)
+    worker_text = "\n".join(worker_lines).strip()
+    notes_text = "\n".join(notes_lines).strip()
+    return worker_text, notes_text
+
+
+def tail_lines(path, max_lines, block_size=8192):
+    """Return the last max_lines lines of path, reading backwards from EOF."""
+    if max_lines <= 0:
+        return []
+    chunks = []
+    newlines = 0
+    with open(path, "rb") as f:
+        pos = f.seek(0, os.SEEK_END)
+        # One newline beyond max_lines guarantees the first kept line is whole.
+        while pos > 0 and newlines <= max_lines:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step)
+            chunks.append(chunk)
+            newlines += chunk.count(b"\n")
+    data = b"".join(reversed(chunks))
+    return data.decode("utf-8", errors="ignore").splitlines()[-max_lines:]
+
+
+def tail_log_lines(path, max_lines):
+    """tail_lines for a plain log file or a log_sink segment directory."""
+    if not os.path.isdir(path):
+        return tail_lines(path, max_lines)
+    lines = []
+    for entry in reversed(log_sink.read_manifest(path)["segments"]):
+        try:
+            lines = tail_lines(os.path.join(path, entry["name"]), max_lines - len(lines)) + lines
+        except OSError:
+            continue
+        if len(lines) >= max_lines:
+            break
+    return lines
+
+
+def context_line_key(line):
+    """Leading indent and first word (digits folded): lines sharing it are "similar"."""
+    return CONTEXT_DIGITS_RE.sub("0", CONTEXT_KEY_RE.match(line).group())
+
+
+def fold_repeats(lines):
+    """Replace identical consecutive lines with one line and a count."""
+    deduped = []
+    for line in lines:
+        if deduped and line == deduped[-1][0]:
+            if line.strip():
+                deduped[-1][1] += 1
+        else:
+            deduped.append([line, 1])
+    return [line if count == 1 else f"{line}  [x{count}]" for line, count in deduped]
+
+
+def collapse_runs(folded):
+    """Summarize long runs of similar lines.
+
+    A run of at least CONTEXT_RUN_MIN lines with the same key (test results,
+    compiler progress, stack frames; one odd line between two similar ones
+    does not break it) keeps its first two lines, its last line and anything
+    that looks like an error, with the rest replaced by a count.
+    """
+    out = []
+    index = 0
+    while index < len(folded):
+        key = context_line_key(folded[index])
+        end = index + 1
+        while key.strip() and end < len(folded):
+            if context_line_key(folded[end]) == key:
+                end += 1
+            elif end + 1 < len(folded) and context_line_key(folded[end + 1]) == key:
+                end += 2
+            else:
+                break
+        if end - index < CONTEXT_RUN_MIN:
+            out.extend(folded[index:end])
+            index = end
+            continue
+        run = folded[index:end]
+        kept = run[:2]
+        omitted = 0
+        for line in run[2:-1]:
+            if CONTEXT_KEEP_RE.search(line):
+                if omitted:
+                    kept.append(f"[... {omitted} similar lines ...]")
+                    omitted = 0
+                kept.append(line)
+            else:
+                omitted += 1
+        if omitted:
+            kept.append(f"[... {omitted} similar lines ...]")
+        kept.append(run[-1])
+        out.extend(kept)
+        index = end
+    return out
+
+
+def compact_context_lines(lines, budget_bytes, exclude=()):
+    """Fit worker context lines into budget_bytes, keeping the most recent.
+
+    Lines already present in exclude (e.g. the request block) and earlier
+    copies of lines repeated later are dropped, repeats and runs are
+    collapsed, and the result is cut from the oldest end. Overlong lines are
+    shortened.
+    """
+    exclude = set(line for line in exclude if line.strip())
+    lines = fold_repeats(lines)
+    latest = {}
+    for index, line in enumerate(lines):
+        latest[line] = index
+    lines = [
+        line
+        for index, line in enumerate(lines)
+        if not line.strip() or (line not in exclude and latest[line] == index)
+    ]
+    lines = collapse_runs(lines)
+    max_line = max(120, budget_bytes // 4)
+    shortened = []
+    for line in lines:
+        if len(line) > max_line:
+            line = f"{line[:max_line - 40]} [... {len(line) - max_line + 40} more chars]"
+        shortened.append(line)
+    costs = [len(line.encode("utf-8", errors="replace")) + 1 for line in shortened]
+    if sum(costs) <= budget_bytes:
+        return shortened
+    # Leave room for the "earlier lines omitted" note; its count has at most
+    # as many digits as the number of lines.
+    room = budget_bytes - len(f"[... {len(lines)} earlier lines omitted ...]") - 1
+    if room < 0:
+        return []
+    kept = []
+    used = 0
+    for line, cost in zip(reversed(shortened), reversed(costs)):
+        if used + cost > room:
+            break
+        kept.append(line)
+        used += cost
+    kept.reverse()
+    dropped = len(lines) - len(kept)
+    if dropped:
+        kept.insert(0, f"[... {dropped} earlier lines omitted ...]")
+    return kept
+
+
+def read_recent_worker_context(log_path, max_lines, ring=None, budget_bytes=0, exclude=()):
+    """Build worker context from the last max_lines log lines.
+
+    ring is an optional sequence of recent lines kept by the stream parser; once
+    it holds max_lines lines it is used instead of reading the log file. With
+    budget_bytes > 0 the lines are compacted to fit (see compact_context_lines).
+    """
+    if max_lines <= 0:
+        return ""
+    if ring is not None and len(ring) >= max_lines:
+        lines = []
+        for line in list(ring):
+            lines.extend(line.splitlines())
+    else:
+        if not log_path:
+            return ""
+        try:
+            lines = tail_log_lines(log_path, max_lines)
+        except OSError:
+            return ""
+    if not lines:
+        return ""
+    tail = lines[-max_lines:]
+    cleaned = []
+    in_block = False
     for line in tail:
         if START_RE.search(line):
             in_block = True
@@ -310,10 +1723,23 @@ def read_recent_worker_context(log_path, max_lines):
                 in_block = False
             continue
         cleaned.append(line)
+    if budget_bytes > 0:
+        cleaned = compact_context_lines(cleaned, budget_bytes, exclude)
     context = "\n".join(cleaned).strip()
     return context
 
 
+CONTROLLER_RESPONSE_FORMAT = (
+    "Respond with a controller response wrapped in these delimiters:\n"
+    "<<CONTROLLER_RESPONSE>>\n"
+    "WORKER INSTRUCTIONS:\n"
+    "...instructions...\n"
+    "NOTES:\n"
+    "...notes...\n"
+    "<<CONTROLLER_RESPONSE_END>>"
+)
+
+
 def run_codex_controller(block_text, args):
     system_prompt = load_system_prompt(args.controller_system_prompt)
     prompt_parts = []
@@ -321,15 +1747,7 @@ def run_codex_controller(block_text, args):
         prompt_parts.append(system_prompt)
     prompt_parts.append("Controller request:")
     prompt_parts.append(block_text.strip())
-    prompt_parts.append(
-        "Respond with a controller response wrapped in these delimiters:\n"
-        "<<CONTROLLER_RESPONSE>>\n"
-        "WORKER INSTRUCTIONS:\n"
-        "...instructions...\n"
-        "NOTES:\n"
-        "...notes...\n"
-        "<<CONTROLLER_RESPONSE_END>>"
-    )
+    prompt_parts.append(CONTROLLER_RESPONSE_FORMAT)
     prompt = "\n\n".join(prompt_parts)
 
     cmd = ["codex", "exec", "--skip-git-repo-check", prompt, "--sandbox", "read-only"]
@@ -338,282 +1756,2150 @@ def run_codex_controller(block_text, args):
     if args.controller_extra_args:
         cmd.extend(shlex.split(args.controller_extra_args))
 
-    result = subprocess.run(cmd, capture_output=True, text=True)
+    try:
+        result = subprocess.run(
+            cmd, capture_output=True, text=True, timeout=args.controller_timeout or None
+        )
+    except subprocess.TimeoutExpired:
+        print(f"[bridge] warning: codex exec timed out after {args.controller_timeout}s.")
+        METRICS.inc("macs_controller_timeouts_total")
+        return ""
     output = result.stdout.strip()
     if not output:
         output = result.stderr.strip()
     return extract_response_from_text(output)
 
 
-def wait_for_controller_response(log_path, req_id=None, timeout=300):
-    start_time = time.time()
-    last_activity = time.time()
-    buffer = ""
-    in_block = False
-    collected = []
-    start_id = None
-    collecting = False
-    seen_worker = False
-    seen_notes = False
+class ControllerServer:
+    """One long-lived controller process speaking JSON lines on stdin/stdout.
+
+    Every message carries an "id" and every reply echoes it, so several
+    requests can be in flight at once:
+
+        -> {"type": "init", "id": ..., "system_prompt": ..., "response_format": ..., "model": ...}
+        <- {"type": "ready", "id": ...}
+        -> {"type": "request", "id": ..., "prompt": ...}
+        <- {"type": "response", "id": ..., "text": ...}  or  {"type": "error", "id": ..., "error": ...}
+        -> {"type": "ping", "id": ...}
+        <- {"type": "pong", "id": ...}
+
+    Lines that are not JSON objects with a known id are ignored. When the
+    process exits every outstanding call fails at once, and later calls fail
+    without waiting.
+    """
+
+    DEFAULT_TIMEOUT = 600.0
+
+    def __init__(self, command, index=0):
+        self.command = command
+        self.index = index
+        self.started_at = time.monotonic()
+        self.system_prompt = None
+        self.in_flight = 0
+        self._ids = 0
+        self._waiters = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._exited = threading.Event()
+        self._proc = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+        )
+        self._reader = threading.Thread(target=self._read_loop, name=f"controller-{index}", daemon=True)
+        self._reader.start()
+
+    @property
+    def pid(self):
+        return self._proc.pid
+
+    def alive(self):
+        return not self._exited.is_set() and self._proc.poll() is None
+
+    def _read_loop(self):
+        for line in self._proc.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(message, dict):
+                continue
+            with self._lock:
+                waiter = self._waiters.pop(message.get("id"), None)
+            if waiter is not None:
+                waiter[1] = message
+                waiter[0].set()
+        self._proc.stdout.close()
+        self._exited.set()
+        with self._lock:
+            waiters = list(self._waiters.values())
+            self._waiters.clear()
+        for waiter in waiters:
+            waiter[0].set()
+
+    def call(self, message, timeout=None):
+        """Send message and wait for the reply with the same id.
+
+        Returns the reply, or None if the process exited first. Raises
+        TimeoutError if no reply arrives within timeout seconds
+        (DEFAULT_TIMEOUT if None).
+        """
+        if timeout is None:
+            timeout = self.DEFAULT_TIMEOUT
+        with self._lock:
+            # The reader sets _exited before it fails the registered waiters,
+            # so a call registering after that must not wait for a reply.
+            if self._exited.is_set():
+                return None
+            self._ids += 1
+            message = dict(message, id=message.get("id") or f"{message['type']}-{self._ids}")
+            waiter = [threading.Event(), None]
+            self._waiters[message["id"]] = waiter
+            self.in_flight += 1
+        try:
+            try:
+                with self._write_lock:
+                    self._proc.stdin.write(json.dumps(message) + "\n")
+                    self._proc.stdin.flush()
+            except (OSError, ValueError):
+                return None
+            if not waiter[0].wait(timeout):
+                raise TimeoutError(f"no reply to {message['type']} {message['id']} within {timeout}s")
+            return waiter[1]
+        finally:
+            with self._lock:
+                self._waiters.pop(message["id"], None)
+                self.in_flight -= 1
+
+    def init(self, system_prompt, args, timeout=30):
+        reply = self.call(
+            {
+                "type": "init",
+                "system_prompt": system_prompt,
+                "response_format": CONTROLLER_RESPONSE_FORMAT,
+                "model": args.controller_model,
+            },
+            timeout,
+        )
+        if reply is None or reply.get("type") != "ready":
+            raise OSError(f"controller server {self.index} did not become ready")
+        self.system_prompt = system_prompt
+
+    def stop(self, timeout=2.0):
+        try:
+            self._proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self._proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+            self._proc.wait()
+
+
+class ControllerServerPool:
+    """Warm controller processes shared by all requests.
+
+    Each request goes to the live process with the fewest calls in flight.
+    A process that exits, or misses a health-check ping, is replaced. A
+    process that keeps dying soon after starting is restarted with
+    exponential backoff. A request lost to a crash is retried once on a
+    fresh process.
+    """
+
+    PING_TIMEOUT = 10.0
+    QUICK_EXIT = 5.0
+
+    def __init__(self, command, size, args, ping_interval=30.0):
+        self.command = command
+        self.args = args
+        self.ping_interval = ping_interval
+        self.restarts = 0
+        self._servers = [None] * max(1, size)
+        self._failures = [0] * len(self._servers)
+        self._not_before = [0.0] * len(self._servers)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        for index in range(len(self._servers)):
+            self._ensure(index)
+        self._health = threading.Thread(target=self._health_loop, name="controller-health", daemon=True)
+        self._health.start()
+
+    def _ensure(self, index):
+        """Return a live, initialised server for slot index, starting one if needed."""
+        system_prompt = load_system_prompt(self.args.controller_system_prompt)
+        with self._lock:
+            server = self._servers[index]
+            if server is not None and server.alive():
+                if server.system_prompt == system_prompt:
+                    return server
+            elif time.monotonic() < self._not_before[index]:
+                return None
+            else:
+                if server is not None:
+                    self._replaced(index, server)
+                try:
+                    server = ControllerServer(self.command, index)
+                except OSError as exc:
+                    print(f"[bridge] warning: cannot start controller server: {exc}")
+                    self._note_failure(index)
+                    return None
+                self._servers[index] = server
+        try:
+            server.init(system_prompt, self.args)
+        except (OSError, TimeoutError) as exc:
+            print(f"[bridge] warning: {exc}; restarting it.")
+            self._kill(index, server)
+            return None
+        return server
+
+    def _replaced(self, index, server):
+        server.stop(timeout=0)
+        if time.monotonic() - server.started_at < self.QUICK_EXIT:
+            self._note_failure(index)
+        else:
+            self._failures[index] = 0
+        self.restarts += 1
+        METRICS.inc("macs_controller_restarts_total")
+        print(f"[bridge] controller server {index} (pid {server.pid}) exited; restarting.")
+
+    def _note_failure(self, index):
+        self._failures[index] += 1
+        self._not_before[index] = time.monotonic() + min(60.0, 2 ** self._failures[index])
+
+    def _kill(self, index, server):
+        server.stop(timeout=0)
+        with self._lock:
+            if self._servers[index] is server:
+                self._note_failure(index)
+
+    def _pick(self):
+        candidates = []
+        for index in range(len(self._servers)):
+            server = self._ensure(index)
+            if server is not None:
+                candidates.append(server)
+        if not candidates:
+            return None
+        return min(candidates, key=lambda server: server.in_flight)
+
+    def request(self, block_text, req_id, timeout=None):
+        """Return the controller's raw response text, "" on timeout, or None if no server is up."""
+        for attempt in range(2):
+            server = self._pick()
+            if server is None:
+                print("[bridge] warning: no controller server is running.")
+                return None
+            try:
+                reply = server.call({"type": "request", "id": req_id, "prompt": block_text}, timeout)
+            except TimeoutError:
+                print(f"[bridge] warning: controller server timed out after {timeout}s.")
+                METRICS.inc("macs_controller_timeouts_total")
+                return ""
+            if reply is None:
+                print(f"[bridge] warning: controller server {server.index} exited during {req_id}.")
+                continue
+            if reply.get("type") == "error":
+                print(f"[bridge] warning: controller server error for {req_id}: {reply.get('error')}")
+                return ""
+            return str(reply.get("text") or "")
+        return None
+
+    def _health_loop(self):
+        while not self._stop.wait(self.ping_interval):
+            for index, server in enumerate(list(self._servers)):
+                if self._stop.is_set():
+                    return
+                if server is None or not server.alive():
+                    self._ensure(index)
+                    continue
+                try:
+                    reply = server.call({"type": "ping"}, self.PING_TIMEOUT)
+                except TimeoutError:
+                    reply = None
+                if reply is None or reply.get("type") != "pong":
+                    print(f"[bridge] warning: controller server {index} (pid {server.pid}) failed a health check.")
+                    self._kill(index, server)
+
+    def close(self):
+        self._stop.set()
+        for server in self._servers:
+            if server is not None:
+                server.stop()
+
+
+CONTROLLER_SERVERS = None
+
+
+def run_persistent_controller(block_text, args, req_id):
+    if CONTROLLER_SERVERS is None:
+        print("[bridge] warning: persistent controller backend is not running.")
+        return None
+    output = CONTROLLER_SERVERS.request(block_text, req_id, timeout=args.controller_timeout or None)
+    if output is None:
+        return None
+    return extract_response_from_text(output.strip())
+
+
+SPILL_MAX_AGE = 7 * 24 * 3600
+
+
+class BlockLimits:
+    """Caps on one open request or response block (0 = no cap).
+
+    timeout is counted from the start marker; a block still open after it is
+    abandoned. spill_dir is where oversize blocks are written in full, or
+    None to drop their middle.
+    """
+
+    def __init__(self, max_lines=0, max_bytes=0, timeout=0.0, spill_dir=None):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.spill_dir = spill_dir
+
+
+def block_limits(args, spill=True):
+    spill_dir = None
+    if spill and args.block_spill_dir != "none":
+        spill_dir = args.block_spill_dir
+    return BlockLimits(args.max_block_lines, args.max_block_bytes, args.block_timeout, spill_dir)
+
+
+class BlockBuffer:
+    """Lines of one open block, kept within BlockLimits.
+
+    Lines up to the caps are kept in memory. Past them only the last
+    TAIL_LINES are kept, and the whole block goes to a file in the spill
+    directory, if there is one. The tail comes out of the caps: the head
+    stops a quarter of the way short of them (at most TAIL_LINES lines), so
+    head and tail together stay within max_lines and max_bytes. text()
+    returns the kept lines with a note saying how many were left out and
+    where the full block is.
+    """
+
+    TAIL_LINES = 20
+    high_water = 0
+
+    def __init__(self, limits, label="block"):
+        self.limits = limits
+        self.label = label
+        self.started_at = time.monotonic()
+        self.head = []
+        self.tail = deque()
+        self.lines = 0
+        self.bytes = 0
+        self.overflowed = False
+        self.spill_path = None
+        self._spill = None
+        self._digest = None
+        self._token = None
+        self._held = 0
+        self._tail_bytes = 0
+        self.tail_lines = self.TAIL_LINES
+        if limits.max_lines:
+            self.tail_lines = min(self.TAIL_LINES, limits.max_lines // 4)
+        self.tail_max_bytes = limits.max_bytes // 4
+        self._head_lines = limits.max_lines - self.tail_lines
+        self._head_bytes = limits.max_bytes - self.tail_max_bytes
+
+    def append(self, line):
+        size = len(line.encode("utf-8", "replace")) + 1
+        self.lines += 1
+        self.bytes += size
+        limits = self.limits
+        if not self.overflowed and (
+            not self.head
+            or (
+                (not limits.max_lines or len(self.head) < self._head_lines)
+                and (not limits.max_bytes or self._held + size <= self._head_bytes)
+            )
+        ):
+            self.head.append(line)
+            self._held += size
+        else:
+            if not self.overflowed:
+                self.overflowed = True
+                self._open_spill()
+            if self._spill is not None:
+                self._spill.write(line + "\n")
+                self._digest.update(line.encode("utf-8", "replace") + b"\n")
+            self.tail.append((line, size))
+            self._held += size
+            self._tail_bytes += size
+            while self.tail and (
+                len(self.tail) > self.tail_lines
+                or (limits.max_bytes and self._tail_bytes > self.tail_max_bytes)
+            ):
+                dropped = self.tail.popleft()[1]
+                self._held -= dropped
+                self._tail_bytes -= dropped
+        if self._held > BlockBuffer.high_water:
+            BlockBuffer.high_water = self._held
+
+    def _open_spill(self):
+        if not self.limits.spill_dir:
+            return
+        spill_dir = self.limits.spill_dir
+        token = re.sub(r"[^A-Za-z0-9_.-]", "", self.label) or "block"
+        try:
+            os.makedirs(spill_dir, mode=0o700, exist_ok=True)
+            fd, path = tempfile.mkstemp(prefix=f"{token}-", suffix=".tmp", dir=spill_dir)
+            self._spill = os.fdopen(fd, "w", encoding="utf-8", errors="replace")
+            head = "".join(line + "\n" for line in self.head)
+            self._spill.write(head)
+        except OSError as exc:
+            print(f"[bridge] warning: could not spill an oversize block to {spill_dir}: {exc}")
+            self._spill = None
+            return
+        self._digest = hashlib.sha1(head.encode("utf-8", "replace"))
+        self.spill_path = path
+        self._token = token
+
+    def _finish_spill(self):
+        """Close the spill file and name it after its content.
+
+        A repeated block then gets the same name, so its text() is the same.
+        """
+        if self._spill is None:
+            return
+        spill, self._spill = self._spill, None
+        name = f"{self._token}-{self._digest.hexdigest()[:16]}.txt"
+        final = os.path.join(self.limits.spill_dir, name)
+        try:
+            spill.close()
+            os.replace(self.spill_path, final)
+            self.spill_path = final
+        except OSError as exc:
+            print(f"[bridge] warning: could not finish spill file {self.spill_path}: {exc}")
+
+    def expired(self, now=None):
+        if not self.limits.timeout:
+            return False
+        if now is None:
+            now = time.monotonic()
+        return now - self.started_at >= self.limits.timeout
+
+    def deadline(self):
+        if not self.limits.timeout:
+            return None
+        return self.started_at + self.limits.timeout
+
+    def describe(self):
+        where = f", full text in {self.spill_path}" if self.spill_path else ""
+        return f"{self.lines} lines, {self.bytes} bytes{where}"
+
+    def text(self):
+        if not self.overflowed:
+            return "\n".join(self.head)
+        self._finish_spill()
+        omitted = self.lines - len(self.head) - len(self.tail)
+        where = f"; full block in {self.spill_path}" if self.spill_path else ""
+        note = (
+            f"[... {omitted} lines omitted from a {self.lines}-line, "
+            f"{self.bytes}-byte block{where} ...]"
+        )
+        return "\n".join(self.head + [note] + [line for line, _ in self.tail])
+
+    def close(self):
+        """Release the buffer; a spill file is kept for the operator."""
+        self._finish_spill()
+        self.head = []
+        self.tail.clear()
+        self._held = 0
+        self._tail_bytes = 0
+
+
+def prune_spill_dir(directory, max_age=SPILL_MAX_AGE):
+    """Remove spill files older than max_age seconds."""
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    cutoff = time.time() - max_age
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            if name.endswith(".txt") and os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+        except OSError:
+            pass
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def report_memory():
+    print(
+        f"[bridge] peak memory: rss={peak_rss_bytes() / 1048576:.1f} MiB "
+        f"largest block buffer={BlockBuffer.high_water / 1024:.1f} KiB"
+    )
+
+
+class _ResponseWaiter:
+    def __init__(self):
+        self.registered_at = time.monotonic()
+        self.done = threading.Event()
+        self.text = ""
+
+
+class ControllerResponseRouter:
+    """Single reader of the controller pane's output, handing responses to waiting requests.
+
+    Requests register their id before they are sent to the controller pane. The
+    reader thread follows the controller log (or a control-mode feed) and hands
+    each <<CONTROLLER_RESPONSE id=...>> block to the waiter with that id, so
+    several requests can be in flight and answered in any order. A block
+    without an id, or a bare WORKER INSTRUCTIONS ... NOTES reply followed by a
+    second of quiet, goes to the oldest request sent before it began.
+    Responses nobody is waiting for are dropped (quietly if their id was just
+    answered, e.g. a redraw of the same reply). A reply being collected is
+    held in a BlockBuffer, so an endless one is truncated, and one still open
+    after limits.timeout is abandoned.
+    """
+
+    QUIET_SECONDS = 1.0
+
+    def __init__(self, stream, tailer, max_line_bytes=65536, limits=None):
+        self.stream = stream
+        self.tailer = tailer
+        self.limits = limits or BlockLimits()
+        self.closed = False
+        self._reader = LineReader(max_line_bytes)
+        self._lock = threading.Lock()
+        self._waiters = OrderedDict()
+        self._answered = deque(maxlen=64)
+        self._block = None
+        self._reset()
+        self._thread = threading.Thread(target=self._run, name="controller-router", daemon=True)
+        self._thread.start()
+
+    def _reset(self):
+        self._in_block = False
+        self._collecting = False
+        self._seen_notes = False
+        if self._block is not None:
+            self._block.close()
+        self._block = None
+        self._response_id = None
+        self._started_at = 0.0
+        self._last_activity = 0.0
+
+    def register(self, req_id):
+        """Start listening for req_id's response; call before sending the request."""
+        waiter = _ResponseWaiter()
+        with self._lock:
+            self._waiters[req_id] = waiter
+        return waiter
+
+    def discard(self, req_id, waiter):
+        with self._lock:
+            if self._waiters.get(req_id) is waiter:
+                del self._waiters[req_id]
+
+    def wait(self, req_id, waiter, timeout=None):
+        """Return req_id's response text, or "" on timeout or if the reader stops."""
+        try:
+            if not waiter.done.wait(timeout or None):
+                return ""
+            return waiter.text
+        finally:
+            self.discard(req_id, waiter)
+
+    def pending(self):
+        with self._lock:
+            return len(self._waiters)
+
+    def close(self):
+        self.closed = True
+        if hasattr(self.stream, "mark_closed"):
+            self.stream.mark_closed()
+
+    def _run(self):
+        try:
+            while not self.closed:
+                chunk = self.stream.read(65536)
+                if not chunk:
+                    if getattr(self.stream, "closed", False):
+                        return
+                    wait_for = None
+                    now = time.monotonic()
+                    if self._collecting and self._seen_notes:
+                        wait_for = self.QUIET_SECONDS - (now - self._last_activity)
+                        if wait_for <= 0:
+                            self._deliver(None)
+                            continue
+                    if self._block is not None and self._block.deadline() is not None:
+                        if self._block.expired(now):
+                            self._abandon()
+                            continue
+                        remaining = self._block.deadline() - now
+                        wait_for = remaining if wait_for is None else min(wait_for, remaining)
+                    self.tailer.wait(wait_for)
+                    continue
+                for line in self._reader.feed(chunk):
+                    self._feed_line(line)
+        finally:
+            self.closed = True
+            with self._lock:
+                waiters = list(self._waiters.values())
+                self._waiters.clear()
+            for waiter in waiters:
+                waiter.done.set()
+            if self.tailer is not self.stream:
+                self.tailer.close()
+            self.stream.close()
+
+    def _feed_line(self, line):
+        now = time.monotonic()
+        self._last_activity = now
+        if self._in_block:
+            if RESPONSE_END_RE.search(line):
+                self._deliver(self._response_id)
+            else:
+                self._block.append(line)
+            return
+        if RESPONSE_START_RE.search(line):
+            self._reset()
+            self._in_block = True
+            self._block = BlockBuffer(self.limits, "response")
+            self._started_at = self._last_activity = now
+            m = re.search(r"id=([^\s>]+)", line)
+            if m:
+                self._response_id = m.group(1)
+            return
+        header = normalize_header(line)
+        if header.startswith("worker instructions"):
+            self._reset()
+            self._collecting = True
+            self._block = BlockBuffer(self.limits, "response")
+            self._block.append(line)
+            self._started_at = self._last_activity = now
+            return
+        if self._collecting:
+            self._block.append(line)
+            if header.startswith("notes"):
+                self._seen_notes = True
+
+    def _abandon(self):
+        label = f"id={self._response_id}" if self._response_id else "without an id"
+        print(
+            f"[bridge] warning: abandoned a controller response {label} with no end marker after "
+            f"{self.limits.timeout:g}s ({self._block.describe()})."
+        )
+        METRICS.inc("macs_blocks_abandoned_total", source="controller")
+        self._reset()
+
+    def _deliver(self, response_id):
+        started_at = self._started_at
+        text = ""
+        if self._block is not None:
+            if self._block.overflowed:
+                detail = self._block.describe()
+                print(f"[bridge] warning: controller response truncated ({detail}).")
+                METRICS.inc("macs_blocks_truncated_total", source="controller")
+            text = self._block.text()
+        self._reset()
+        with self._lock:
+            if response_id:
+                waiter = self._waiters.pop(response_id, None)
+            else:
+                # Unlabelled: the oldest request that was already sent when the reply began.
+                waiter = None
+                for req_id, candidate in self._waiters.items():
+                    if candidate.registered_at <= started_at:
+                        waiter = self._waiters.pop(req_id)
+                        break
+        if waiter is None:
+            if response_id in self._answered:
+                return
+            label = f"id={response_id}" if response_id else "without an id"
+            print(f"[bridge] warning: dropped a controller response {label} that no request is waiting for.")
+            return
+        if response_id:
+            self._answered.append(response_id)
+        waiter.text = text.strip()
+        waiter.done.set()
+
+
+CONTROLLER_ROUTER = None
+CONTROLLER_ROUTER_LOCK = threading.Lock()
+
+
+def controller_router(args, controller_pane_id):
+    """Return the response router for the controller pane, starting its reader if needed."""
+    global CONTROLLER_ROUTER
+    with CONTROLLER_ROUTER_LOCK:
+        if CONTROLLER_ROUTER is not None and not CONTROLLER_ROUTER.closed:
+            return CONTROLLER_ROUTER
+        if args.tmux_backend == "control":
+            stream = control_client_for(controller_pane_id).subscribe(
+                controller_pane_id, terminal_filter=pane_filter(args)
+            )
+            tailer = stream
+        elif os.path.isdir(args.controller_log):
+            stream = SegmentedLog(
+                args.controller_log, start="end", tail_backend=args.tail_backend, poll_interval=args.poll_interval
+            )
+            tailer = stream
+        else:
+            tailer = open_tailer(args.controller_log, args.tail_backend, args.poll_interval)
+            stream = open(args.controller_log, "rb")
+            stream.seek(0, os.SEEK_END)
+        CONTROLLER_ROUTER = ControllerResponseRouter(
+            stream, tailer, args.max_line_bytes, limits=block_limits(args, spill=False)
+        )
+        return CONTROLLER_ROUTER
+
+
+def run_codex_interactive(block_text, args, controller_pane_id, req_id):
+    lines = [args.controller_command]
+    lines.append(f"<<CONTROLLER_REQUEST id={req_id}>>")
+    lines.extend(block_text.strip().split("\n"))
+    lines.append("<<CONTROLLER_REQUEST_END>>")
+    router = controller_router(args, controller_pane_id)
+    # Registered before sending so the reply cannot slip past.
+    waiter = router.register(req_id)
+    try:
+        pane_delivery(controller_pane_id).submit(
+            "\n".join(lines),
+            delivery=args.delivery,
+            submit=args.submit,
+            submit_delay_ms=args.submit_delay_ms,
+        ).wait()
+    except BaseException:
+        router.discard(req_id, waiter)
+        raise
+    return router.wait(req_id, waiter, args.controller_timeout)
+
+
+def generate_auto_response(block_text):
+    return """WORKER INSTRUCTIONS:
+AUTO MODE PLACEHOLDER
+- Continue with the safest approach.
+- Maintain all security invariants.
+- Report back when complete or blocked.
+
+Requested block:
+{block}
+
+NOTES:
+Auto response generated (no controller backend configured).
+""".format(block=block_text.strip())
+
+
+def generate_empty_controller_response(block_text):
+    return """WORKER INSTRUCTIONS:
+Controller backend did not return a response (timeout or error).
+Please resend the last request and include any critical context or logs.
+
+NOTES:
+Controller backend returned an empty response. Check controller session/logs and retry.
+"""
+
+
+def send_bulk(pane_id, text, submit="enter", submit_delay_ms=0):
+    """Deliver text in one tmux invocation (load-buffer, paste-buffer, submit).
+
+    submit=enter pastes with bracketed paste and presses Enter once, so the
+    text arrives as a single message; submit=lines pastes without bracketing,
+    so each newline submits like the per-line mode; submit=none only pastes.
+    """
+    buf_name = f"macs-bridge-{os.getpid()}-{threading.get_ident()}"
+    paste = ["paste-buffer", "-d", "-b", buf_name, "-t", pane_id]
+    if submit != "lines":
+        paste.insert(1, "-p")
+    args = ["load-buffer", "-b", buf_name, "-", ";"] + paste
+    press_enter = submit in ("enter", "lines")
+    if press_enter and submit_delay_ms <= 0:
+        args.extend([";", "send-keys", "-t", pane_id, "Enter"])
+        press_enter = False
+    run_tmux_input(args, text, check=True)
+    if press_enter:
+        time.sleep(submit_delay_ms / 1000.0)
+        run_tmux(["send-keys", "-t", pane_id, "Enter"], check=True)
+
+
+def send_response(pane_id, response_text, delivery="lines", submit="enter", submit_delay_ms=0):
+    if delivery == "bulk":
+        send_bulk(pane_id, response_text, submit=submit, submit_delay_ms=submit_delay_ms)
+        return
+    for line in response_text.split("\n"):
+        send_line(pane_id, line)
+
+
+def pane_lock_path(pane_id):
+    directory = os.path.join(runtime_dir(), "locks", tmux_server_tag())
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    return os.path.join(directory, f"{pane_id}.lock")
+
+
+class _Delivery:
+    def __init__(self, text, options, callback=None):
+        self.text = text
+        self.options = options
+        self.callback = callback
+        self.error = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        """Block until sent; re-raise a send failure."""
+        self.done.wait(timeout)
+        if self.error is not None:
+            raise self.error
+
+
+class PaneDeliveryQueue:
+    """Ordered deliveries to one tmux pane, sent by that pane's own thread.
+
+    Messages queued while a transfer is in progress go out together in the
+    next one when they share delivery options, so a burst becomes one paste.
+    Each transfer holds a lock file keyed by tmux server and pane (shared with
+    other bridges and send.sh), so deliveries to one pane never interleave
+    while other panes are sent to in parallel. Before each transfer the queue
+    waits for an operator message queued with send.sh --urgent.
+    """
+
+    MERGE_SEPARATOR = "\n\n"
+
+    def __init__(self, pane_id, max_merge_bytes=65536):
+        self.pane_id = pane_id
+        self.max_merge_bytes = max_merge_bytes
+        self.lock_path = pane_lock_path(pane_id)
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=f"deliver-{pane_id}", daemon=True)
+        self._thread.start()
+
+    def submit(self, text, delivery="lines", submit="enter", submit_delay_ms=0, callback=None):
+        """Queue text for the pane; callback(error) runs once it is sent (or failed)."""
+        item = _Delivery(text, (delivery, submit, submit_delay_ms), callback)
+        with self._cond:
+            self._queue.append(item)
+            self._cond.notify()
+        return item
+
+    def pending(self):
+        with self._cond:
+            return len(self._queue)
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            batch = [self._queue.popleft()]
+            size = len(batch[0].text)
+            while self._queue and self._queue[0].options == batch[0].options:
+                size += len(self._queue[0].text)
+                if size > self.max_merge_bytes:
+                    break
+                batch.append(self._queue.popleft())
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if len(batch) > 1:
+                METRICS.inc("macs_deliveries_merged_total", len(batch) - 1)
+            error = None
+            try:
+                self._yield_to_operator()
+                delivery, submit, submit_delay_ms = batch[0].options
+                # Per-line sends of a merged batch match separate sends exactly.
+                separator = self.MERGE_SEPARATOR if delivery == "bulk" else "\n"
+                with send_lock(self.lock_path):
+                    send_response(
+                        self.pane_id,
+                        separator.join(item.text for item in batch),
+                        delivery=delivery,
+                        submit=submit,
+                        submit_delay_ms=submit_delay_ms,
+                    )
+            except Exception as exc:
+                print(f"[bridge] error sending to pane {self.pane_id}: {exc}")
+                error = exc
+            for item in batch:
+                item.error = error
+                item.done.set()
+                if item.callback is not None:
+                    try:
+                        item.callback(error)
+                    except Exception as exc:
+                        print(f"[bridge] error after sending to pane {self.pane_id}: {exc}")
+
+    def _yield_to_operator(self):
+        marker = self.lock_path + URGENT_MARKER_SUFFIX
+        while True:
+            try:
+                age = time.time() - os.path.getmtime(marker)
+            except OSError:
+                return
+            if age > URGENT_MARKER_MAX_AGE:
+                return
+            time.sleep(0.05)
+
+
+DELIVERY_QUEUES = {}
+DELIVERY_QUEUES_LOCK = threading.Lock()
+
+
+def pane_delivery(pane_id):
+    """Return the delivery queue for pane_id, starting it if needed."""
+    with DELIVERY_QUEUES_LOCK:
+        queue = DELIVERY_QUEUES.get(pane_id)
+        if queue is None:
+            queue = DELIVERY_QUEUES[pane_id] = PaneDeliveryQueue(pane_id)
+        return queue
+
+
+RESPONSE_SUFFIX = ".response.txt"
+
+
+class OutboxWatcher:
+    """Waits on the outbox for the responses to any number of manual-mode requests.
+
+    One thread watches the directory (inotify on close-after-write and rename,
+    else a directory listing every poll interval) and completes each pending
+    request's Future with the text of its <id>.response.txt once it appears,
+    so the bridge keeps capturing requests while an operator answers them in
+    any order. A cancelled Future (the request timed out) is forgotten, and a
+    response written for it later is ignored.
+    """
+
+    def __init__(self, directory, tail_backend="auto", poll_interval=0.5, heartbeat=5.0):
+        self.directory = directory
+        self.interval = poll_interval
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._inotify = None
+        if tail_backend != "poll":
+            try:
+                self._inotify = Inotify()
+                self._inotify.add_watch(directory, IN_CLOSE_WRITE | IN_MOVED_TO)
+                # Events do the work; the heartbeat only catches anything missed.
+                self.interval = heartbeat
+            except OSError as exc:
+                if self._inotify is not None:
+                    self._inotify.close()
+                    self._inotify = None
+                if tail_backend == "inotify":
+                    raise
+                print(f"[bridge] inotify unavailable for the outbox ({exc}); falling back to polling.")
+        self.name = "inotify" if self._inotify is not None else "poll"
+        self._thread = threading.Thread(target=self._run, name="outbox-watcher", daemon=True)
+        self._thread.start()
+
+    def expect(self, req_id):
+        """Return a Future for req_id's response text."""
+        future = Future()
+        with self._lock:
+            self._pending[req_id] = future
+        future.add_done_callback(functools.partial(self._forget, req_id))
+        # The operator may have answered already.
+        self._check(req_id)
+        return future
+
+    def _forget(self, req_id, future):
+        with self._lock:
+            if self._pending.get(req_id) is future:
+                del self._pending[req_id]
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _check(self, req_id):
+        path = os.path.join(self.directory, f"{req_id}{RESPONSE_SUFFIX}")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            return
+        except OSError as exc:
+            print(f"[bridge] warning: could not read {path}: {exc}")
+            return
+        with self._lock:
+            future = self._pending.pop(req_id, None)
+        if future is not None:
+            try:
+                future.set_result(text)
+            except InvalidStateError:
+                pass
+
+    def _run(self):
+        while True:
+            names = None
+            if self._inotify is not None:
+                events = self._inotify.wait(self.interval)
+                # An empty name is a queue overflow: rescan everything.
+                if events and all(name for _, _, name in events):
+                    names = {name for _, _, name in events}
+            else:
+                time.sleep(self.interval)
+            if names is None:
+                try:
+                    names = set(os.listdir(self.directory))
+                except OSError:
+                    continue
+            with self._lock:
+                ready = [req_id for req_id in self._pending if f"{req_id}{RESPONSE_SUFFIX}" in names]
+            for req_id in ready:
+                self._check(req_id)
+
+
+OUTBOX_WATCHER = None
+OUTBOX_WATCHER_LOCK = threading.Lock()
+
+
+def outbox_watcher(args):
+    """Return the outbox watcher, starting it on first use."""
+    global OUTBOX_WATCHER
+    with OUTBOX_WATCHER_LOCK:
+        if OUTBOX_WATCHER is None:
+            OUTBOX_WATCHER = OutboxWatcher(OUTBOX_DIR, args.tail_backend, args.poll_interval)
+        return OUTBOX_WATCHER
+
+
+def announce_manual_request(req_id, args):
+    inbox_path = os.path.join(INBOX_DIR, f"{req_id}.request.txt")
+    response_path = os.path.join(OUTBOX_DIR, f"{req_id}{RESPONSE_SUFFIX}")
+    print(f"Controller request captured: {inbox_path}")
+    print(f"Write response to: {response_path}")
+    waiting = outbox_watcher(args).pending()
+    if waiting:
+        print(f"[bridge] {waiting + 1} manual requests pending (--list-pending to review)")
+
+
+def format_age(seconds):
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size:
+            return f"{int(seconds // size)}{unit}"
+    return f"{int(seconds)}s"
+
+
+def request_summary(text, width=72):
+    """First line of a request that is not a marker, cut to width."""
+    for line in text.splitlines():
+        line = line.strip()
+        if line and REQUEST_MARKER not in line:
+            return line if len(line) <= width else line[: width - 3] + "..."
+    return ""
+
+
+def list_pending_requests():
+    """Print inbox requests that have no response in the outbox yet, oldest first."""
+    rows = []
+    try:
+        names = os.listdir(INBOX_DIR)
+        answered = set(os.listdir(OUTBOX_DIR)) if os.path.isdir(OUTBOX_DIR) else set()
+    except OSError:
+        names = []
+    now = time.time()
+    for name in names:
+        if not name.endswith(".request.txt"):
+            continue
+        req_id = name[: -len(".request.txt")]
+        if f"{req_id}{RESPONSE_SUFFIX}" in answered:
+            continue
+        path = os.path.join(INBOX_DIR, name)
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                summary = request_summary(f.read())
+            age = now - os.path.getmtime(path)
+        except OSError:
+            continue
+        rows.append((age, req_id, summary))
+    rows.sort(reverse=True)
+    print(f"{len(rows)} pending requests; answer with {OUTBOX_DIR}/<id>{RESPONSE_SUFFIX}")
+    for age, req_id, summary in rows:
+        print(f"{req_id}  {format_age(age):>4}  {summary}")
+
+
+def writes_inbox(args):
+    # The inbox/outbox files are the interface in manual mode; a packed
+    # archive otherwise keeps requests and responses only in the pack.
+    return args.mode == "manual" or ARCHIVE_STORE is None
+
+
+def record_request(block_text, seen_hashes, dedupe_scope=None, write_inbox=True):
+    """Dedupe a detected block, archive it and write it to the inbox; return its id or None."""
+    if dedupe_scope:
+        # Identical text from different panes is a separate request per pane.
+        block_hash = stable_id(f"{dedupe_scope}\n{block_text}")
+    else:
+        block_hash = stable_id(block_text)
+    if block_hash in seen_hashes:
+        return None
+    seen_hashes.add(block_hash)
+
+    req_id = f"{timestamp()}_{block_hash}"
+    if write_inbox:
+        write_file(os.path.join(INBOX_DIR, f"{req_id}.request.txt"), block_text)
+    archive_text(req_id, "request", block_text, block_hash)
+    return req_id
+
+
+def run_controller_backend(controller_block, args, controller_pane_id, req_id):
+    if args.controller_backend == "codex-interactive":
+        if not controller_pane_id:
+            print("Controller pane not configured for interactive backend.")
+            return None
+        return run_codex_interactive(controller_block, args, controller_pane_id, req_id)
+    if args.controller_backend == "codex":
+        return run_codex_controller(controller_block, args)
+    if args.controller_backend == "persistent":
+        return run_persistent_controller(controller_block, args, req_id)
+    return generate_auto_response(controller_block)
+
+
+def resolve_request(
+    req_id,
+    block_text,
+    args,
+    controller_pane_id=None,
+    context_ring=None,
+    worker_log=None,
+    response_cache=None,
+    trace=None,
+):
+    """Get the controller response for a recorded request in auto mode (may block for minutes).
+
+    Manual-mode requests never come here: they wait on an OutboxWatcher future.
+    """
+    if trace is not None:
+        trace.mark("queued")
+    controller_block = block_text
+    if args.worker_context_lines > 0:
+        budget_bytes = args.worker_context_budget * CONTEXT_BYTES_PER_TOKEN
+        context = read_recent_worker_context(
+            worker_log or args.log,
+            args.worker_context_lines,
+            ring=context_ring,
+            budget_bytes=budget_bytes,
+            exclude=block_text.splitlines(),
+        )
+        if context and budget_bytes > 0:
+            size = len(context.encode("utf-8", errors="replace"))
+            print(
+                f"[bridge] worker context for {req_id}: {size} bytes "
+                f"(~{size // CONTEXT_BYTES_PER_TOKEN} of {args.worker_context_budget} tokens)"
+            )
+        if context:
+            controller_block = (
+                f"{block_text.strip()}\n\n[WORKER_CONTEXT]\n{context}\n"
+            )
+    if trace is not None:
+        trace.mark("context_built")
+    cache_key = None
+    response_text = None
+    if response_cache is not None and args.controller_backend != "none":
+        # Keyed on the request alone: the worker context differs every time.
+        cache_key = request_fingerprint(block_text, args)
+        response_text = response_cache.get(cache_key)
+        if response_text is not None:
+            METRICS.inc("macs_response_cache_hits_total")
+            print(f"[bridge] response cache hit for {req_id} ({response_cache.stats()})")
+            if trace is not None:
+                trace.outcome = "cached"
+                trace.mark("response_received")
+        else:
+            METRICS.inc("macs_response_cache_misses_total")
+    if response_text is None:
+        if trace is not None:
+            trace.mark("controller_dispatch")
+        response_text = run_controller_backend(controller_block, args, controller_pane_id, req_id)
+        if trace is not None:
+            trace.mark("response_received")
+        if response_text is None:
+            return None
+        if cache_key is not None and response_text.strip():
+            response_cache.put(cache_key, response_text)
+    if not response_text.strip():
+        print("[bridge] warning: Controller backend returned empty response; sending retry guidance.")
+        METRICS.inc("macs_empty_responses_total")
+        if trace is not None:
+            trace.outcome = "empty"
+        response_text = generate_empty_controller_response(controller_block)
+    if ARCHIVE_STORE is None:
+        response_path = os.path.join(OUTBOX_DIR, f"{req_id}.response.txt")
+        write_file(response_path, response_text)
+
+    archive_text(req_id, "response", response_text)
+    return response_text
+
+
+def deliver_response(response_text, args, pane_id, trace=None):
+    """Send a resolved response to the worker pane (NOTES are printed locally)."""
+    if response_text is None:
+        if trace is not None:
+            trace.finish("no_response")
+        return
+    if args.split_response:
+        worker_text, notes_text = split_worker_and_notes(response_text)
+        if worker_text:
+            response_text = worker_text
+        else:
+            print("[bridge] warning: could not find WORKER INSTRUCTIONS section; sending full response.")
+        if notes_text:
+            print("[notes]")
+            print(notes_text)
+        if trace is not None:
+            trace.mark("response_split")
+
+    if args.dry_run:
+        print("[dry-run] would send response:")
+        print(response_text)
+        if trace is not None:
+            trace.mark("delivered")
+            trace.finish()
+        return
+
+    print(f"[bridge] sending to worker pane {pane_id} ({len(response_text.splitlines())} lines)")
+
+    def sent(error):
+        if trace is None:
+            return
+        if error is not None:
+            trace.finish("error")
+            return
+        trace.mark("delivered")
+        trace.finish()
+
+    pane_delivery(pane_id).submit(
+        response_text,
+        delivery=args.delivery,
+        submit=args.submit,
+        submit_delay_ms=args.submit_delay_ms,
+        callback=sent,
+    )
+
+
+def handle_block(block_text, seen_hashes):
+    """Write a block found by --simulate-log to the inbox; nothing is sent."""
+    req_id = record_request(block_text, seen_hashes)
+    if req_id is None:
+        return
+    print(f"[simulate] wrote {os.path.join(INBOX_DIR, f'{req_id}.request.txt')}")
+
+
+class _PipelineEntry:
+    def __init__(self, deliver, deadline, on_timeout):
+        self.deliver = deliver
+        self.deadline = deadline
+        self.on_timeout = on_timeout
+        self.future = None
+        self.timed_out = False
+
+    def ready(self):
+        return self.timed_out or (self.future is not None and self.future.done())
+
+
+class RequestPipeline:
+    """Resolves controller requests on a thread pool, off the log-reading thread.
+
+    Responses are delivered strictly in submission order per key (the worker
+    pane), so a slow request only holds back later responses to the same pane.
+    Requests still unresolved after their timeout are given up: on_timeout runs
+    in place of delivery and a late result is discarded. A request resolved
+    elsewhere (a manual-mode response file) is submitted as a Future and holds
+    no pool thread. has_capacity() is the backpressure check callers make
+    before recording a new request; a request that must not be shed is
+    handed to defer() instead and started, in arrival order, once there is
+    room for it.
+    """
+
+    def __init__(self, workers=4, max_pending=32, max_pending_per_key=8):
+        self.max_pending = max_pending
+        self.max_pending_per_key = max_pending_per_key
+        self.timeouts = 0
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="controller")
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._draining = set()
+        self._pending = 0
+        self._deferred = deque()
+        self._release_lock = threading.RLock()
+        self._stop = threading.Event()
+        self._watchdog = threading.Thread(target=self._watch_timeouts, name="pipeline-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def pending(self, key=None):
+        with self._lock:
+            if key is None:
+                return self._pending + len(self._deferred)
+            deferred = sum(1 for deferred_key, _ in self._deferred if deferred_key == key)
+            return len(self._queues.get(key, ())) + deferred
+
+    def _room(self, key):
+        if self.max_pending and self._pending >= self.max_pending:
+            return False
+        if self.max_pending_per_key and len(self._queues.get(key, ())) >= self.max_pending_per_key:
+            return False
+        return True
+
+    def has_capacity(self, key):
+        with self._lock:
+            return not self._deferred and self._room(key)
+
+    def defer(self, key, start):
+        """Call start() once there is room for another request on key, after earlier deferrals."""
+        with self._lock:
+            self._deferred.append((key, start))
+        self._release_deferred()
+
+    def _release_deferred(self):
+        # One releaser at a time keeps each key's deferrals in order; re-entrant
+        # because start() may finish and drain synchronously.
+        with self._release_lock:
+            while True:
+                with self._lock:
+                    blocked = set()
+                    for index, (key, start) in enumerate(self._deferred):
+                        if key not in blocked and self._room(key):
+                            del self._deferred[index]
+                            break
+                        blocked.add(key)
+                    else:
+                        return
+                try:
+                    start()
+                except Exception as exc:
+                    print(f"[bridge] error starting a deferred request for pane {key}: {exc}")
+
+    def submit(self, key, resolve, deliver, timeout=None, on_timeout=None, future=None):
+        deadline = time.monotonic() + timeout if timeout else None
+        entry = _PipelineEntry(deliver, deadline, on_timeout)
+        with self._lock:
+            self._queues.setdefault(key, deque()).append(entry)
+            self._pending += 1
+            entry.future = future if future is not None else self._executor.submit(resolve)
+        entry.future.add_done_callback(lambda _future: self._drain(key))
+
+    def _drain(self, key):
+        with self._lock:
+            if key in self._draining:
+                return
+            self._draining.add(key)
+        while True:
+            with self._lock:
+                queue = self._queues.get(key)
+                if not queue or not queue[0].ready():
+                    self._draining.discard(key)
+                    if queue is not None and not queue:
+                        del self._queues[key]
+                    return
+                entry = queue.popleft()
+            try:
+                if entry.timed_out:
+                    if entry.on_timeout is not None:
+                        entry.on_timeout()
+                else:
+                    try:
+                        result = entry.future.result()
+                    except Exception as exc:
+                        print(f"[bridge] error resolving request for pane {key}: {exc}")
+                    else:
+                        entry.deliver(result)
+            except Exception as exc:
+                print(f"[bridge] error delivering response to pane {key}: {exc}")
+            finally:
+                with self._lock:
+                    self._pending -= 1
+                    released = bool(self._deferred)
+                if released:
+                    self._release_deferred()
+
+    def _watch_timeouts(self):
+        while not self._stop.wait(0.5):
+            now = time.monotonic()
+            expired = []
+            with self._lock:
+                for key, queue in self._queues.items():
+                    for entry in queue:
+                        if entry.deadline and not entry.ready() and now >= entry.deadline:
+                            entry.timed_out = True
+                            expired.append((key, entry))
+            # Outside the lock: cancelling a pending Future runs its done
+            # callback, _drain, at once.
+            for _, entry in expired:
+                entry.future.cancel()
+            for key in set(key for key, _ in expired):
+                self.timeouts += 1
+                self._drain(key)
+
+    def close(self, wait=False):
+        self._stop.set()
+        self._executor.shutdown(wait=wait)
+
+
+def dispatch_block(
+    block_text,
+    args,
+    pane_id,
+    seen_hashes,
+    pipeline,
+    controller_pane_id=None,
+    context_ring=None,
+    worker_log=None,
+    dedupe_scope=None,
+    response_cache=None,
+):
+    """Record a detected block and queue it on the pipeline without blocking.
+
+    Under backpressure heuristic blocks are dropped; explicit requests are
+    recorded and deferred until the pipeline has room, so none is lost.
+    """
+    has_capacity = pipeline.has_capacity(pane_id)
+    if not has_capacity and is_heuristic_block(block_text):
+        # Checked before recording so a dropped block is not marked as seen.
+        METRICS.inc("macs_blocks_dropped_total")
+        print(
+            f"[bridge] warning: {pipeline.pending()} controller requests pending "
+            f"({pipeline.pending(pane_id)} for pane {pane_id}); dropped a heuristic block."
+        )
+        return
+    req_id = record_request(block_text, seen_hashes, dedupe_scope, writes_inbox(args))
+    if req_id is None:
+        return
+    trace = RequestTrace(req_id, pane_id)
+    # Snapshot the context now: the ring keeps moving while the request waits.
+    context = list(context_ring) if context_ring is not None else None
+    start = functools.partial(
+        start_request,
+        req_id,
+        block_text,
+        args,
+        pane_id,
+        pipeline,
+        trace,
+        controller_pane_id=controller_pane_id,
+        context=context,
+        worker_log=worker_log,
+        response_cache=response_cache,
+    )
+    if has_capacity:
+        start()
+        return
+    METRICS.inc("macs_blocks_deferred_total")
+    print(
+        f"[bridge] {pipeline.pending()} controller requests pending "
+        f"({pipeline.pending(pane_id)} for pane {pane_id}); {req_id} waits for a free slot."
+    )
+    pipeline.defer(pane_id, start)
+
+
+def start_request(
+    req_id,
+    block_text,
+    args,
+    pane_id,
+    pipeline,
+    trace,
+    controller_pane_id=None,
+    context=None,
+    worker_log=None,
+    response_cache=None,
+):
+    """Submit a recorded request to the pipeline for resolution and delivery."""
+
+    def resolve():
+        try:
+            return resolve_request(
+                req_id,
+                block_text,
+                args,
+                controller_pane_id=controller_pane_id,
+                context_ring=context,
+                worker_log=worker_log,
+                response_cache=response_cache,
+                trace=trace,
+            )
+        except Exception:
+            trace.finish("error")
+            raise
+
+    deliver = functools.partial(deliver_response, args=args, pane_id=pane_id, trace=trace)
+
+    if args.mode == "manual":
+        # Wait on the outbox watcher, not a pool thread: any number can be pending.
+        trace.mark("queued")
+        announce_manual_request(req_id, args)
+
+        def deliver_manual(response_text):
+            trace.mark("response_received")
+            archive_text(req_id, "response", response_text)
+            deliver(response_text)
+
+        def on_manual_timeout():
+            print(
+                f"[bridge] warning: no response to manual request {req_id} after "
+                f"{args.manual_timeout}s; sending retry guidance."
+            )
+            METRICS.inc("macs_controller_timeouts_total")
+            trace.outcome = "timeout"
+            deliver(generate_empty_controller_response(block_text))
+
+        pipeline.submit(
+            pane_id,
+            None,
+            deliver_manual,
+            timeout=args.manual_timeout or None,
+            on_timeout=on_manual_timeout,
+            future=outbox_watcher(args).expect(req_id),
+        )
+        return
+
+    def on_timeout():
+        print(f"[bridge] warning: controller request {req_id} timed out; sending retry guidance.")
+        METRICS.inc("macs_controller_timeouts_total")
+        trace.outcome = "timeout"
+        deliver(generate_empty_controller_response(block_text))
+
+    timeout = None
+    if args.mode == "auto" and args.controller_timeout > 0:
+        # Backends enforce controller_timeout themselves; this is the backstop.
+        timeout = args.controller_timeout + 30
+    pipeline.submit(pane_id, resolve, deliver, timeout=timeout, on_timeout=on_timeout)
+
+
+def is_heuristic_trigger(line):
+    if line.endswith("?") and QUESTION_RE.search(line):
+        return True
+    lowered = line.lower()
+    if not line.isascii():
+        lowered = lowered.translate(TRIGGER_FOLD)
+    for keyword in TRIGGER_KEYWORDS:
+        if keyword in lowered:
+            return TRIGGER_RE.search(line) is not None
+    return False
+
+
+def classify_line(line, triggers=True):
+    """Return the LINE_* flags that apply to line.
+
+    Request markers are only looked for when REQUEST_MARKER appears in the line,
+    and heuristic triggers (if triggers is true) only when a keyword does, so
+    the common no-match line costs a few substring checks.
+    """
+    flags = 0
+    if REQUEST_MARKER in line:
+        if START_RE.search(line):
+            flags |= LINE_START
+        if END_RE.search(line):
+            flags |= LINE_END
+    if triggers and is_heuristic_trigger(line):
+        flags |= LINE_TRIGGER
+    return flags
+
+
+HEURISTIC_BLOCK_START = "<<CONTROLLER_REQUEST heuristic>>"
+
+
+def build_heuristic_block(lines):
+    return "\n".join([HEURISTIC_BLOCK_START] + lines + ["<<CONTROLLER_REQUEST_END>>"])
+
+
+def is_heuristic_block(block_text):
+    return block_text.startswith(HEURISTIC_BLOCK_START)
+
+
+class PaneStatus:
+    """BUSY/IDLE state of a worker pane, kept from its output for status.sh.
+
+    The pane is BUSY from the first busy status line ("esc to interrupt") until
+    none has been seen for idle_after seconds. A TUI that only repaints changed
+    cells, or escapes in a raw log, can split that line so it no longer
+    matches while the agent works, so before turning IDLE confirm_busy (if
+    given) is asked; while it returns true the pane stays BUSY for another
+    idle_after. Every change rewrites <directory>/<pane id> as "STATE SINCE
+    PID SESSION", which status.sh reads instead of capturing the pane. Callers
+    drive the idle timer with tick() and tick_delay().
+    """
+
+    def __init__(self, pane_id, directory, session="", idle_after=3.0, busy=False, confirm_busy=None):
+        self.pane_id = pane_id
+        self.path = os.path.join(directory, pane_id)
+        self.session = session
+        self.idle_after = idle_after
+        self.confirm_busy = confirm_busy
+        self.state = None
+        self.since = None
+        self.busy_until = None
+        if busy:
+            self.busy_until = time.monotonic() + idle_after
+        self._set("BUSY" if busy else "IDLE")
+
+    def feed_line(self, line):
+        # Most lines have no " to " at all, so the regex rarely runs.
+        if " to " in line and BUSY_RE.search(line):
+            self.busy_until = time.monotonic() + self.idle_after
+            self._set("BUSY")
+
+    def tick(self, now=None):
+        if self.busy_until is None:
+            return
+        if now is None:
+            now = time.monotonic()
+        if now < self.busy_until:
+            return
+        if self.confirm_busy is not None and self.confirm_busy():
+            self.busy_until = now + self.idle_after
+            return
+        self.busy_until = None
+        self._set("IDLE")
+
+    def tick_delay(self):
+        if self.busy_until is None:
+            return None
+        return max(0.0, self.busy_until - time.monotonic())
+
+    def _set(self, state):
+        if state == self.state:
+            return
+        self.state = state
+        self.since = time.time()
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(f"{state} {self.since:.3f} {os.getpid()} {self.session}\n")
+            os.replace(tmp_path, self.path)
+        except OSError as exc:
+            print(f"[bridge] warning: could not write pane status {self.path}: {exc}")
+
+    def close(self):
+        """Remove the status file if this process still owns it."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                owner = f.read().split()[2]
+            if owner == str(os.getpid()):
+                os.unlink(self.path)
+        except (OSError, IndexError):
+            pass
+
+
+def pane_shows_busy(pane_id):
+    """Whether the last lines on pane_id's screen include a busy status line."""
+    screen = run_tmux(["capture-pane", "-p", "-t", pane_id, "-S", "-40"], capture=True)
+    return BUSY_RE.search(screen) is not None
+
+
+def default_status_dir():
+    if os.environ.get("MACS_STATUS_DIR"):
+        return os.environ["MACS_STATUS_DIR"]
+    return os.path.join(runtime_dir(), "status")
+
+
+def open_pane_status(pane_id, args):
+    """Start publishing pane_id's BUSY/IDLE state, or return None if disabled."""
+    if args.status_dir == "none":
+        return None
+    directory = os.path.join(args.status_dir, tmux_server_tag())
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        session = run_tmux(["display-message", "-p", "-t", pane_id, "#{session_name}"], capture=True).strip()
+        busy = pane_shows_busy(pane_id)
+    except (OSError, subprocess.CalledProcessError) as exc:
+        print(f"[bridge] warning: pane status for {pane_id} disabled: {exc}")
+        return None
+
+    def confirm_busy():
+        try:
+            return pane_shows_busy(pane_id)
+        except (OSError, subprocess.SubprocessError):
+            return False
+
+    status = PaneStatus(
+        pane_id,
+        directory,
+        session=session,
+        idle_after=args.status_idle_after,
+        busy=busy,
+        confirm_busy=confirm_busy,
+    )
+    atexit.register(status.close)
+    return status
+
+
+class BlockParser:
+    """Line-at-a-time request detector shared by the stream and file parsers.
+
+    Calls on_block with the text of each delimited request block and, when
+    heuristics are enabled, with a heuristic block built from recent lines.
+
+    With heuristic_quiet > 0 a heuristic trigger is held until the pane has
+    been quiet that many seconds, so a burst of triggers ("Done. Tests pass.
+    Anything else?") becomes one block. The held trigger is dropped if a busy
+    status line or an explicit request follows it, and sent early if it is
+    about to scroll out of the recent-lines window. Callers drive the timer
+    with tick() and tick_delay(), which also drive an optional PaneStatus
+    fed with the same lines.
+
+    An open request block is held in a BlockBuffer under limits: an oversize
+    block is sent as its first and last lines, and one with no end marker
+    after limits.timeout is abandoned without being sent.
+    """
+
+    def __init__(
+        self,
+        on_block,
+        heuristic_enabled=False,
+        heuristic_lines=20,
+        context_ring=None,
+        heuristic_quiet=0.0,
+        status=None,
+        limits=None,
+        label="worker",
+    ):
+        self.on_block = on_block
+        self.status = status
+        self.limits = limits or BlockLimits()
+        self.label = label
+        self.heuristic_enabled = heuristic_enabled
+        self.heuristic_quiet = heuristic_quiet
+        self.context_ring = context_ring
+        self.recent_lines = deque(maxlen=heuristic_lines)
+        self.in_block = False
+        self.block = None
+        self.heuristic_deadline = None
+        self._heuristic_room = 0
+
+    def feed_line(self, line):
+        self.recent_lines.append(line)
+        if self.context_ring is not None:
+            self.context_ring.append(line)
+        if self.status is not None:
+            self.status.feed_line(line)
+        flags = classify_line(line, self.heuristic_enabled and not self.in_block)
+        if not self.in_block:
+            if flags & LINE_START:
+                # An explicit request supersedes a held heuristic trigger.
+                self.heuristic_deadline = None
+                self.in_block = True
+                self.block = BlockBuffer(self.limits, f"request-{self.label}")
+                self.block.append(line)
+                if flags & LINE_END:
+                    self._emit_block()
+                return
+            if self.heuristic_deadline is not None or flags & LINE_TRIGGER:
+                self._debounce(line, flags & LINE_TRIGGER)
+            return
+        self.block.append(line)
+        if flags & LINE_END:
+            self._emit_block()
+
+    def _debounce(self, line, triggered):
+        if BUSY_RE.search(line):
+            self.heuristic_deadline = None
+            return
+        if self.heuristic_quiet <= 0:
+            if triggered:
+                self.on_block(build_heuristic_block(list(self.recent_lines)))
+            return
+        if self.heuristic_deadline is None:
+            # Lines that can follow the first trigger before it leaves the window.
+            self._heuristic_room = self.recent_lines.maxlen - 1
+        else:
+            self._heuristic_room -= 1
+        self.heuristic_deadline = time.monotonic() + self.heuristic_quiet
+        if self._heuristic_room <= 0:
+            self.flush_heuristic()
+
+    def tick(self, now=None):
+        """Send a held heuristic block once it has been quiet long enough.
+
+        Also abandons an open block that has passed its timeout.
+        """
+        if now is None:
+            now = time.monotonic()
+        if self.status is not None:
+            self.status.tick(now)
+        if self.heuristic_deadline is not None and now >= self.heuristic_deadline:
+            self.flush_heuristic()
+        if self.in_block and self.block.expired(now):
+            self.abandon_block(f"no end marker after {self.limits.timeout:g}s")
+
+    def tick_delay(self):
+        """Seconds until tick() has work to do, or None if nothing is held."""
+        now = time.monotonic()
+        delays = []
+        if self.heuristic_deadline is not None:
+            delays.append(max(0.0, self.heuristic_deadline - now))
+        if self.status is not None and self.status.tick_delay() is not None:
+            delays.append(self.status.tick_delay())
+        if self.in_block and self.block.deadline() is not None:
+            delays.append(max(0.0, self.block.deadline() - now))
+        return min(delays) if delays else None
+
+    def flush_heuristic(self):
+        """Send a held heuristic block now."""
+        if self.heuristic_deadline is None:
+            return
+        self.heuristic_deadline = None
+        self.on_block(build_heuristic_block(list(self.recent_lines)))
 
-    with open(log_path, "r", encoding="utf-8", errors="ignore") as f:
-        f.seek(0, os.SEEK_END)
-        while True:
-            if timeout and time.time() - start_time > timeout:
-                return ""
-            chunk = f.read(4096)
-            if not chunk:
-                if collecting and seen_notes and time.time() - last_activity > 1.0:
-                    return "\n".join(collected).strip()
-                time.sleep(0.2)
-                continue
-            buffer += chunk
-            while "\n" in buffer:
-                line, buffer = buffer.split("\n", 1)
-                last_activity = time.time()
-                if not in_block:
-                    if RESPONSE_START_RE.search(line):
-                        in_block = True
-                        collected = []
-                        start_id = None
-                        m = re.search(r"id=([^\s>]+)", line)
-                        if m:
-                            start_id = m.group(1)
-                        continue
-                    header = normalize_header(line)
-                    if header.startswith("worker instructions"):
-                        collecting = True
-                        seen_worker = True
-                        collected = [line]
-                        continue
-                    if collecting:
-                        collected.append(line)
-                        if header.startswith("notes"):
-                            seen_notes = True
-                    continue
-                if RESPONSE_END_RE.search(line):
-                    if req_id and start_id and start_id != req_id:
-                        in_block = False
-                        collected = []
-                        start_id = None
-                        continue
-                    return "\n".join(collected).strip()
-                collected.append(line)
-                header = normalize_header(line)
-                if header.startswith("notes"):
-                    seen_notes = True
+    def abandon_block(self, reason):
+        """Drop the open request block without sending it."""
+        if not self.in_block:
+            return
+        self.block.close()
+        print(
+            f"[bridge] warning: abandoned a request block from {self.label}: "
+            f"{reason} ({self.block.describe()})."
+        )
+        METRICS.inc("macs_blocks_abandoned_total", source="worker")
+        self.in_block = False
+        self.block = None
 
+    def _emit_block(self):
+        block = self.block.text()
+        if self.block.overflowed:
+            detail = self.block.describe()
+            print(f"[bridge] warning: request block from {self.label} truncated ({detail}).")
+            METRICS.inc("macs_blocks_truncated_total", source="worker")
+        self.block.close()
+        self.in_block = False
+        self.block = None
+        self.on_block(block)
 
-def run_codex_interactive(block_text, args, controller_pane_id, req_id):
-    lines = [args.controller_command]
-    lines.append(f"<<CONTROLLER_REQUEST id={req_id}>>")
-    lines.extend(block_text.strip().split("\n"))
-    lines.append("<<CONTROLLER_REQUEST_END>>")
-    with send_lock(SEND_LOCK_PATH):
-        for line in lines:
-            send_line(controller_pane_id, line)
-    return wait_for_controller_response(
-        args.controller_log, req_id=req_id, timeout=args.controller_timeout
-    )
 
+def parse_stream(
+    stream,
+    on_block,
+    heuristic_enabled=False,
+    heuristic_lines=20,
+    tailer=None,
+    max_line_bytes=65536,
+    context_ring=None,
+    heuristic_quiet=0.0,
+    status=None,
+    limits=None,
+    label="worker",
+):
+    if tailer is None:
+        tailer = PollTailer()
+    reader = LineReader(max_line_bytes)
+    parser = BlockParser(
+        on_block,
+        heuristic_enabled,
+        heuristic_lines,
+        context_ring,
+        heuristic_quiet,
+        status,
+        limits,
+        label,
+    )
+    checkpoint = getattr(stream, "checkpoint", None)
 
-def generate_auto_response(block_text):
-    return """WORKER INSTRUCTIONS:
-AUTO MODE PLACEHOLDER
-- Continue with the safest approach.
-- Maintain all security invariants.
-- Report back when complete or blocked.
+    while True:
+        chunk = stream.read(65536)
+        if not chunk:
+            if getattr(stream, "closed", False):
+                parser.flush_heuristic()
+                parser.abandon_block("the stream closed")
+                return
+            parser.tick()
+            tailer.wait(parser.tick_delay())
+            continue
+        METRICS.inc("macs_log_bytes_read_total", len(chunk))
+        for line in reader.feed(chunk):
+            parser.feed_line(line)
+        if checkpoint is not None and not parser.in_block:
+            # Resume after the last complete line, never from inside a block.
+            checkpoint(reader.pending_bytes())
 
-Requested block:
-{block}
 
-NOTES:
-Auto response generated (no controller backend configured).
-""".format(block=block_text.strip())
+def read_lines(f, max_line_bytes=65536):
+    reader = LineReader(max_line_bytes, errors="replace")
+    while True:
+        chunk = f.read(65536)
+        if not chunk:
+            break
+        yield from reader.feed(chunk)
+    yield from reader.flush()
 
 
-def generate_empty_controller_response(block_text):
-    return """WORKER INSTRUCTIONS:
-Controller backend did not return a response (timeout or error).
-Please resend the last request and include any critical context or logs.
+def parse_file(
+    path,
+    on_block,
+    heuristic_enabled=False,
+    heuristic_lines=20,
+    max_line_bytes=65536,
+    heuristic_quiet=0.0,
+    limits=None,
+):
+    parser = BlockParser(
+        on_block,
+        heuristic_enabled,
+        heuristic_lines,
+        heuristic_quiet=heuristic_quiet,
+        limits=limits,
+        label=path,
+    )
+    with open(path, "rb") as f:
+        for line in read_lines(f, max_line_bytes):
+            parser.feed_line(line)
+    # The log has no timing, so a held trigger is sent at the end of the file.
+    parser.flush_heuristic()
+    parser.abandon_block("the log ended")
 
-NOTES:
-Controller backend returned an empty response. Check controller session/logs and retry.
-"""
 
+def worker_log_path(template, pane_id, multi=False):
+    """Per-pane log path: '{pane}' in template is replaced, else a suffix is added."""
+    token = re.sub(r"[^A-Za-z0-9_.-]", "", pane_id) or "pane"
+    if "{pane}" in template:
+        return template.replace("{pane}", token)
+    if not multi:
+        return template
+    root, ext = os.path.splitext(template)
+    return f"{root}-{token}{ext}"
 
-def send_response(pane_id, response_text):
-    for line in response_text.split("\n"):
-        send_line(pane_id, line)
 
+def log_location(path, log_format="plain"):
+    """Absolute path of a pane log: the file itself, or <path>.d/ for segmented logs."""
+    path = os.path.abspath(path)
+    return f"{path}.d" if log_format == "segmented" else path
 
-def wait_for_response(path):
-    while True:
-        if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
-                return f.read()
-        time.sleep(0.5)
 
+def resolve_worker_panes(args, session):
+    """Return the worker pane ids to supervise, in a stable order."""
+    if args.worker_pane:
+        return [pane.strip() for pane in args.worker_pane.split(",") if pane.strip()]
+    if args.worker_label:
+        return [
+            pane["pane_id"]
+            for pane in list_panes(session)
+            if pane_matches_label(pane, args.worker_label)
+        ]
+    pane_id = discover_worker_pane(session)
+    return [pane_id] if pane_id else []
 
-def handle_block(block_text, args, pane_id, seen_hashes, simulate=False, controller_pane_id=None):
-    block_hash = stable_id(block_text)
-    if block_hash in seen_hashes:
-        return
-    seen_hashes.add(block_hash)
 
-    req_id = f"{timestamp()}_{block_hash}"
-    inbox_path = os.path.join(INBOX_DIR, f"{req_id}.request.txt")
-    archive_req = os.path.join(ARCHIVE_DIR, f"{req_id}.request.txt")
-    write_file(inbox_path, block_text)
-    write_file(archive_req, block_text)
+class PaneWatch:
+    """Per-pane state for the multi-worker bridge.
 
-    if simulate:
-        print(f"[simulate] wrote {inbox_path}")
-        return
+    Each pane has its own stream, line reader and parser; detected blocks go
+    to the shared RequestPipeline, which keeps responses in order per pane.
+    """
 
-    if args.mode == "manual":
-        response_path = os.path.join(OUTBOX_DIR, f"{req_id}.response.txt")
-        print(f"Controller request captured: {inbox_path}")
-        print(f"Write response to: {response_path}")
-        response_text = wait_for_response(response_path)
-    else:
-        controller_block = block_text
+    def __init__(self, pane_id, stream, log_path, args, on_block, loop=None):
+        self.pane_id = pane_id
+        self.stream = stream
+        self.log_path = log_path
+        self.loop = loop
+        self._tick_handle = None
+        self.reader = LineReader(args.max_line_bytes)
+        self.context_ring = None
         if args.worker_context_lines > 0:
-            context = read_recent_worker_context(args.log, args.worker_context_lines)
-            if context:
-                controller_block = (
-                    f"{block_text.strip()}\n\n[WORKER_CONTEXT]\n{context}\n"
-                )
-        if args.controller_backend == "codex-interactive":
-            if not controller_pane_id:
-                print("Controller pane not configured for interactive backend.")
-                return
-            response_text = run_codex_interactive(
-                controller_block, args, controller_pane_id, req_id
-            )
-        elif args.controller_backend == "codex":
-            response_text = run_codex_controller(controller_block, args)
-        else:
-            response_text = generate_auto_response(controller_block)
-        if not response_text.strip():
-            print("[bridge] warning: Controller backend returned empty response; sending retry guidance.")
-            response_text = generate_empty_controller_response(controller_block)
-        response_path = os.path.join(OUTBOX_DIR, f"{req_id}.response.txt")
-        write_file(response_path, response_text)
+            self.context_ring = deque(maxlen=args.worker_context_lines)
+        self.parser = BlockParser(
+            functools.partial(on_block, self),
+            heuristic_enabled=args.heuristic,
+            heuristic_lines=args.heuristic_lines,
+            context_ring=self.context_ring,
+            heuristic_quiet=args.heuristic_quiet,
+            status=open_pane_status(pane_id, args),
+            limits=block_limits(args),
+            label=pane_id,
+        )
 
-    archive_resp = os.path.join(ARCHIVE_DIR, f"{req_id}.response.txt")
-    write_file(archive_resp, response_text)
+    def pump(self):
+        checkpoint = getattr(self.stream, "checkpoint", None)
+        while True:
+            chunk = self.stream.read(65536)
+            if not chunk:
+                break
+            METRICS.inc("macs_log_bytes_read_total", len(chunk))
+            for line in self.reader.feed(chunk):
+                self.parser.feed_line(line)
+            if checkpoint is not None and not self.parser.in_block:
+                checkpoint(self.reader.pending_bytes())
+        self.parser.tick()
+        self._schedule_tick()
 
-    if args.split_response:
-        worker_text, notes_text = split_worker_and_notes(response_text)
-        if worker_text:
-            response_text = worker_text
-        else:
-            print("[bridge] warning: could not find WORKER INSTRUCTIONS section; sending full response.")
-        if notes_text:
-            print("[notes]")
-            print(notes_text)
+    def _schedule_tick(self):
+        """Pump again when a held heuristic trigger or an idle check is due."""
+        if self._tick_handle is not None:
+            self._tick_handle.cancel()
+            self._tick_handle = None
+        delay = self.parser.tick_delay()
+        if delay is not None and self.loop is not None:
+            self._tick_handle = self.loop.call_later(delay, self.pump)
 
-    if args.dry_run:
-        print("[dry-run] would send response:")
-        print(response_text)
-        return
 
-    print(f"[bridge] sending to worker pane {pane_id} ({len(response_text.splitlines())} lines)")
-    send_response(pane_id, response_text)
+async def pump_periodically(watches, interval):
+    while True:
+        for watch in watches:
+            watch.pump()
+        if all(getattr(watch.stream, "closed", False) for watch in watches):
+            return
+        await asyncio.sleep(interval)
 
 
-def is_heuristic_trigger(line):
-    if ASK_RE.search(line):
-        return True
-    if DONE_RE.search(line):
-        return True
-    if "?" in line and QUESTION_RE.search(line):
-        return True
-    return False
+async def supervise_panes(
+    pane_logs, args, seen_hashes, controller_pane_id, pipeline, response_cache=None
+):
+    """Watch several worker panes from one event loop."""
+    loop = asyncio.get_running_loop()
 
+    def on_block(watch, block):
+        dispatch_block(
+            block,
+            args,
+            watch.pane_id,
+            seen_hashes,
+            pipeline,
+            controller_pane_id=controller_pane_id,
+            context_ring=watch.context_ring,
+            worker_log=watch.log_path,
+            dedupe_scope=watch.pane_id,
+            response_cache=response_cache,
+        )
 
-def build_heuristic_block(lines):
-    return "\n".join(["<<CONTROLLER_REQUEST heuristic>>"] + lines + ["<<CONTROLLER_REQUEST_END>>"])
+    watches = []
+    for pane_id, log_path in pane_logs:
+        if args.tmux_backend == "control":
+            stream = control_client_for(pane_id).subscribe(pane_id, terminal_filter=pane_filter(args))
+        elif args.log_format == "segmented":
+            # Wakeups come from the shared inotify watch below, not the stream's own.
+            stream = SegmentedLog(log_path, tail_backend="poll")
+        else:
+            stream = open(log_path, "rb")
+            stream.seek(0, os.SEEK_END)
+        watches.append(PaneWatch(pane_id, stream, log_path, args, on_block, loop=loop))
 
+    tasks = []
+    inotify = None
+    if args.tmux_backend == "control":
+        for watch in watches:
+            watch.stream.listener = functools.partial(loop.call_soon_threadsafe, watch.pump)
+        # Output is pushed; this only notices when the connection goes away.
+        tasks.append(pump_periodically(watches, 5.0))
+        tail_label = "control"
+    else:
+        if args.tail_backend != "poll":
+            try:
+                inotify = Inotify()
+            except OSError as exc:
+                if args.tail_backend == "inotify":
+                    raise
+                print(f"[bridge] inotify unavailable ({exc}); falling back to polling.")
+        if inotify is not None:
+            mask = DIR_WATCH_MASK if args.log_format == "segmented" else TAIL_WATCH_MASK
+            by_wd = {inotify.add_watch(watch.log_path, mask): watch for watch in watches}
 
-def parse_stream(stream, on_block, heuristic_enabled=False, heuristic_lines=20):
-    in_block = False
-    block_lines = []
-    buffer = ""
-    recent_lines = deque(maxlen=heuristic_lines)
-
-    def handle_line(line):
-        nonlocal in_block, block_lines
-        if line is not None:
-            recent_lines.append(line)
-        if not in_block:
-            if START_RE.search(line):
-                in_block = True
-                block_lines = [line]
-                if END_RE.search(line):
-                    on_block("\n".join(block_lines))
-                    in_block = False
-                    block_lines = []
-                return
-            if heuristic_enabled and is_heuristic_trigger(line):
-                on_block(build_heuristic_block(list(recent_lines)))
-            return
-        block_lines.append(line)
-        if END_RE.search(line):
-            on_block("\n".join(block_lines))
-            in_block = False
-            block_lines = []
+            def on_inotify_ready():
+                for wd in {event[0] for event in inotify.read_events()}:
+                    watch = by_wd.get(wd)
+                    if watch is not None:
+                        watch.pump()
 
-    while True:
-        chunk = stream.read(4096)
-        if not chunk:
-            time.sleep(0.2)
-            continue
-        buffer += chunk
-        while "\n" in buffer:
-            line, buffer = buffer.split("\n", 1)
-            handle_line(line)
-
-
-def parse_file(path, on_block, heuristic_enabled=False, heuristic_lines=20):
-    with open(path, "r", encoding="utf-8") as f:
-        in_block = False
-        block_lines = []
-        recent_lines = deque(maxlen=heuristic_lines)
-        for line in f:
-            line = line.rstrip("\n")
-            recent_lines.append(line)
-            if not in_block:
-                if START_RE.search(line):
-                    in_block = True
-                    block_lines = [line]
-                    if END_RE.search(line):
-                        on_block("\n".join(block_lines))
-                        in_block = False
-                        block_lines = []
-                    continue
-                if heuristic_enabled and is_heuristic_trigger(line):
-                    on_block(build_heuristic_block(list(recent_lines)))
-                continue
-            block_lines.append(line)
-            if END_RE.search(line):
-                on_block("\n".join(block_lines))
-                in_block = False
-                block_lines = []
+            loop.add_reader(inotify.fd, on_inotify_ready)
+            # Slow sweep in case an event is missed (e.g. the log was replaced).
+            tasks.append(pump_periodically(watches, 5.0))
+            tail_label = "inotify"
+        else:
+            tasks.append(pump_periodically(watches, args.poll_interval))
+            tail_label = "poll"
+    print(f"[bridge] watching {len(watches)} worker panes tail={tail_label}")
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        if inotify is not None:
+            loop.remove_reader(inotify.fd)
+            inotify.close()
+        for watch in watches:
+            watch.stream.close()
 
 
 def main():
     parser = argparse.ArgumentParser(description="MACS Bridge - Multi Agent Control System")
     parser.add_argument("--session", default=None, help="tmux session name")
-    parser.add_argument("--worker-pane", default=None, help="tmux pane id (e.g. %%3)")
-    parser.add_argument("--log", default="/tmp/macs-worker.log", help="log path")
+    parser.add_argument(
+        "--worker-pane",
+        default=None,
+        help="tmux pane id (e.g. %%3); comma-separate several to supervise them all",
+    )
+    parser.add_argument(
+        "--worker-label",
+        default=None,
+        help="supervise every pane whose window/title/command matches this label",
+    )
+    parser.add_argument(
+        "--log",
+        default="/tmp/macs-worker.log",
+        help="log path; with several panes, {pane} is replaced by the pane id (or a suffix is added)",
+    )
+    parser.add_argument(
+        "--log-format",
+        choices=["plain", "segmented"],
+        default="plain",
+        help="plain appends to --log; segmented writes rotating segments to <log>.d/ and resumes where it stopped",
+    )
+    parser.add_argument(
+        "--log-filter",
+        action="store_true",
+        default=False,
+        help="strip terminal escapes and fold redraws before logging",
+    )
+    parser.add_argument(
+        "--no-log-filter",
+        action="store_false",
+        dest="log_filter",
+        help="log the raw terminal stream (default)",
+    )
+    parser.add_argument(
+        "--raw-log",
+        default=None,
+        help="also keep the unfiltered stream here ({pane} is replaced like --log)",
+    )
+    parser.add_argument(
+        "--log-segment-bytes",
+        type=int,
+        default=8 * 1024 * 1024,
+        help="segmented logs: start a new segment after this many bytes (0 = no limit)",
+    )
+    parser.add_argument(
+        "--log-segment-age",
+        type=float,
+        default=3600,
+        help="segmented logs: start a new segment after this many seconds (0 = no limit)",
+    )
+    parser.add_argument(
+        "--log-keep-segments",
+        type=int,
+        default=8,
+        help="segmented logs: consumed segments to keep (0 = keep all)",
+    )
+    parser.add_argument(
+        "--log-max-bytes",
+        type=int,
+        default=256 * 1024 * 1024,
+        help="segmented logs: prune the oldest segments beyond this total size (0 = unlimited)",
+    )
+    parser.add_argument(
+        "--pane-queue-size",
+        type=int,
+        default=8,
+        help="max pending controller requests per worker pane (0 = unlimited)",
+    )
     parser.add_argument("--mode", choices=["auto", "manual"], default="auto")
+    parser.add_argument(
+        "--list-pending",
+        action="store_true",
+        help="list captured requests that have no response in the outbox yet, then exit",
+    )
     parser.add_argument("--dry-run", action="store_true")
     parser.add_argument("--simulate-log", default=None, help="parse static log file")
     parser.add_argument(
         "--controller-backend",
-        choices=["none", "codex", "codex-interactive"],
+        choices=["none", "codex", "codex-interactive", "persistent"],
         default="codex-interactive",
         help="LLM backend for auto responses",
     )
@@ -637,12 +3923,50 @@ def main():
         default="$controller",
         help="command to invoke in controller codex",
     )
+    parser.add_argument(
+        "--controller-server-command",
+        default=None,
+        help="command for the persistent backend's controller processes (JSON lines on stdin/stdout; "
+        "a real controller needs an adapter, see docs/architecture.md and stub_controller.py)",
+    )
+    parser.add_argument(
+        "--controller-servers",
+        type=int,
+        default=1,
+        help="warm controller processes kept by the persistent backend",
+    )
+    parser.add_argument(
+        "--controller-ping-interval",
+        type=float,
+        default=30.0,
+        help="seconds between health-check pings to persistent controller processes",
+    )
     parser.add_argument(
         "--controller-timeout",
         type=int,
         default=300,
         help="seconds to wait for controller response",
     )
+    parser.add_argument(
+        "--manual-timeout",
+        type=int,
+        default=3600,
+        help="seconds a manual-mode request waits for its outbox response before the worker gets "
+        "retry guidance and its slot is freed (0 = wait forever)",
+    )
+    parser.add_argument(
+        "--controller-workers",
+        type=int,
+        default=4,
+        help="controller requests resolved concurrently",
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=32,
+        help="max controller requests queued or in flight; further explicit requests wait for a "
+        "free slot and heuristic blocks are dropped (0 = unlimited)",
+    )
     parser.add_argument(
         "--split-response",
         action="store_true",
@@ -661,6 +3985,13 @@ def main():
         default=40,
         help="number of recent worker log lines to include for controller context",
     )
+    parser.add_argument(
+        "--worker-context-budget",
+        type=int,
+        default=1000,
+        help="approximate token budget for the worker context; repeated and similar lines "
+        "are collapsed and older lines dropped to fit (0 sends the lines as they are)",
+    )
     parser.add_argument(
         "--heuristic",
         action="store_true",
@@ -679,18 +4010,192 @@ def main():
         default=20,
         help="max recent lines to include in heuristic request block",
     )
+    parser.add_argument(
+        "--heuristic-quiet",
+        type=float,
+        default=0.0,
+        help="seconds of quiet output before a heuristic trigger fires; triggers in between are "
+        "merged into one request (0 sends each trigger at once)",
+    )
+    parser.add_argument(
+        "--tmux-socket",
+        default=os.environ.get("TMUX_SOCKET") or None,
+        help="tmux socket path (defaults to $TMUX_SOCKET, else the default server)",
+    )
+    parser.add_argument(
+        "--tmux-backend",
+        choices=["exec", "control"],
+        default="exec",
+        help="run each tmux command as a process (exec) or over persistent tmux -C connections (control)",
+    )
+    parser.add_argument(
+        "--tail-backend",
+        choices=["auto", "inotify", "poll"],
+        default="auto",
+        help="how to wait for new log output (auto prefers inotify, falls back to polling)",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=0.2,
+        help="seconds between log reads when polling",
+    )
+    parser.add_argument(
+        "--delivery",
+        choices=["bulk", "lines"],
+        default="lines",
+        help="send text to panes one tmux call per line (lines, default) or in one paste (bulk)",
+    )
+    parser.add_argument(
+        "--submit",
+        choices=["enter", "lines", "none"],
+        default="enter",
+        help="bulk delivery: submit once after the paste (enter), after every line (lines), or not at all",
+    )
+    parser.add_argument(
+        "--submit-delay-ms",
+        type=int,
+        default=0,
+        help="bulk delivery: pause between the paste and the submit key",
+    )
+    parser.add_argument(
+        "--dedupe-index",
+        default=DEFAULT_DEDUPE_INDEX,
+        help="sqlite file of seen request hashes ('none' = scan the archive into memory)",
+    )
+    parser.add_argument(
+        "--dedupe-ttl",
+        type=float,
+        default=0,
+        help="forget request hashes older than this many seconds (0 = keep forever)",
+    )
+    parser.add_argument(
+        "--dedupe-max-entries",
+        type=int,
+        default=0,
+        help="keep at most this many request hashes in the dedupe index (0 = unlimited)",
+    )
+    parser.add_argument(
+        "--response-cache",
+        action="store_true",
+        help="reuse controller responses for requests that match after normalization",
+    )
+    parser.add_argument(
+        "--response-cache-path",
+        default=DEFAULT_RESPONSE_CACHE,
+        help="sqlite file for cached responses ('none' = keep them in memory only)",
+    )
+    parser.add_argument(
+        "--response-cache-ttl",
+        type=float,
+        default=3600,
+        help="seconds a cached response stays valid (0 = no expiry)",
+    )
+    parser.add_argument(
+        "--response-cache-size",
+        type=int,
+        default=256,
+        help="max cached responses, least recently used evicted first (0 = unlimited)",
+    )
+    parser.add_argument(
+        "--pane-cache-ttl",
+        type=float,
+        default=5.0,
+        help="seconds to reuse the pane and process listing used for pane discovery",
+    )
+    parser.add_argument(
+        "--status-dir",
+        default=default_status_dir(),
+        help="publish each worker pane's BUSY/IDLE state here for status.sh "
+        "(default $MACS_STATUS_DIR, else $TMUX_TMPDIR/macs-bridge-$UID/status; 'none' = off)",
+    )
+    parser.add_argument(
+        "--status-idle-after",
+        type=float,
+        default=3.0,
+        help="seconds without a busy status line before the pane is captured to confirm it is IDLE",
+    )
+    parser.add_argument(
+        "--archive-format",
+        choices=["files", "packed"],
+        default="files",
+        help="archive requests/responses as one text file each, or as compressed records in archive/packed/",
+    )
+    parser.add_argument(
+        "--archive-codec",
+        choices=sorted(archive_store.CODECS),
+        default="zlib",
+        help="packed archive: per-record compression",
+    )
+    parser.add_argument(
+        "--max-line-bytes",
+        type=int,
+        default=65536,
+        help="truncate log lines longer than this many bytes (0 = unlimited)",
+    )
+    parser.add_argument(
+        "--max-block-lines",
+        type=int,
+        default=2000,
+        help="lines of a request/response block kept in memory, counting the last lines kept of "
+        "a longer block; longer blocks are sent as their first and last lines (0 = unlimited)",
+    )
+    parser.add_argument(
+        "--max-block-bytes",
+        type=int,
+        default=262144,
+        help="bytes of a request/response block kept in memory (0 = unlimited)",
+    )
+    parser.add_argument(
+        "--block-timeout",
+        type=float,
+        default=600.0,
+        help="seconds before a block with no end marker is abandoned (0 = never)",
+    )
+    parser.add_argument(
+        "--block-spill-dir",
+        default=os.path.join(runtime_dir(), "spill"),
+        help="write oversize request blocks here in full "
+        "(default $TMUX_TMPDIR/macs-bridge-$UID/spill; 'none' = drop the middle)",
+    )
+    parser.add_argument(
+        "--trace-file",
+        default=None,
+        help="append a JSON line of timed spans for every controller request to this file",
+    )
+    parser.add_argument(
+        "--metrics-listen",
+        default=None,
+        help="serve Prometheus metrics on host:port, :port (localhost) or unix:/path",
+    )
     args = parser.parse_args()
 
+    if args.list_pending:
+        list_pending_requests()
+        return
     ensure_dirs()
+    configure_tmux(args.tmux_socket)
+    if args.block_spill_dir != "none":
+        prune_spill_dir(args.block_spill_dir)
+    atexit.register(report_memory)
+    PANES.ttl = args.pane_cache_ttl
+    global ARCHIVE_STORE, TRACE_LOG, CONTROLLER_SERVERS
+    if args.archive_format == "packed":
+        ARCHIVE_STORE = archive_store.PackedArchive(
+            os.path.join(ARCHIVE_DIR, PACKED_ARCHIVE_NAME), codec=args.archive_codec
+        )
 
     if args.simulate_log:
-        seen_hashes = load_seen_hashes()
+        seen_hashes = open_seen_hashes(args)
         print(f"[simulate] parsing {args.simulate_log}")
         parse_file(
             args.simulate_log,
-            lambda block: handle_block(block, args, None, seen_hashes, simulate=True),
+            lambda block: handle_block(block, seen_hashes),
             heuristic_enabled=args.heuristic,
             heuristic_lines=args.heuristic_lines,
+            max_line_bytes=args.max_line_bytes,
+            heuristic_quiet=args.heuristic_quiet,
+            limits=block_limits(args),
         )
         return
 
@@ -704,26 +4209,72 @@ def main():
                 "or pass --worker-pane/--controller-pane."
             )
             sys.exit(1)
-    pane_id = args.worker_pane or discover_worker_pane(session)
-    if not pane_id:
-        print("Unable to find worker pane. Provide --worker-pane.")
+    pane_ids = resolve_worker_panes(args, session)
+    if not pane_ids:
+        print("Unable to find worker pane. Provide --worker-pane or --worker-label.")
         sys.exit(1)
+    pane_id = pane_ids[0]
+
+    if args.tmux_backend == "control":
+        try:
+            control_client_for(pane_id)
+        except (OSError, subprocess.CalledProcessError) as exc:
+            print(f"[bridge] warning: tmux control mode unavailable ({exc}); using exec backend.")
+            args.tmux_backend = "exec"
 
-    setup_pipe(pane_id, args.log)
     controller_pane_id = None
     if args.controller_backend == "codex-interactive":
         controller_pane_id = args.controller_pane or discover_controller_pane(session, worker_pane_id=pane_id)
         if not controller_pane_id:
             print("Unable to find controller pane. Provide --controller-pane.")
             sys.exit(1)
-        setup_pipe(controller_pane_id, args.controller_log)
-        controller_log_path = os.path.abspath(args.controller_log)
-        if not os.path.exists(controller_log_path):
-            write_file(controller_log_path, "")
+        pane_ids = [pane for pane in pane_ids if pane != controller_pane_id]
+        if not pane_ids:
+            print("The only matching worker pane is the controller pane. Provide --worker-pane.")
+            sys.exit(1)
+        pane_id = pane_ids[0]
+    multi = len(pane_ids) > 1 or bool(args.worker_label)
+    sink_args = None
+    if args.log_format == "segmented" or args.log_filter or args.raw_log:
+        sink_args = ["--format", args.log_format]
+        if not args.log_filter:
+            sink_args.append("--no-filter")
+        if args.log_format == "segmented":
+            sink_args.extend(
+                [
+                    "--segment-bytes",
+                    str(args.log_segment_bytes),
+                    "--segment-age",
+                    f"{args.log_segment_age:g}",
+                    "--keep",
+                    str(args.log_keep_segments),
+                    "--max-bytes",
+                    str(args.log_max_bytes),
+                ]
+            )
+    pane_logs = [
+        (pane, log_location(worker_log_path(args.log, pane, multi), args.log_format))
+        for pane in pane_ids
+    ]
+    for pane, log_path in pane_logs:
+        pane_sink_args = sink_args
+        if args.raw_log:
+            raw_path = os.path.abspath(worker_log_path(args.raw_log, pane, multi))
+            pane_sink_args = sink_args + ["--raw-log", raw_path]
+        setup_pipe(pane, log_path, pane_sink_args)
+        if args.log_format == "plain" and not os.path.exists(log_path):
+            write_file(log_path, "")
+    if controller_pane_id:
+        args.controller_log = log_location(args.controller_log, args.log_format)
+        controller_sink_args = sink_args
+        if args.raw_log:
+            controller_sink_args = sink_args + ["--raw-log", f"{os.path.abspath(args.controller_log)}.raw"]
+        setup_pipe(controller_pane_id, args.controller_log, controller_sink_args)
+        if args.log_format == "plain" and not os.path.exists(args.controller_log):
+            write_file(args.controller_log, "")
     session_label = session or "all-sessions"
-    print(
-        f"[bridge] session={session_label} pane={pane_id} log={os.path.abspath(args.log)}"
-    )
+    for pane, log_path in pane_logs:
+        print(f"[bridge] session={session_label} pane={pane} log={log_path}")
     mode_label = "auto" if args.mode == "auto" else "manual"
     heuristic_label = "on" if args.heuristic else "off"
     print(
@@ -733,26 +4284,94 @@ def main():
     if controller_pane_id:
         print(f"[bridge] controller_pane={controller_pane_id} controller_log={os.path.abspath(args.controller_log)}")
 
-    seen_hashes = load_seen_hashes()
-    log_path = os.path.abspath(args.log)
-    if not os.path.exists(log_path):
-        write_file(log_path, "")
-    with open(log_path, "r", encoding="utf-8", errors="ignore") as f:
-        f.seek(0, os.SEEK_END)
-        parse_stream(
-            f,
-            lambda block: handle_block(
-                block,
-                args,
-                pane_id,
-                seen_hashes,
-                simulate=False,
-                controller_pane_id=controller_pane_id,
-            ),
-            heuristic_enabled=args.heuristic,
-            heuristic_lines=args.heuristic_lines,
+    seen_hashes = open_seen_hashes(args)
+    response_cache = open_response_cache(args)
+    if response_cache is not None:
+        print(f"[bridge] response_cache={response_cache.path or 'memory'} ttl={args.response_cache_ttl:g}s")
+    if ARCHIVE_STORE is not None:
+        print(f"[bridge] archive={ARCHIVE_STORE.directory} codec={args.archive_codec}")
+    pipeline = RequestPipeline(
+        workers=args.controller_workers,
+        max_pending=args.max_pending,
+        max_pending_per_key=args.pane_queue_size,
+    )
+    if args.controller_backend == "persistent":
+        if not args.controller_server_command:
+            print("The persistent backend needs --controller-server-command.")
+            sys.exit(1)
+        CONTROLLER_SERVERS = ControllerServerPool(
+            shlex.split(args.controller_server_command),
+            args.controller_servers,
+            args,
+            ping_interval=args.controller_ping_interval,
+        )
+        print(f"[bridge] controller_servers={args.controller_servers} command={args.controller_server_command}")
+    if args.trace_file:
+        TRACE_LOG = TraceLog(args.trace_file)
+        print(f"[bridge] trace_file={TRACE_LOG.path}")
+    METRICS.gauge("macs_queue_depth", pipeline.pending)
+    METRICS.gauge("macs_peak_rss_bytes", peak_rss_bytes)
+    METRICS.gauge("macs_block_buffer_high_water_bytes", lambda: BlockBuffer.high_water)
+    if args.metrics_listen:
+        _, metrics_label = start_metrics_server(args.metrics_listen)
+        print(f"[bridge] metrics={metrics_label}")
+    if multi:
+        asyncio.run(
+            supervise_panes(
+                pane_logs, args, seen_hashes, controller_pane_id, pipeline, response_cache
+            )
+        )
+        print("[bridge] tmux control connection closed; exiting.")
+        sys.exit(1)
+
+    log_path = pane_logs[0][1]
+    context_ring = None
+    if args.worker_context_lines > 0:
+        context_ring = deque(maxlen=args.worker_context_lines)
+
+    def on_block(block):
+        dispatch_block(
+            block,
+            args,
+            pane_id,
+            seen_hashes,
+            pipeline,
+            controller_pane_id=controller_pane_id,
+            context_ring=context_ring,
+            worker_log=log_path,
+            response_cache=response_cache,
         )
 
+    parse_options = {
+        "heuristic_enabled": args.heuristic,
+        "heuristic_lines": args.heuristic_lines,
+        "max_line_bytes": args.max_line_bytes,
+        "context_ring": context_ring,
+        "heuristic_quiet": args.heuristic_quiet,
+        "status": open_pane_status(pane_id, args),
+        "limits": block_limits(args),
+        "label": pane_id,
+    }
+    if args.tmux_backend == "control":
+        feed = control_client_for(pane_id).subscribe(pane_id, terminal_filter=pane_filter(args))
+        print("[bridge] tail=control")
+        parse_stream(feed, on_block, tailer=feed, **parse_options)
+        print("[bridge] tmux control connection closed; exiting.")
+        sys.exit(1)
+    if args.log_format == "segmented":
+        stream = SegmentedLog(log_path, tail_backend=args.tail_backend, poll_interval=args.poll_interval)
+        print(f"[bridge] tail={stream.name}")
+        try:
+            parse_stream(stream, on_block, tailer=stream, **parse_options)
+        finally:
+            stream.close()
+        return
+    tailer = open_tailer(log_path, args.tail_backend, args.poll_interval)
+    print(f"[bridge] tail={tailer.name}")
+    with open(log_path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        parse_stream(f, on_block, tailer=tailer, **parse_options)
+
 
 if __name__ == "__main__":
     main()
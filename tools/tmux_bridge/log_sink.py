@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+"""
+MACS log sink - filtered, optionally segmented pane logs
+
+Run by `tmux pipe-pane` in place of `cat >> log`. Pane output read from stdin
+is passed through a terminal filter (escape sequences stripped, carriage
+return redraws folded) and appended to a log file, or written to numbered
+segment files in a directory with a manifest.json describing them. Segments
+are rotated by size or age (only at line boundaries) and old ones are pruned
+to keep disk use bounded.
+
+The bridge reads the segments in order and records how far it got in
+offset.json; segments it has not consumed yet are only pruned when the
+directory exceeds --max-bytes.
+"""
+import argparse
+import fcntl
+import json
+import os
+import re
+import signal
+import sys
+import time
+from contextlib import contextmanager
+
+MANIFEST_NAME = "manifest.json"
+OFFSET_NAME = "offset.json"
+LOCK_NAME = ".lock"
+SEGMENT_PREFIX = "seg-"
+SEGMENT_SUFFIX = ".log"
+
+# Terminal escape handling for TerminalFilter
+MAX_ESCAPE_BYTES = 4096
+ESCAPE_SEQUENCE_RE = re.compile(
+    rb"\x1b(?:\[[0-?]*[ -/]*[@-~]|[\]P^_X][^\x07\x1b]*(?:\x07|\x1b\\)|[ -/]*[0-~])"
+)
+ESCAPE_PREFIX_RE = re.compile(rb"\x1b(?:\[[0-?]*[ -/]*|[ -/]*)")
+STRING_END_RE = re.compile(rb"\x07|\x1b\\")
+# Cursor moves to another row become line breaks; erase-in-line becomes \x00,
+# which fold_line() applies.
+CURSOR_LINE_RE = re.compile(rb"\x1b\[[0-9;]*[BEHdf]")
+ERASE_LINE_RE = re.compile(rb"\x1b\[[02]?K")
+CONTROL_RE = re.compile(rb"[\x01-\x07\x0b\x0c\x0e-\x1f\x7f]")
+FOLD_BYTES_RE = re.compile(rb"[\r\x08\x00]")
+FOLD_SPLIT_RE = re.compile("([\r\b\x00])")
+
+
+def segment_name(seq):
+    return f"{SEGMENT_PREFIX}{seq:06d}{SEGMENT_SUFFIX}"
+
+
+def write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def scan_segments(directory):
+    """Rebuild segment entries from the files on disk (manifest missing or corrupt)."""
+    segments = []
+    try:
+        names = sorted(os.listdir(directory))
+    except OSError:
+        names = []
+    for name in names:
+        if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+            continue
+        try:
+            seq = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            stat = os.stat(os.path.join(directory, name))
+        except (ValueError, OSError):
+            continue
+        segments.append(
+            {
+                "name": name,
+                "seq": seq,
+                "created": stat.st_mtime,
+                "closed": stat.st_mtime,
+                "bytes": stat.st_size,
+                "pid": 0,
+            }
+        )
+    return segments
+
+
+def read_manifest(directory):
+    manifest = read_json(os.path.join(directory, MANIFEST_NAME))
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("segments"), list):
+        manifest = {"version": 1, "segments": scan_segments(directory)}
+    return manifest
+
+
+def write_manifest(directory, manifest):
+    write_json_atomic(os.path.join(directory, MANIFEST_NAME), manifest)
+
+
+def read_offset(directory):
+    """Return the bridge's saved resume point as (segment name, byte offset), or None."""
+    data = read_json(os.path.join(directory, OFFSET_NAME))
+    if not isinstance(data, dict) or "segment" not in data:
+        return None
+    try:
+        return data["segment"], int(data.get("offset", 0))
+    except (TypeError, ValueError):
+        return None
+
+
+def write_offset(directory, segment, offset):
+    write_json_atomic(
+        os.path.join(directory, OFFSET_NAME),
+        {"segment": segment, "offset": offset, "saved_at": time.time()},
+    )
+
+
+class TerminalFilter:
+    """Streaming filter that turns raw terminal output into plain text lines.
+
+    CSI/OSC/DCS and other escape sequences are removed, cursor positioning is
+    turned into a line break, and carriage returns, backspaces and erase-line
+    codes are applied so each line holds what was finally shown on screen
+    (spinner and progress redraws collapse to their last frame). Escape
+    sequences and lines split across chunks are held back until complete; a
+    partial line longer than max_pending is written out as is.
+    """
+
+    def __init__(self, max_pending=65536):
+        self.max_pending = max_pending
+        self._escape = b""
+        self._line = b""
+        self._blank = False
+
+    def feed(self, data):
+        data = self._escape + data
+        self._escape = b""
+        cut = incomplete_escape_start(data)
+        if cut is not None:
+            data, self._escape = data[:cut], data[cut:]
+        if b"\x00" in data:
+            data = data.replace(b"\x00", b"")
+        data = data.replace(b"\r\n", b"\n")
+        if b"\x1b" in data:
+            data = CURSOR_LINE_RE.sub(b"\n", data)
+            data = ERASE_LINE_RE.sub(b"\x00", data)
+            data = ESCAPE_SEQUENCE_RE.sub(b"", data)
+        data = CONTROL_RE.sub(b"", data)
+        lines = (self._line + data).split(b"\n")
+        self._line = lines.pop()
+        if len(self._line) > self.max_pending:
+            lines.append(self._line)
+            self._line = b""
+        return self._join(lines)
+
+    def flush(self):
+        """Return whatever is still held back (at end of input)."""
+        line = self._line + ESCAPE_SEQUENCE_RE.sub(b"", self._escape)
+        self._line = self._escape = b""
+        if not line:
+            return b""
+        return fold_line(line)
+
+    def _join(self, lines):
+        out = []
+        for line in lines:
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            if FOLD_BYTES_RE.search(line):
+                line = fold_line(line)
+            elif line.endswith(b" "):
+                line = line.rstrip(b" ")
+            # Screen clears and redraws leave runs of empty lines; keep one.
+            if not line:
+                if self._blank:
+                    continue
+                self._blank = True
+            else:
+                self._blank = False
+            out.append(line)
+        if not out:
+            return b""
+        return b"\n".join(out) + b"\n"
+
+
+def incomplete_escape_start(data):
+    """Index where an unterminated escape sequence at the end of data begins, or None."""
+    window = max(0, len(data) - MAX_ESCAPE_BYTES)
+    start = data.rfind(b"\x1b", window)
+    if start < 0:
+        return None
+    # OSC/DCS strings run until BEL or ST and may contain anything else.
+    string_start = max(data.rfind(b"\x1b]", window), data.rfind(b"\x1bP", window))
+    if string_start >= 0 and not STRING_END_RE.search(data, string_start + 2):
+        return string_start
+    if ESCAPE_PREFIX_RE.fullmatch(data, start):
+        return start
+    return None
+
+
+def fold_line(line):
+    """Apply \\r, backspace and erase-line (\\x00) within one line, like a terminal would."""
+    text = ""
+    col = 0
+    for token in FOLD_SPLIT_RE.split(line.decode("utf-8", "surrogateescape")):
+        if token == "\r":
+            col = 0
+        elif token == "\b":
+            col = max(0, col - 1)
+        elif token == "\x00":
+            text = text[:col]
+        elif token:
+            text = text[:col] + token + text[col + len(token):]
+            col += len(token)
+    return text.rstrip(" ").encode("utf-8", "surrogateescape")
+
+
+def pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def segment_finished(entry):
+    """True once no more bytes will be appended to this segment."""
+    return entry.get("closed") is not None or not pid_alive(entry.get("pid"))
+
+
+@contextmanager
+def manifest_lock(directory):
+    with open(os.path.join(directory, LOCK_NAME), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class SegmentSink:
+    """Appends pane output to rotating segment files under directory.
+
+    A new segment is started when the current one reaches segment_bytes or
+    segment_age seconds (0 disables either), at the next newline so no line
+    is split across segments. After each rotation, finished segments the
+    bridge has consumed are pruned beyond keep, and the oldest finished
+    segments are pruned while the directory is over max_bytes.
+    """
+
+    def __init__(self, directory, segment_bytes=8 * 1024 * 1024, segment_age=3600, keep=8, max_bytes=0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segment_age = segment_age
+        self.keep = keep
+        self.max_bytes = max_bytes
+        self._file = None
+        self._entry = None
+        os.makedirs(directory, exist_ok=True)
+        with manifest_lock(directory):
+            manifest = read_manifest(directory)
+            for entry in manifest["segments"]:
+                # Finalize segments left open by a sink that was killed.
+                if entry.get("closed") is None and not pid_alive(entry.get("pid")):
+                    entry["closed"] = time.time()
+                    entry["bytes"] = self._size_of(entry)
+            self._start_segment(manifest)
+            write_manifest(directory, manifest)
+
+    def _path(self, entry):
+        return os.path.join(self.directory, entry["name"])
+
+    def _size_of(self, entry):
+        try:
+            return os.path.getsize(self._path(entry))
+        except OSError:
+            return 0
+
+    def _start_segment(self, manifest):
+        seq = max([entry["seq"] for entry in manifest["segments"]] + [0]) + 1
+        self._entry = {
+            "name": segment_name(seq),
+            "seq": seq,
+            "created": time.time(),
+            "closed": None,
+            "bytes": 0,
+            "pid": os.getpid(),
+        }
+        manifest["segments"].append(self._entry)
+        self._file = open(self._path(self._entry), "ab", buffering=0)
+        self._size = 0
+
+    def _finish_segment(self, manifest):
+        self._file.close()
+        for entry in manifest["segments"]:
+            if entry["name"] == self._entry["name"]:
+                entry["closed"] = time.time()
+                entry["bytes"] = self._size
+
+    def _rotation_cut(self, data):
+        """Index just past the newline where this segment should end, or None."""
+        start = None
+        if self.segment_age and time.time() - self._entry["created"] >= self.segment_age:
+            start = 0
+        if self.segment_bytes and self._size + len(data) >= self.segment_bytes:
+            limit = max(0, self.segment_bytes - self._size - 1)
+            start = limit if start is None else min(start, limit)
+        if start is None:
+            return None
+        newline = data.find(b"\n", start)
+        return newline + 1 if newline >= 0 else None
+
+    def rotate(self):
+        with manifest_lock(self.directory):
+            manifest = read_manifest(self.directory)
+            self._finish_segment(manifest)
+            self._start_segment(manifest)
+            self._prune(manifest)
+            write_manifest(self.directory, manifest)
+
+    def _prune(self, manifest):
+        offset = read_offset(self.directory)
+        consumed_seq = 0
+        if offset is not None:
+            for entry in manifest["segments"]:
+                if entry["name"] == offset[0]:
+                    consumed_seq = entry["seq"]
+        segments = manifest["segments"]
+        total = sum(entry.get("bytes") or self._size_of(entry) for entry in segments)
+        finished = [entry for entry in segments if entry is not self._entry and segment_finished(entry)]
+        while finished:
+            oldest = finished[0]
+            over_keep = self.keep and len(finished) > self.keep and oldest["seq"] < consumed_seq
+            over_bytes = self.max_bytes and total > self.max_bytes
+            if not (over_keep or over_bytes):
+                break
+            finished.pop(0)
+            segments.remove(oldest)
+            total -= oldest.get("bytes") or 0
+            try:
+                os.unlink(self._path(oldest))
+            except OSError:
+                pass
+
+    def write(self, data):
+        while data:
+            cut = self._rotation_cut(data)
+            if cut is None:
+                self._write(data)
+                return
+            self._write(data[:cut])
+            self.rotate()
+            data = data[cut:]
+
+    def _write(self, data):
+        self._file.write(data)
+        self._size += len(data)
+
+    def close(self):
+        if self._file is None or self._file.closed:
+            return
+        with manifest_lock(self.directory):
+            manifest = read_manifest(self.directory)
+            self._finish_segment(manifest)
+            write_manifest(self.directory, manifest)
+
+
+class FileSink:
+    """Appends pane output to a single log file (like `cat >> log`)."""
+
+    def __init__(self, path):
+        self._file = open(path, "ab", buffering=0)
+
+    def write(self, data):
+        self._file.write(data)
+
+    def close(self):
+        self._file.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MACS log sink - pipe-pane log writer")
+    parser.add_argument("path", help="log file, or segment directory with --format segmented")
+    parser.add_argument(
+        "--format",
+        choices=["plain", "segmented"],
+        default="plain",
+        help="append to one file (plain) or write rotating segments (segmented)",
+    )
+    parser.add_argument(
+        "--no-filter",
+        action="store_false",
+        dest="filter",
+        help="write the raw terminal stream instead of filtered text",
+    )
+    parser.add_argument(
+        "--raw-log",
+        default=None,
+        help="also append the unfiltered stream to this file",
+    )
+    parser.add_argument(
+        "--segment-bytes",
+        type=int,
+        default=8 * 1024 * 1024,
+        help="start a new segment after this many bytes (0 = no size limit)",
+    )
+    parser.add_argument(
+        "--segment-age",
+        type=float,
+        default=3600,
+        help="start a new segment after this many seconds (0 = no age limit)",
+    )
+    parser.add_argument(
+        "--keep",
+        type=int,
+        default=8,
+        help="finished segments to keep once the bridge has consumed them (0 = keep all)",
+    )
+    parser.add_argument(
+        "--max-bytes",
+        type=int,
+        default=256 * 1024 * 1024,
+        help="prune the oldest segments, consumed or not, beyond this total size (0 = unlimited)",
+    )
+    args = parser.parse_args(argv)
+
+    # tmux sends SIGHUP/SIGTERM when the pane goes away; finish the manifest first.
+    for signum in (signal.SIGHUP, signal.SIGTERM):
+        signal.signal(signum, lambda *_: sys.exit(0))
+
+    if args.format == "segmented":
+        sink = SegmentSink(
+            args.path,
+            segment_bytes=args.segment_bytes,
+            segment_age=args.segment_age,
+            keep=args.keep,
+            max_bytes=args.max_bytes,
+        )
+    else:
+        sink = FileSink(args.path)
+    terminal_filter = TerminalFilter() if args.filter else None
+    raw = open(args.raw_log, "ab", buffering=0) if args.raw_log else None
+    stdin = sys.stdin.fileno()
+    try:
+        while True:
+            data = os.read(stdin, 65536)
+            if not data:
+                break
+            if raw is not None:
+                raw.write(data)
+            if terminal_filter is not None:
+                data = terminal_filter.feed(data)
+            if data:
+                sink.write(data)
+    finally:
+        if terminal_filter is not None:
+            tail = terminal_filter.flush()
+            if tail:
+                sink.write(tail)
+        sink.close()
+        if raw is not None:
+            raw.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -28,6 +28,8 @@ type_delay_ms="${TARGET_PANE_TYPE_DELAY_MS:-400}"
 literal_mode=0
 guard_busy="${TARGET_PANE_GUARD_BUSY:-1}"
 force_send=0
+urgent=0
+lock_wait="${TARGET_PANE_LOCK_WAIT:-30}"
 require_explicit_session_on_multi="${TARGET_PANE_REQUIRE_EXPLICIT_SESSION_ON_MULTI:-0}"
 socket="${TMUX_SOCKET:-}"
 tmux_socket_args=()
@@ -116,12 +118,16 @@ while [ $# -gt 0 ]; do
       force_send=1
       shift
       ;;
+    --urgent)
+      urgent=1
+      shift
+      ;;
     --require-explicit-session)
       require_explicit_session_on_multi=1
       shift
       ;;
     --help|-h)
-      echo "Usage: $0 [--session NAME] [--pane %X] [--label TEXT] [--socket PATH] [--require-explicit-session] [message...]" >&2
+      echo "Usage: $0 [--session NAME] [--pane %X] [--label TEXT] [--socket PATH] [--require-explicit-session] [--urgent] [message...]" >&2
       exit 0
       ;;
     *)
@@ -235,6 +241,35 @@ if [ "$guard_busy" -eq 1 ] && [ "$force_send" -eq 0 ]; then
   fi
 fi
 
+# Sends to a pane are serialized with the bridge's deliveries to it through a
+# lock file per tmux server and pane. With --urgent, a marker next to the lock
+# makes the bridge hold back its queued deliveries until this message is sent.
+lock_pane() {
+  local server="default"
+  local lock_dir=""
+
+  if ! command -v flock >/dev/null 2>&1; then
+    return 0
+  fi
+  if [ -n "$socket" ]; then
+    server="${socket//[^A-Za-z0-9._-]/_}"
+  fi
+  lock_dir="${TMUX_TMPDIR:-/tmp}/macs-bridge-${UID}/locks/$server"
+  mkdir -p "$lock_dir"
+  pane_lock="$lock_dir/$pane.lock"
+  if [ "$urgent" -eq 1 ]; then
+    trap 'rm -f "$pane_lock.urgent"' EXIT
+    touch "$pane_lock.urgent"
+  fi
+  exec 9>>"$pane_lock"
+  if ! flock -w "$lock_wait" 9; then
+    echo "Timed out after ${lock_wait}s waiting for another sender to pane $pane." >&2
+    exit 1
+  fi
+}
+
+lock_pane
+
 send_line() {
   local pane_id="$1"
   local line="$2"
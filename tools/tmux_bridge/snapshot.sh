@@ -17,6 +17,7 @@ pane=""
 session_explicit=0
 pane_explicit=0
 lines="${TARGET_PANE_LINES:-200}"
+delta=0
 label="${TARGET_PANE_LABEL:-worker}"
 socket="${TMUX_SOCKET:-}"
 
@@ -57,6 +58,10 @@ while [ $# -gt 0 ]; do
       lines="$2"
       shift 2
       ;;
+    --delta)
+      delta=1
+      shift
+      ;;
     --label)
       label="$2"
       shift 2
@@ -67,7 +72,8 @@ while [ $# -gt 0 ]; do
       shift 2
       ;;
     --help|-h)
-      echo "Usage: $0 [--session NAME] [--pane %X] [--lines N] [--label TEXT] [--socket PATH]" >&2
+      echo "Usage: $0 [--session NAME] [--pane %X] [--lines N] [--label TEXT] [--socket PATH] [--delta]" >&2
+      echo "  --delta  print only lines that changed since the last --delta call for this pane" >&2
       exit 0
       ;;
     *)
@@ -146,8 +152,111 @@ if [ -z "$pane" ]; then
   fi
 fi
 
-capture_out="$(tmux_cmd capture-pane -p -t "$pane" -S "-$lines" 2>&1)" || {
-  tmux_fail "$capture_out"
+if [ "$delta" -eq 0 ]; then
+  capture_out="$(tmux_cmd capture-pane -p -t "$pane" -S "-$lines" 2>&1)" || {
+    tmux_fail "$capture_out"
+    exit 1
+  }
+  printf "%s\n" "$capture_out"
+  exit 0
+fi
+
+# Delta mode: keep the last visible screen per pane and print only what changed.
+state_dir="$TARGET_STATE_DIR/snapshots"
+state_key="$(printf "%s:%s" "${socket:-default}" "$pane" | cksum | awk '{print $1}')"
+state_meta="$state_dir/$state_key.meta"
+state_screen="$state_dir/$state_key.screen"
+no_change_marker="[snapshot] no change"
+
+pane_meta="$(tmux_cmd display-message -p -t "$pane" \
+  '#{history_size}	#{history_limit}	#{pane_width}x#{pane_height}	#{history_bytes}	#{cursor_x},#{cursor_y}	#{window_activity}' 2>&1)" || {
+  tmux_fail "$pane_meta"
   exit 1
 }
-printf "%s\n" "$capture_out"
+IFS=$'\t' read -r history_size history_limit pane_size _ _ window_activity <<<"$pane_meta"
+pane_height="${pane_size#*x}"
+now="$(date +%s)"
+
+prev_meta=""
+prev_history=""
+prev_time=0
+if [ -f "$state_meta" ] && [ -f "$state_screen" ]; then
+  IFS=$'\n' read -r -d '' prev_meta prev_history prev_time < "$state_meta" || true
+fi
+
+# window_activity has one-second resolution: output in the same second as the
+# last capture may not be in it yet, so only an older timestamp proves "no change".
+if [ -n "$prev_meta" ] && [ "$pane_meta" = "$prev_meta" ] && [ "$window_activity" -lt "$prev_time" ]; then
+  printf "%s\n" "$no_change_marker"
+  exit 0
+fi
+
+# Lines keep their history index while scrolling unless history is trimmed at
+# history-limit; then (or on a resize/clear) the old screen is searched for.
+search=1
+start=0
+capture_from="-$lines"
+prev_size="$(printf "%s" "$prev_meta" | awk -F '\t' '{print $3}')"
+if [ -n "$prev_meta" ] && [ "$pane_size" = "$prev_size" ] \
+  && [ "$history_size" -ge "$prev_history" ] && [ "$history_size" -lt "$history_limit" ]; then
+  scrolled=$((history_size - prev_history))
+  shown=$scrolled
+  if [ "$shown" -gt "$lines" ]; then
+    shown=$lines
+    echo "[snapshot] $((scrolled - lines)) earlier lines not shown (raise --lines)" >&2
+  fi
+  search=0
+  start=$((shown - scrolled))
+  capture_from="-$shown"
+fi
+
+# Captured to a file: command substitution would drop the blank bottom rows.
+mkdir -p "$state_dir"
+capture_file="$state_dir/$state_key.capture"
+if ! tmux_cmd capture-pane -p -t "$pane" -S "$capture_from" > "$capture_file" 2>&1; then
+  tmux_fail "$(cat "$capture_file")"
+  exit 1
+fi
+
+if [ -n "$prev_meta" ]; then
+  # start: row of the capture where the old screen's first row is (may be
+  # negative); with search=1 it is found by the longest matching run instead.
+  delta_out="$(awk -v prev_file="$state_screen" -v search="$search" -v start="$start" '
+    FILENAME == prev_file { prev[pn++] = $0; next }
+    { cur[cn++] = $0 }
+    END {
+      found = !search
+      if (search) {
+        best_len = 0
+        for (p = 0; p < cn; p++) {
+          j = 0
+          while (j < pn && p + j < cn && cur[p + j] == prev[j]) j++
+          if (j > 0 && j >= best_len) { start = p; best_len = j; found = 1 }
+        }
+      }
+      first = 0
+      if (found) {
+        j = (start < 0) ? -start : 0
+        while (j < pn && start + j < cn && cur[start + j] == prev[j]) j++
+        first = start + j
+      }
+      last = cn - 1
+      while (last >= first && cur[last] == "") last--
+      for (i = first; i <= last; i++) print cur[i]
+    }
+  ' "$state_screen" "$capture_file")"
+else
+  delta_out="$(cat "$capture_file")"
+fi
+
+tail -n "$pane_height" "$capture_file" > "$state_screen.tmp"
+rm -f "$capture_file"
+printf "%s\n%s\n%s\n" "$pane_meta" "$history_size" "$now" > "$state_meta.tmp"
+mv -f "$state_screen.tmp" "$state_screen"
+mv -f "$state_meta.tmp" "$state_meta"
+
+if [ -z "$delta_out" ]; then
+  printf "%s\n" "$no_change_marker"
+else
+  printf "%s\n" "$delta_out"
+fi
@@ -10,7 +10,6 @@ fi
 ROOT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 # shellcheck source=./common.sh
 source "$ROOT_DIR/common.sh"
-tmux_bridge_init_state "$ROOT_DIR"
 session=""
 pane=""
 lines="${TARGET_PANE_LINES:-200}"
@@ -73,6 +72,69 @@ while [ $# -gt 0 ]; do
   esac
 done
 
+print_status() {
+  local state="$1"
+
+  if [ "$exit_code" -eq 1 ]; then
+    if [ "$state" = "BUSY" ]; then
+      exit 1
+    fi
+    exit 0
+  fi
+  if [ -n "$pane" ]; then
+    echo "Resolved target: session=${resolved_session:-unknown} pane=$pane"
+  fi
+  echo "$state"
+}
+
+# A running bridge keeps each worker pane's state in
+# ${MACS_STATUS_DIR}/<socket>/<pane> as "STATE SINCE PID SESSION"; answering
+# from it needs no tmux calls. Builtins only, so this stays fast.
+status_from_bridge() {
+  local target="$1"
+  local server="default"
+  local state="" pid="" name=""
+
+  if [ -z "$target" ]; then
+    return 1
+  fi
+  if [ -n "$socket" ]; then
+    server="${socket//[^A-Za-z0-9._-]/_}"
+  fi
+  local file="$status_dir/$server/$target"
+  if [ ! -f "$file" ] || ! read -r state _ pid name < "$file"; then
+    return 1
+  fi
+  if [ -z "$pid" ] || ! kill -0 "$pid" 2>/dev/null; then
+    return 1
+  fi
+  if [ -n "$session" ] && [ "$session" != "$name" ]; then
+    return 1
+  fi
+  case "$state" in
+    BUSY|IDLE) ;;
+    *) return 1 ;;
+  esac
+  pane="$target"
+  resolved_session="$name"
+  print_status "$state"
+  exit 0
+}
+
+status_dir="${MACS_STATUS_DIR:-${TMUX_TMPDIR:-/tmp}/macs-bridge-${UID}/status}"
+if [ -n "$pane" ]; then
+  status_from_bridge "$pane" || true
+fi
+
+tmux_bridge_init_state "$ROOT_DIR"
+if [ -z "$pane" ]; then
+  pinned_candidate=""
+  if [ -f "$TARGET_PANE_STATE_FILE" ]; then
+    read -r pinned_candidate < "$TARGET_PANE_STATE_FILE" || true
+  fi
+  status_from_bridge "$pinned_candidate" || true
+fi
+
 resolve_status_target() {
   local list_scope=("-a")
   local pane_listing=""
@@ -108,19 +170,7 @@ snapshot="$("$ROOT_DIR/snapshot.sh" --session "$session" --pane "$pane" --lines
 
 recent="$(printf "%s\n" "$snapshot" | tail -n "$busy_lines")"
 if printf "%s\n" "$recent" | grep -qi "esc to interrupt"; then
-  if [ "$exit_code" -eq 1 ]; then
-    exit 1
-  fi
-  if [ -n "$pane" ]; then
-    echo "Resolved target: session=${resolved_session:-unknown} pane=$pane"
-  fi
-  echo "BUSY"
+  print_status "BUSY"
 else
-  if [ "$exit_code" -eq 1 ]; then
-    exit 0
-  fi
-  if [ -n "$pane" ]; then
-    echo "Resolved target: session=${resolved_session:-unknown} pane=$pane"
-  fi
-  echo "IDLE"
+  print_status "IDLE"
 fi
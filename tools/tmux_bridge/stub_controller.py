@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+MACS stub controller - stand-in for the bridge's persistent controller backend
+
+Speaks the JSON-lines protocol of bridge.py's ControllerServer on stdin/stdout
+and answers every request with a canned controller response, so the
+persistent backend can be exercised without an LLM:
+
+    ./bridge.py --controller-backend persistent \\
+        --controller-server-command "python3 tools/tmux_bridge/stub_controller.py --latency 0.5"
+
+--crash-after and --hang-after make it exit or stop answering after that many
+requests, to check restart and health-check handling.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+
+def respond(message):
+    sys.stdout.write(json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+
+def stub_response(request_id, prompt, count):
+    first = next((line.strip() for line in prompt.splitlines() if line.strip() and "<<" not in line), "")
+    return (
+        f"<<CONTROLLER_RESPONSE id={request_id}>>\n"
+        "WORKER INSTRUCTIONS:\n"
+        f"Stub controller reply to: {first[:120]}\n"
+        "NOTES:\n"
+        f"stub controller pid {os.getpid()}, request {count}\n"
+        "<<CONTROLLER_RESPONSE_END>>"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MACS stub controller (JSON lines on stdin/stdout)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency, up to this many seconds")
+    parser.add_argument("--startup-delay", type=float, default=0.0, help="seconds to wait before reading input")
+    parser.add_argument("--crash-after", type=int, default=0, help="exit after this many requests (0 = never)")
+    parser.add_argument("--hang-after", type=int, default=0, help="stop replying after this many requests")
+    args = parser.parse_args()
+
+    time.sleep(args.startup_delay)
+    count = 0
+    hung = False
+    for line in sys.stdin:
+        try:
+            message = json.loads(line)
+        except ValueError:
+            continue
+        kind = message.get("type")
+        if hung:
+            continue
+        if kind == "init":
+            respond({"type": "ready", "id": message.get("id")})
+        elif kind == "ping":
+            respond({"type": "pong", "id": message.get("id")})
+        elif kind == "request":
+            count += 1
+            if args.crash_after and count > args.crash_after:
+                return 1
+            if args.hang_after and count > args.hang_after:
+                hung = True
+                continue
+            delay = args.latency + random.uniform(0, args.jitter)
+            if delay > 0:
+                time.sleep(delay)
+            respond(
+                {
+                    "type": "response",
+                    "id": message.get("id"),
+                    "text": stub_response(message.get("id"), message.get("prompt") or "", count),
+                }
+            )
+        else:
+            respond({"type": "error", "id": message.get("id"), "error": f"unknown message type {kind!r}"})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
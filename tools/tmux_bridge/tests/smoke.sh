@@ -81,12 +81,128 @@ STATUS_OUT="$("$ROOT_DIR/status.sh" --socket "$SOCKET" --session "$SESSION")"
 echo "$STATUS_OUT" | $RG_CMD -q "Resolved target: session=$SESSION pane=$PANE_ID"
 echo "$STATUS_OUT" | $RG_CMD -q "IDLE|BUSY"
 
+# status.sh answers from a live bridge's status file without calling tmux,
+# and falls back to tmux when the bridge that wrote it is gone.
+STATUS_DIR="$TMP_DIR/status"
+STATUS_FILE="$STATUS_DIR/${SOCKET//[^A-Za-z0-9._-]/_}/$PANE_ID"
+TMUX_SHIM_DIR="$TMP_DIR/tmux-shim"
+TMUX_CALLS="$TMP_DIR/tmux-calls"
+REAL_TMUX="$(command -v tmux)"
+mkdir -p "$(dirname "$STATUS_FILE")" "$TMUX_SHIM_DIR"
+cat > "$TMUX_SHIM_DIR/tmux" <<EOF
+#!/usr/bin/env bash
+echo "\$*" >> "$TMUX_CALLS"
+exec "$REAL_TMUX" "\$@"
+EOF
+chmod +x "$TMUX_SHIM_DIR/tmux"
+printf 'BUSY 0 %s %s\n' "$$" "$SESSION" > "$STATUS_FILE"
+STATUS_CACHED="$(PATH="$TMUX_SHIM_DIR:$PATH" MACS_STATUS_DIR="$STATUS_DIR" "$ROOT_DIR/status.sh" --socket "$SOCKET" --pane "$PANE_ID")"
+echo "$STATUS_CACHED" | $RG_CMD -q "Resolved target: session=$SESSION pane=$PANE_ID"
+[ "$(echo "$STATUS_CACHED" | tail -n1)" = "BUSY" ]
+if [ -s "$TMUX_CALLS" ]; then
+  echo "status.sh called tmux despite a live bridge status file." >&2
+  exit 1
+fi
+sleep 0 &
+DEAD_PID=$!
+wait "$DEAD_PID"
+printf 'BUSY 0 %s %s\n' "$DEAD_PID" "$SESSION" > "$STATUS_FILE"
+STATUS_STALE="$(PATH="$TMUX_SHIM_DIR:$PATH" MACS_STATUS_DIR="$STATUS_DIR" "$ROOT_DIR/status.sh" --socket "$SOCKET" --pane "$PANE_ID")"
+[ "$(echo "$STATUS_STALE" | tail -n1)" = "IDLE" ]
+test -s "$TMUX_CALLS"
+
 SEND_META="$("$ROOT_DIR/send.sh" --socket "$SOCKET" --session "$SESSION" "echo tmux-bridge-send" 2>&1 >/dev/null)"
 echo "$SEND_META" | $RG_CMD -q "Resolved target: session=$SESSION pane=$PANE_ID"
 sleep 0.2
 SNAPSHOT_2="$("$ROOT_DIR/snapshot.sh" --socket "$SOCKET" --session "$SESSION" --lines 20)"
 echo "$SNAPSHOT_2" | $RG_CMD -q "tmux-bridge-send"
 
+DELTA_HOME="$TMP_DIR/delta-home"
+DELTA_1="$(CODEX_HOME="$DELTA_HOME" "$ROOT_DIR/snapshot.sh" --socket "$SOCKET" --pane "$PANE_ID" --lines 20 --delta)"
+echo "$DELTA_1" | $RG_CMD -q "tmux-bridge-send"
+DELTA_2="$(CODEX_HOME="$DELTA_HOME" "$ROOT_DIR/snapshot.sh" --socket "$SOCKET" --pane "$PANE_ID" --lines 20 --delta)"
+[ "$DELTA_2" = "[snapshot] no change" ]
+tmux -S "$SOCKET" send-keys -t "$PANE_ID" "echo tmux-bridge-delta" Enter
+sleep 0.2
+DELTA_3="$(CODEX_HOME="$DELTA_HOME" "$ROOT_DIR/snapshot.sh" --socket "$SOCKET" --pane "$PANE_ID" --lines 20 --delta)"
+echo "$DELTA_3" | $RG_CMD -q "tmux-bridge-delta"
+if echo "$DELTA_3" | $RG_CMD -q "tmux-bridge-send"; then
+  echo "Delta snapshot repeated lines from the previous capture." >&2
+  exit 1
+fi
+
+# Sends to one pane are serialized through its lock file, and --urgent makes
+# the bridge's queued deliveries wait until the operator's message is sent.
+if command -v flock >/dev/null 2>&1; then
+  PANE_LOCK="$TMP_DIR/macs-bridge-${UID}/locks/${SOCKET//[^A-Za-z0-9._-]/_}/$PANE_ID.lock"
+  mkdir -p "$(dirname "$PANE_LOCK")"
+  send_locked() {
+    TMUX_TMPDIR="$TMP_DIR" TARGET_PANE_TYPE_DELAY_MS=0 TARGET_PANE_SUBMIT_DELAY_MS=0 \
+      "$ROOT_DIR/send.sh" --socket "$SOCKET" --pane "$PANE_ID" --force "$@" 2>/dev/null
+  }
+  # Lines of pane output matching $1, once at least $2 of them are there (5s max).
+  pane_lines() {
+    local found="" tries=0
+    while [ "$tries" -lt 50 ]; do
+      found="$("$ROOT_DIR/snapshot.sh" --socket "$SOCKET" --pane "$PANE_ID" --lines 60 | grep -E "$1" || true)"
+      if [ -n "$found" ] && [ "$(printf "%s\n" "$found" | wc -l)" -ge "$2" ]; then
+        break
+      fi
+      sleep 0.1
+      tries=$((tries + 1))
+    done
+    printf "%s\n" "$found"
+  }
+
+  flock "$PANE_LOCK" sleep 2 &
+  LOCK_HOLDER=$!
+  sleep 0.2
+  if TARGET_PANE_LOCK_WAIT=1 send_locked "echo tmux-bridge-lock-timeout"; then
+    echo "send.sh did not wait for the pane lock." >&2
+    exit 1
+  fi
+  send_locked --line-mode $'echo lock-a-1\necho lock-a-2\necho lock-a-3' &
+  SEND_A=$!
+  send_locked --line-mode $'echo lock-b-1\necho lock-b-2\necho lock-b-3' &
+  SEND_B=$!
+  wait "$SEND_A"
+  wait "$SEND_B"
+  wait "$LOCK_HOLDER"
+  LOCK_ORDER="$(pane_lines '^lock-[ab]-[0-9]$' 6 | cut -c6 | tr -d '\n')"
+  case "$LOCK_ORDER" in
+    aaabbb|bbbaaa) ;;
+    *)
+      echo "Concurrent send.sh calls interleaved: $LOCK_ORDER" >&2
+      exit 1
+      ;;
+  esac
+
+  flock "$PANE_LOCK" sleep 1 &
+  LOCK_HOLDER=$!
+  sleep 0.2
+  send_locked --urgent "echo tmux-bridge-urgent" &
+  SEND_URGENT=$!
+  sleep 0.2
+  test -f "$PANE_LOCK.urgent"
+  TMUX_TMPDIR="$TMP_DIR" python3 - "$ROOT_DIR" "$SOCKET" "$PANE_ID" <<'EOF'
+import sys
+
+sys.path.insert(0, sys.argv[1])
+import bridge
+
+bridge.configure_tmux(sys.argv[2])
+bridge.pane_delivery(sys.argv[3]).submit("echo tmux-bridge-queued").wait(30)
+EOF
+  wait "$SEND_URGENT"
+  wait "$LOCK_HOLDER"
+  test ! -e "$PANE_LOCK.urgent"
+  URGENT_ORDER="$(pane_lines '^tmux-bridge-(urgent|queued)$' 2 | tr '\n' ' ')"
+  if [ "$URGENT_ORDER" != "tmux-bridge-urgent tmux-bridge-queued " ]; then
+    echo "Queued bridge delivery did not wait for the --urgent send: $URGENT_ORDER" >&2
+    exit 1
+  fi
+fi
+
 printf '%%9999\n' > "$TARGET_FILE"
 "$ROOT_DIR/send.sh" --socket "$SOCKET" --session "$SESSION" "echo tmux-bridge-stale-fallback" >/dev/null
 sleep 0.2
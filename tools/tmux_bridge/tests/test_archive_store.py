@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""Unit tests for archive_store.py.
+
+Run with: python3 -m unittest discover -s tools/tmux_bridge/tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import archive_store  # noqa: E402
+
+
+class PackedArchiveTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+
+    def test_records_are_read_back_from_the_packs(self):
+        archive = archive_store.PackedArchive(self.directory, pack_bytes=512)
+        for index in range(20):
+            archive.append("request", f"req{index}", f"question {index} " * 20, f"hash{index % 5}")
+            archive.append("response", f"req{index}", f"answer {index}")
+        self.assertGreater(len(archive.packs()), 1)
+        self.assertEqual(archive.get("req7"), "question 7 " * 20)
+        self.assertEqual(archive.get("req7", "response"), "answer 7")
+        self.assertIsNone(archive.get("missing"))
+        self.assertEqual([record.req_id for record in archive.find_hash("hash2")], ["req2", "req7", "req12", "req17"])
+        requests = list(archive.records("request"))
+        self.assertEqual([record.req_id for record in requests], [f"req{index}" for index in range(20)])
+        self.assertEqual(len(list(archive.records())), 40)
+
+        reopened = archive_store.PackedArchive(self.directory)
+        self.assertEqual(reopened.get("req19", "response"), "answer 19")
+        self.assertEqual(len(list(reopened.iter_request_hashes())), 20)
+
+    def test_torn_tail_is_skipped(self):
+        archive = archive_store.PackedArchive(self.directory)
+        archive.append("request", "whole", "kept")
+        with open(os.path.join(self.directory, archive.packs()[-1]), "ab") as f:
+            f.write(archive_store.encode_record(archive_store.KIND_REQUEST, "torn", "lost")[:-2])
+        reopened = archive_store.PackedArchive(self.directory)
+        self.assertEqual([record.req_id for record in reopened.records()], ["whole"])
+        reopened.append("request", "after", "text")
+        self.assertEqual([record.req_id for record in reopened.records()], ["whole", "after"])
+
+
+if __name__ == "__main__":
+    unittest.main()
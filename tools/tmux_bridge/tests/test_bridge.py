@@ -0,0 +1,734 @@
+#!/usr/bin/env python3
+"""Unit tests for bridge.py helpers that need no tmux server.
+
+Run with: python3 -m unittest discover -s tools/tmux_bridge/tests
+"""
+import contextlib
+import functools
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import unittest
+from concurrent.futures import Future
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import bridge  # noqa: E402
+import log_sink  # noqa: E402
+
+
+@unittest.skipIf(bridge.load_libc() is None, "inotify is not available")
+class TailerTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "worker.log")
+        open(self.path, "w").close()
+
+    def test_inotify_wakes_on_append(self):
+        tailer = bridge.open_tailer(self.path)
+        self.addCleanup(tailer.close)
+        self.assertEqual(tailer.name, "inotify")
+
+        def append():
+            time.sleep(0.1)
+            with open(self.path, "a") as f:
+                f.write("line\n")
+
+        writer = threading.Thread(target=append)
+        writer.start()
+        started = time.monotonic()
+        tailer.wait(5.0)
+        writer.join()
+        self.assertLess(time.monotonic() - started, 2.0)
+
+    def test_heartbeat_bounds_an_idle_wait(self):
+        tailer = bridge.InotifyTailer(self.path, heartbeat=0.1)
+        self.addCleanup(tailer.close)
+        started = time.monotonic()
+        tailer.wait(5.0)
+        self.assertLess(time.monotonic() - started, 2.0)
+
+    def test_missing_file_falls_back_to_polling(self):
+        missing = self.path + ".missing"
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            tailer = bridge.open_tailer(missing, poll_interval=0.01)
+        self.assertEqual(tailer.name, "poll")
+        self.assertIn("falling back to polling", out.getvalue())
+        with self.assertRaises(OSError):
+            bridge.open_tailer(missing, backend="inotify")
+
+
+class LineReaderTest(unittest.TestCase):
+    def test_long_line_within_one_chunk_is_cut(self):
+        reader = bridge.LineReader(100)
+        lines = reader.feed(b"x" * 5000 + b"\nshort\n")
+        self.assertEqual(lines, ["x" * 100, "short"])
+        self.assertEqual(reader.truncated_lines, 1)
+
+    def test_long_line_split_across_chunks_is_cut(self):
+        reader = bridge.LineReader(100)
+        lines = []
+        for _ in range(50):
+            lines += reader.feed(b"y" * 100)
+        lines += reader.feed(b"tail\nnext\n")
+        self.assertEqual(lines, ["y" * 100, "next"])
+        self.assertEqual(reader.truncated_lines, 1)
+
+    def test_line_at_the_limit_is_kept(self):
+        reader = bridge.LineReader(100)
+        self.assertEqual(reader.feed(b"z" * 100 + b"\n"), ["z" * 100])
+        self.assertEqual(reader.truncated_lines, 0)
+
+
+class TerminalFilterTest(unittest.TestCase):
+    def test_escape_sequences_are_stripped(self):
+        data = b"\x1b]0;title\x07\x1b[1;31mred\x1b[0m text\n"
+        self.assertEqual(log_sink.TerminalFilter().feed(data), b"red text\n")
+
+    def test_escape_split_across_chunks_is_held_back(self):
+        term = log_sink.TerminalFilter()
+        self.assertEqual(term.feed(b"red \x1b[3"), b"")
+        self.assertEqual(term.feed(b"1mtext\n"), b"red text\n")
+
+    def test_redraws_keep_the_last_frame(self):
+        term = log_sink.TerminalFilter()
+        self.assertEqual(term.feed(b"10%\r50%\r100%\n"), b"100%\n")
+        self.assertEqual(term.feed(b"working...\r\x1b[Kdone\n"), b"done\n")
+        self.assertEqual(term.feed(b"abc\x08\x08XY\n"), b"aXY\n")
+
+    def test_cursor_moves_break_lines_and_blank_runs_fold(self):
+        term = log_sink.TerminalFilter()
+        self.assertEqual(term.feed(b"top\x1b[5;1Hbottom\n"), b"top\nbottom\n")
+        self.assertEqual(term.feed(b"x\n\n\n\ny\n"), b"x\n\ny\n")
+
+    def test_long_partial_line_is_written_out(self):
+        term = log_sink.TerminalFilter(max_pending=8)
+        self.assertEqual(term.feed(b"0123456789"), b"0123456789\n")
+        self.assertEqual(term.feed(b"tail"), b"")
+        self.assertEqual(term.flush(), b"tail")
+
+
+class CompactContextTest(unittest.TestCase):
+    def cost(self, lines):
+        return sum(len(line.encode("utf-8")) + 1 for line in lines)
+
+    def test_omitted_note_fits_the_budget(self):
+        # The first word differs from line to line, so no runs are collapsed.
+        lines = [f"{chr(97 + index % 26) * (1 + index % 7)} {index}" for index in range(300)]
+        for budget in (10, 40, 100, 257, 1000, 2000):
+            kept = bridge.compact_context_lines(lines, budget)
+            self.assertLessEqual(self.cost(kept), budget, budget)
+            if kept:
+                self.assertTrue(kept[0].endswith("earlier lines omitted ...]"), budget)
+
+    def test_context_within_budget_is_kept_whole(self):
+        lines = ["alpha", "beta", "gamma"]
+        self.assertEqual(bridge.compact_context_lines(lines, self.cost(lines)), lines)
+
+
+class SeenIndexTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.archive = os.path.join(tmp.name, "archive")
+        os.makedirs(self.archive)
+        patcher = mock.patch.object(bridge, "ARCHIVE_DIR", self.archive)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.path = os.path.join(tmp.name, "seen.sqlite3")
+
+    def archive_request(self, req_id, text, age=0):
+        path = os.path.join(self.archive, f"{req_id}.request.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        if age:
+            stamp = time.time() - age
+            os.utime(path, (stamp, stamp))
+        return bridge.stable_id(text)
+
+    def open_index(self, **kwargs):
+        index = bridge.SeenIndex(self.path, **kwargs)
+        self.addCleanup(index.close)
+        return index
+
+    def test_backfill_runs_once(self):
+        first = self.archive_request("a", "first request")
+        index = self.open_index()
+        self.assertIn(first, index)
+        index.close()
+        later = self.archive_request("b", "written after the backfill")
+        index = self.open_index()
+        self.assertIn(first, index)
+        self.assertNotIn(later, index)
+
+    def test_ttl_hides_and_evicts_old_hashes(self):
+        old = self.archive_request("old", "old request", age=3600)
+        new = self.archive_request("new", "new request")
+        index = self.open_index(ttl=60)
+        self.assertNotIn(old, index)
+        self.assertIn(new, index)
+        self.assertEqual(len(index), 1)
+
+    def test_max_entries_keeps_the_newest(self):
+        index = self.open_index(max_entries=3)
+        hashes = [f"h{n}" for n in range(5)]
+        for block_hash in hashes:
+            index.add(block_hash)
+            time.sleep(0.002)
+        index.evict()
+        self.assertEqual(len(index), 3)
+        self.assertEqual([h in index for h in hashes], [False, False, True, True, True])
+
+
+class HeuristicDebounceTest(unittest.TestCase):
+    def parser(self, quiet, lines=20):
+        blocks = []
+        parser = bridge.BlockParser(
+            blocks.append, heuristic_enabled=True, heuristic_lines=lines, heuristic_quiet=quiet
+        )
+        return parser, blocks
+
+    def later(self):
+        return time.monotonic() + 60
+
+    def test_triggers_are_sent_at_once_without_a_quiet_period(self):
+        parser, blocks = self.parser(0)
+        parser.feed_line("Done. Tests pass.")
+        parser.feed_line("Anything else?")
+        self.assertEqual(len(blocks), 2)
+        self.assertIsNone(parser.tick_delay())
+
+    def test_burst_of_triggers_becomes_one_block(self):
+        parser, blocks = self.parser(1.0)
+        for line in ("Done.", "Tests pass.", "Anything else?"):
+            parser.feed_line(line)
+        parser.tick()
+        self.assertEqual(blocks, [])
+        self.assertLessEqual(parser.tick_delay(), 1.0)
+        parser.tick(self.later())
+        self.assertEqual(len(blocks), 1)
+        self.assertIn("Anything else?", blocks[0])
+        self.assertIsNone(parser.tick_delay())
+
+    def test_busy_line_or_explicit_request_drops_the_held_trigger(self):
+        parser, blocks = self.parser(1.0)
+        parser.feed_line("Anything else?")
+        parser.feed_line("Reading files (esc to interrupt)")
+        parser.tick(self.later())
+        self.assertEqual(blocks, [])
+        parser.feed_line("Should I continue?")
+        parser.feed_line("<<CONTROLLER_REQUEST>> go on? <<CONTROLLER_REQUEST_END>>")
+        parser.tick(self.later())
+        self.assertEqual(len(blocks), 1)
+        self.assertIn("CONTROLLER_REQUEST", blocks[0])
+
+    def test_trigger_is_sent_before_it_scrolls_out(self):
+        parser, blocks = self.parser(1.0, lines=5)
+        parser.feed_line("Anything else?")
+        for index in range(3):
+            parser.feed_line(f"output {index}")
+        self.assertEqual(blocks, [])
+        parser.feed_line("output 3")
+        self.assertEqual(len(blocks), 1)
+        self.assertIn("Anything else?", blocks[0])
+
+
+class RequestFingerprintTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.prompt = os.path.join(tmp.name, "prompt.txt")
+        with open(self.prompt, "w", encoding="utf-8") as f:
+            f.write("Answer briefly.")
+        self.args = types.SimpleNamespace(
+            controller_backend="codex",
+            controller_model="m1",
+            controller_system_prompt=self.prompt,
+        )
+
+    def test_terminal_noise_is_ignored(self):
+        plain = "<<CONTROLLER_REQUEST>>\nReady to proceed?\n<<CONTROLLER_REQUEST_END>>"
+        noisy = (
+            "<<CONTROLLER_REQUEST>> id=abc123\n"
+            "\x1b[1m\u280b  READY   to proceed?\x1b[0m 12s 2024-05-01 10:11:12\n"
+            "\n<<CONTROLLER_REQUEST_END>>"
+        )
+        self.assertEqual(
+            bridge.request_fingerprint(plain, self.args),
+            bridge.request_fingerprint(noisy, self.args),
+        )
+
+    def test_scope_includes_backend_model_and_prompt(self):
+        block = "Ready to proceed?"
+        first = bridge.request_fingerprint(block, self.args)
+        self.args.controller_model = "m2"
+        self.assertNotEqual(bridge.request_fingerprint(block, self.args), first)
+        self.args.controller_model = "m1"
+        with open(self.prompt, "w", encoding="utf-8") as f:
+            f.write("Answer in detail, citing files.")
+        self.assertNotEqual(bridge.request_fingerprint(block, self.args), first)
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "responses.sqlite3")
+
+    def open_cache(self, path=None, **kwargs):
+        cache = bridge.ResponseCache(path, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_least_recently_used_is_evicted(self):
+        for path in (None, self.path):
+            cache = self.open_cache(path, max_entries=2)
+            cache.put("a", "A")
+            time.sleep(0.002)
+            cache.put("b", "B")
+            time.sleep(0.002)
+            self.assertEqual(cache.get("a"), "A")
+            time.sleep(0.002)
+            cache.put("c", "C")
+            self.assertIsNone(cache.get("b"), path)
+            self.assertEqual(cache.get("a"), "A")
+            self.assertEqual(cache.get("c"), "C")
+            cache.close()
+
+    def test_expired_entries_miss(self):
+        cache = self.open_cache(self.path, ttl=60)
+        cache.put("key", "answer")
+        later = time.time() + 120
+        with mock.patch.object(bridge.time, "time", return_value=later):
+            self.assertIsNone(cache.get("key"))
+        self.assertEqual(cache.stats(), "hits=0 misses=1")
+
+    def test_entries_survive_a_reopen(self):
+        cache = self.open_cache(self.path)
+        cache.put("key", "answer")
+        cache.close()
+        cache = self.open_cache(self.path)
+        self.assertEqual(cache.get("key"), "answer")
+        self.assertEqual(cache.stats(), "hits=1 misses=0")
+
+
+class MetricsTest(unittest.TestCase):
+    def test_render_prometheus_text(self):
+        metrics = bridge.Metrics(buckets=(0.1, 1))
+        metrics.inc("macs_requests_total", outcome="sent")
+        metrics.inc("macs_requests_total", 2, outcome="sent")
+        metrics.inc("macs_requests_total", outcome='say "hi"')
+        metrics.observe("macs_request_seconds", 0.05)
+        metrics.observe("macs_request_seconds", 0.5)
+        metrics.observe("macs_request_seconds", 5)
+        metrics.gauge("macs_queue_depth", lambda: 4)
+        metrics.gauge("macs_peak_rss_bytes", lambda: 1 / 0)
+        lines = metrics.render().splitlines()
+        self.assertIn("# TYPE macs_requests_total counter", lines)
+        self.assertIn('macs_requests_total{outcome="sent"} 3', lines)
+        self.assertIn('macs_requests_total{outcome="say \\"hi\\""} 1', lines)
+        self.assertIn("# TYPE macs_request_seconds histogram", lines)
+        self.assertIn('macs_request_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('macs_request_seconds_bucket{le="1"} 2', lines)
+        self.assertIn('macs_request_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn("macs_request_seconds_count 3", lines)
+        self.assertIn("macs_queue_depth 4", lines)
+        self.assertFalse([line for line in lines if line.startswith("macs_peak_rss_bytes")])
+
+
+class RequestTraceTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "traces", "requests.jsonl")
+        trace_log = bridge.TraceLog(self.path)
+        self.addCleanup(trace_log.close)
+        self.metrics = bridge.Metrics()
+        for name, value in (("TRACE_LOG", trace_log), ("METRICS", self.metrics)):
+            patcher = mock.patch.object(bridge, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_finish_records_spans_once(self):
+        trace = bridge.RequestTrace("req-1", "%3")
+        trace.mark("context_built")
+        trace.mark("response_received")
+        trace.finish("cached")
+        trace.mark("delivered")
+        trace.finish("timeout")
+        with open(self.path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 1)
+        record = records[0]
+        self.assertEqual(record["req_id"], "req-1")
+        self.assertEqual(record["pane"], "%3")
+        self.assertEqual(record["outcome"], "cached")
+        names = [span["name"] for span in record["spans"]]
+        self.assertEqual(names, ["detected", "context_built", "response_received"])
+        self.assertGreaterEqual(record["total_ms"], record["spans"][-1]["at_ms"])
+        text = self.metrics.render()
+        self.assertIn('macs_requests_total{outcome="cached"} 1', text)
+        self.assertIn('macs_request_phase_seconds_count{phase="context_built"} 1', text)
+        self.assertIn("macs_request_seconds_count 1", text)
+
+
+class PaneStatusTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+        self.screen_busy = True
+        self.captures = 0
+
+    def confirm_busy(self):
+        self.captures += 1
+        return self.screen_busy
+
+    def state_on_disk(self):
+        with open(os.path.join(self.directory, "%1"), encoding="utf-8") as f:
+            return f.read().split()[0]
+
+    def test_escaped_redraws_do_not_turn_the_pane_idle(self):
+        status = bridge.PaneStatus("%1", self.directory, idle_after=3.0, confirm_busy=self.confirm_busy)
+        status.feed_line("\u2819 Working (1s \u2022 esc to interrupt)")
+        self.assertEqual(self.state_on_disk(), "BUSY")
+        start = status.busy_until - 3.0
+        # A diff-rendering TUI repaints only the changed cells, and a raw log
+        # keeps cursor moves, so the status line never arrives whole again.
+        status.feed_line("\x1b[1;12H2")
+        status.feed_line("esc\x1b[1Cto\x1b[1Cinterrupt")
+        status.feed_line("\x1b[2K\u281a Working (3s \u2022 esc to inter")
+        status.tick(start + 3.5)
+        self.assertEqual(status.state, "BUSY")
+        self.assertEqual(self.state_on_disk(), "BUSY")
+        self.assertEqual(self.captures, 1)
+        status.tick(start + 4.0)
+        self.assertEqual(self.captures, 1)
+        self.screen_busy = False
+        status.tick(start + 7.0)
+        self.assertEqual(self.state_on_disk(), "IDLE")
+        self.assertEqual(self.captures, 2)
+
+    def test_whole_status_line_keeps_the_pane_busy_without_captures(self):
+        status = bridge.PaneStatus("%1", self.directory, idle_after=3.0, confirm_busy=self.confirm_busy)
+        for _ in range(5):
+            status.feed_line("Working (esc to interrupt)")
+            status.tick()
+        self.assertEqual(status.state, "BUSY")
+        self.assertEqual(self.captures, 0)
+
+
+class ControllerServerTest(unittest.TestCase):
+    def test_call_after_exit_does_not_wait(self):
+        server = bridge.ControllerServer([sys.executable, "-c", "pass"])
+        self.addCleanup(server.stop)
+        self.assertTrue(server._exited.wait(5))
+        start = time.monotonic()
+        self.assertIsNone(server.call({"type": "ping"}))
+        self.assertLess(time.monotonic() - start, 1.0)
+
+
+class ControllerServerPoolTest(unittest.TestCase):
+    STUB = os.path.join(os.path.dirname(os.path.abspath(bridge.__file__)), "stub_controller.py")
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.prompt = os.path.join(tmp.name, "prompt.txt")
+        with open(self.prompt, "w", encoding="utf-8") as f:
+            f.write("Answer briefly.")
+        self.args = types.SimpleNamespace(controller_model=None, controller_system_prompt=self.prompt)
+
+    def open_pool(self, *stub_args):
+        pool = bridge.ControllerServerPool(
+            [sys.executable, self.STUB, *stub_args], 1, self.args, ping_interval=3600
+        )
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_request_is_answered(self):
+        pool = self.open_pool()
+        text = pool.request("<<CONTROLLER_REQUEST>>\nready?\n<<CONTROLLER_REQUEST_END>>", "r1", 10)
+        self.assertIn("<<CONTROLLER_RESPONSE id=r1>>", text)
+        self.assertIn("Stub controller reply to: ready?", text)
+
+    def test_crashed_server_is_replaced_and_the_request_retried(self):
+        pool = self.open_pool("--crash-after", "1")
+        # The stub crashes within QUICK_EXIT; skip the backoff that would follow.
+        pool.QUICK_EXIT = 0
+        first_pid = pool._servers[0].pid
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            self.assertIn("request 1", pool.request("one", "r1", 10))
+            text = pool.request("two", "r2", 10)
+        self.assertIn("Stub controller reply to: two", text)
+        self.assertNotEqual(pool._servers[0].pid, first_pid)
+        self.assertEqual(pool.restarts, 1)
+        self.assertIn("exited during r2", out.getvalue())
+
+    def test_prompt_change_reinitialises_the_server(self):
+        pool = self.open_pool()
+        server = pool._servers[0]
+        self.assertEqual(server.system_prompt, "Answer briefly.")
+        with open(self.prompt, "w", encoding="utf-8") as f:
+            f.write("Answer in detail.")
+        self.assertIn("r1", pool.request("one", "r1", 10))
+        self.assertIs(pool._servers[0], server)
+        self.assertEqual(server.system_prompt, "Answer in detail.")
+
+
+class ControllerResponseRouterTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "controller.log")
+        open(self.path, "w").close()
+        stream = open(self.path, "rb")
+        self.router = bridge.ControllerResponseRouter(stream, bridge.PollTailer(0.01))
+        self.router.QUIET_SECONDS = 0.1
+        self.addCleanup(self.router.close)
+
+    def write(self, *lines):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+
+    def response(self, req_id, text):
+        self.write(f"<<CONTROLLER_RESPONSE id={req_id}>>", text, "<<CONTROLLER_RESPONSE_END>>")
+
+    def test_out_of_order_responses_reach_their_requests(self):
+        waiters = {req_id: self.router.register(req_id) for req_id in ("r1", "r2", "r3")}
+        self.response("r2", "second")
+        self.response("r3", "third")
+        self.response("r1", "first")
+        answers = {req_id: self.router.wait(req_id, waiter, 5) for req_id, waiter in waiters.items()}
+        self.assertEqual(answers, {"r1": "first", "r2": "second", "r3": "third"})
+        self.assertEqual(self.router.pending(), 0)
+
+    def test_unlabelled_reply_goes_to_the_oldest_request(self):
+        first = self.router.register("r1")
+        time.sleep(0.01)
+        second = self.router.register("r2")
+        self.write("WORKER INSTRUCTIONS:", "carry on", "NOTES:", "none")
+        self.assertIn("carry on", self.router.wait("r1", first, 5))
+        self.assertFalse(second.done.is_set())
+
+    def test_redrawn_response_is_dropped_quietly(self):
+        waiter = self.router.register("r1")
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            self.response("r1", "answer")
+            self.assertEqual(self.router.wait("r1", waiter, 5), "answer")
+            self.response("r1", "answer")
+            self.response("r9", "nobody asked")
+            later = self.router.register("r2")
+            self.response("r2", "done")
+            self.assertEqual(self.router.wait("r2", later, 5), "done")
+        self.assertNotIn("id=r1", out.getvalue())
+        self.assertIn("dropped a controller response id=r9", out.getvalue())
+
+
+class PaneRegistryTest(unittest.TestCase):
+    def registry(self, load, ttl=60.0):
+        registry = bridge.PaneRegistry(ttl=ttl)
+        registry._load = load
+        return registry
+
+    def test_panes_are_cached_until_ttl_or_invalidate(self):
+        loads = []
+
+        def load():
+            loads.append(1)
+            return [{"pane_id": f"%{len(loads)}", "session_name": "s", "session_id": "$0"}]
+
+        registry = self.registry(load)
+        self.assertEqual(registry.panes()[0]["pane_id"], "%1")
+        self.assertEqual(registry.panes("s")[0]["pane_id"], "%1")
+        self.assertEqual(len(loads), 1)
+        registry.invalidate()
+        self.assertEqual(registry.panes()[0]["pane_id"], "%2")
+        registry.ttl = 0.0
+        time.sleep(0.01)
+        self.assertEqual(registry.panes()[0]["pane_id"], "%3")
+
+    def test_invalidate_does_not_wait_for_a_load(self):
+        loading = threading.Event()
+        release = threading.Event()
+        loads = []
+
+        def load():
+            loads.append(1)
+            if len(loads) == 1:
+                loading.set()
+                release.wait(5)
+            return [{"pane_id": f"%{len(loads)}"}]
+
+        registry = self.registry(load)
+        results = []
+        reader = threading.Thread(target=lambda: results.append(registry.panes()))
+        reader.start()
+        self.assertTrue(loading.wait(5))
+        # The control-mode reader invalidates while list-panes is in flight.
+        start = time.monotonic()
+        registry.invalidate()
+        self.assertLess(time.monotonic() - start, 0.5)
+        release.set()
+        reader.join(5)
+        self.assertEqual(results[0][0]["pane_id"], "%1")
+        # The overtaken load is not cached.
+        self.assertEqual(registry.panes()[0]["pane_id"], "%2")
+
+    def test_timed_out_load_is_not_cached(self):
+        loads = []
+
+        def load():
+            loads.append(1)
+            if len(loads) == 2:
+                raise subprocess.TimeoutExpired(["tmux", "list-panes"], 30)
+            return [{"pane_id": f"%{len(loads)}"}]
+
+        registry = self.registry(load)
+        registry.panes()
+        registry.invalidate()
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            self.assertEqual(registry.panes()[0]["pane_id"], "%1")
+        self.assertIn("could not list tmux panes", out.getvalue())
+        self.assertEqual(registry.panes()[0]["pane_id"], "%3")
+
+
+class BlockBufferTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.spill_dir = tmp.name
+
+    def test_head_and_tail_stay_within_the_line_cap(self):
+        buffer = bridge.BlockBuffer(bridge.BlockLimits(max_lines=100, spill_dir=self.spill_dir), "t")
+        self.addCleanup(buffer.close)
+        for index in range(1000):
+            buffer.append(f"line {index}")
+        self.assertLessEqual(len(buffer.head) + len(buffer.tail), 100)
+        self.assertEqual(len(buffer.tail), 20)
+        lines = buffer.text().splitlines()
+        self.assertEqual(lines[0], "line 0")
+        self.assertEqual(lines[-1], "line 999")
+        self.assertIn("lines omitted from a 1000-line", lines[80])
+        with open(buffer.spill_path, encoding="utf-8") as f:
+            self.assertEqual(f.read().splitlines(), [f"line {index}" for index in range(1000)])
+
+    def test_head_and_tail_stay_within_the_byte_cap(self):
+        buffer = bridge.BlockBuffer(bridge.BlockLimits(max_bytes=4096), "t")
+        for index in range(1000):
+            buffer.append(f"{index:04d}" + "x" * 95)
+            self.assertLessEqual(buffer._held, 4096)
+        self.assertTrue(buffer.tail)
+        self.assertIsNone(buffer.spill_path)
+        self.assertTrue(buffer.text().endswith("0999" + "x" * 95))
+
+    def test_repeated_block_spills_to_the_same_file(self):
+        limits = bridge.BlockLimits(max_lines=10, spill_dir=self.spill_dir)
+        texts = []
+        for _ in range(2):
+            buffer = bridge.BlockBuffer(limits, "t")
+            for index in range(50):
+                buffer.append(f"line {index}")
+            texts.append(buffer.text())
+            buffer.close()
+        self.assertEqual(texts[0], texts[1])
+        self.assertEqual([name for name in os.listdir(self.spill_dir) if name.endswith(".txt")], [
+            os.path.basename(buffer.spill_path)
+        ])
+
+    def test_block_without_end_marker_is_abandoned(self):
+        blocks = []
+        parser = bridge.BlockParser(blocks.append, limits=bridge.BlockLimits(timeout=5.0))
+        parser.feed_line("<<CONTROLLER_REQUEST>>")
+        parser.feed_line("still typing")
+        self.assertAlmostEqual(parser.tick_delay(), 5.0, delta=0.5)
+        with contextlib.redirect_stdout(io.StringIO()) as out:
+            parser.tick(parser.block.started_at + 5.0)
+        self.assertIn("abandoned a request block", out.getvalue())
+        self.assertFalse(parser.in_block)
+        self.assertEqual(blocks, [])
+        parser.feed_line("<<CONTROLLER_REQUEST>>")
+        parser.feed_line("next question")
+        parser.feed_line("<<CONTROLLER_REQUEST_END>>")
+        self.assertEqual(blocks, ["<<CONTROLLER_REQUEST>>\nnext question\n<<CONTROLLER_REQUEST_END>>"])
+
+
+class OutboxWatcherTest(unittest.TestCase):
+    def test_cancelled_request_is_forgotten(self):
+        with tempfile.TemporaryDirectory() as outbox:
+            watcher = bridge.OutboxWatcher(outbox, tail_backend="poll", poll_interval=0.02)
+            late = watcher.expect("late")
+            answered = watcher.expect("answered")
+            self.assertTrue(late.cancel())
+            self.assertEqual(watcher.pending(), 1)
+            for req_id in ("late", "answered"):
+                with open(os.path.join(outbox, f"{req_id}{bridge.RESPONSE_SUFFIX}"), "w") as f:
+                    f.write(f"reply to {req_id}")
+            self.assertEqual(answered.result(5), "reply to answered")
+            self.assertEqual(watcher.pending(), 0)
+
+
+class RequestPipelineTest(unittest.TestCase):
+    def test_deferred_requests_run_in_order(self):
+        pipeline = bridge.RequestPipeline(workers=2, max_pending=2, max_pending_per_key=1)
+        self.addCleanup(pipeline.close)
+        delivered = []
+        done = threading.Event()
+
+        def start(index):
+            def resolve():
+                time.sleep(0.01)
+                return index
+
+            def deliver(result):
+                delivered.append(result)
+                if len(delivered) == 10:
+                    done.set()
+
+            pipeline.submit("%1", resolve, deliver)
+
+        for index in range(10):
+            if pipeline.has_capacity("%1"):
+                start(index)
+            else:
+                pipeline.defer("%1", functools.partial(start, index))
+        self.assertTrue(done.wait(5))
+        self.assertEqual(delivered, list(range(10)))
+        # The last slot is released just after its delivery returns.
+        deadline = time.monotonic() + 1
+        while pipeline.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(pipeline.pending(), 0)
+
+    def test_unanswered_future_times_out_and_frees_its_slot(self):
+        pipeline = bridge.RequestPipeline(workers=1, max_pending=1, max_pending_per_key=1)
+        self.addCleanup(pipeline.close)
+        delivered = []
+        timed_out = threading.Event()
+        pipeline.submit(
+            "%1",
+            None,
+            delivered.append,
+            timeout=0.2,
+            on_timeout=timed_out.set,
+            future=Future(),
+        )
+        self.assertFalse(pipeline.has_capacity("%1"))
+        done = threading.Event()
+        pipeline.defer("%1", lambda: pipeline.submit("%1", lambda: "next", lambda result: (
+            delivered.append(result), done.set())))
+        self.assertTrue(timed_out.wait(5))
+        self.assertTrue(done.wait(5))
+        self.assertEqual(delivered, ["next"])
+
+
+if __name__ == "__main__":
+    unittest.main()